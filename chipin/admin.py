@@ -1,6 +1,148 @@
-from django.contrib import admin
-from .models import Group
+from django.contrib import admin, messages
+from django.utils import timezone
+from users import audit
+from users.paginators import EstimatedCountPaginator
+from .affordability import AffordabilityMatrix
+from .ical import invalidate_groups
+from .models import Group, Event, Invite, GroupJoinRequest, Comment, Settlement, InboxItem, UnreadCounter
+from .settlement import settle_event, settle_events_netted, SettlementError
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    # no full COUNT(*) per page and an estimated total on big unfiltered tables
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
 
 @admin.register(Group)
-class GroupAdmin(admin.ModelAdmin):
-    list_display = ("name", "admin")
\ No newline at end of file
+class GroupAdmin(ScalableAdmin):
+    list_display = ("name", "admin")
+    list_select_related = ("admin",)
+    search_fields = ("name",)
+    autocomplete_fields = ("admin", "members", "invited_users")
+
+
+@admin.register(Event)
+class EventAdmin(ScalableAdmin):
+    list_display = ("name", "group", "date", "total_spend", "status")
+    list_filter = ("status",)
+    list_select_related = ("group",)
+    search_fields = ("name", "group__name")
+    autocomplete_fields = ("group", "members")
+    actions = ("recalculate_status", "archive_events", "settle_events", "settle_events_netted")
+
+    @admin.action(description="Recalculate status of selected events")
+    def recalculate_status(self, request, queryset):
+        # one affordability matrix per group covers all of its selected events
+        events = list(queryset.exclude(status=Event.Status.ARCHIVED).select_related("group"))
+        by_group = {}
+        for event in events:
+            by_group.setdefault(event.group, []).append(event)
+        changed = sum(
+            AffordabilityMatrix.for_group(group, events=group_events).refresh_statuses()
+            for group, group_events in by_group.items()
+        )
+        self.message_user(request, f"Recalculated {len(events)} event(s); {changed} changed status.")
+
+    @admin.action(description="Archive selected events")
+    def archive_events(self, request, queryset):
+        open_events = queryset.exclude(status=Event.Status.ARCHIVED)
+        group_ids = set(open_events.values_list("group_id", flat=True))
+        count = open_events.update(status=Event.Status.ARCHIVED, archived_at=timezone.now())
+        # update() sends no post_save for the calendar feeds to see
+        invalidate_groups(group_ids)
+        self.message_user(request, f"Archived {count} event(s).")
+
+    @admin.action(description="Transfer funds for selected events")
+    def settle_events(self, request, queryset):
+        settled, failed = 0, []
+        for event in queryset.exclude(status=Event.Status.ARCHIVED).select_related("group__admin"):
+            try:
+                share, payers, excluded = settle_event(event)
+                settled += 1
+                audit.record(audit.Action.TRANSFER, user=request.user, request=request, target=f"event:{event.id}",
+                             total=str(event.total_spend), share=str(share),
+                             payers=[u.id for u in payers], excluded=[u.id for u in excluded])
+            except SettlementError as e:
+                failed.append(f"{event.name}: {e}")
+        self.message_user(request, f"Settled {settled} event(s).")
+        for failure in failed:
+            self.message_user(request, failure, level=messages.WARNING)
+
+    @admin.action(description="Transfer funds for selected events, netted per group")
+    def settle_events_netted(self, request, queryset):
+        by_group = {}
+        for event in queryset.filter(status=Event.Status.ACTIVE).select_related("group").order_by("date", "id"):
+            by_group.setdefault(event.group, []).append(event)
+        settled, transfers, failed = 0, 0, []
+        for group, events in by_group.items():
+            try:
+                settlement, group_transfers, skipped = settle_events_netted(group, events)
+            except SettlementError as e:
+                failed.append(f"{group.name}: {e}")
+                continue
+            settled += len(events) - len(skipped)
+            transfers += len(group_transfers)
+            if settlement is not None:
+                audit.record(audit.Action.SETTLEMENT, user=request.user, request=request,
+                             target=f"settlement:{settlement.id}", group=group.id,
+                             transfers=[[debtor, creditor, str(amount)] for debtor, creditor, amount in group_transfers])
+            failed += [f"{event.name}: {reason}" for event, reason in skipped]
+        self.message_user(request, f"Settled {settled} event(s) with {transfers} transfer(s).")
+        for failure in failed:
+            self.message_user(request, failure, level=messages.WARNING)
+
+
+@admin.register(Invite)
+class InviteAdmin(ScalableAdmin):
+    list_display = ("invited_user", "group", "invited_by", "accepted", "expires_at")
+    list_filter = ("accepted",)
+    list_select_related = ("invited_user", "group", "invited_by")
+    search_fields = ("invited_user__username", "group__name")
+    autocomplete_fields = ("group", "invited_by", "invited_user")
+
+
+@admin.register(GroupJoinRequest)
+class GroupJoinRequestAdmin(ScalableAdmin):
+    list_display = ("user", "group", "created_at")
+    list_select_related = ("user", "group")
+    search_fields = ("user__username", "group__name")
+    autocomplete_fields = ("user", "group")
+
+
+@admin.register(Settlement)
+class SettlementAdmin(ScalableAdmin):
+    list_display = ("id", "group", "created_at")
+    list_select_related = ("group",)
+    search_fields = ("group__name",)
+    autocomplete_fields = ("group", "events")
+    raw_id_fields = ("transactions",)
+
+
+@admin.register(Comment)
+class CommentAdmin(ScalableAdmin):
+    list_display = ("user", "group", "short_content", "created_at")
+    list_select_related = ("user", "group")
+    search_fields = ("content", "user__username", "group__name")
+    autocomplete_fields = ("user", "group")
+
+    @admin.display(description="Content")
+    def short_content(self, obj):
+        return obj.content[:50]
+
+
+@admin.register(InboxItem)
+class InboxItemAdmin(ScalableAdmin):
+    list_display = ("user", "group", "kind", "text", "created_at")
+    list_filter = ("kind",)
+    list_select_related = ("user", "group")
+    search_fields = ("user__username", "group__name")
+    autocomplete_fields = ("user", "group", "actor")
+
+
+@admin.register(UnreadCounter)
+class UnreadCounterAdmin(ScalableAdmin):
+    list_display = ("user", "group", "count")
+    list_select_related = ("user", "group")
+    search_fields = ("user__username", "group__name")
+    autocomplete_fields = ("user", "group")
@@ -0,0 +1,114 @@
+from decimal import Decimal
+
+import numpy as np
+
+from ssa_project.metrics import EVENT_STATUS_TRANSITIONS
+from users.models import Profile
+from . import directory
+from .models import Event
+from .sharding import on_shard
+
+
+def _cents(values):
+    # money columns are compared as integer cents so results match Decimal exactly
+    return np.fromiter((int(v * 100) for v in values), dtype=np.int64, count=len(values))
+
+
+class AffordabilityMatrix:
+    """Member x event affordability for one group, computed with two queries.
+
+    A member can afford an event when max_spend >= total_spend / member_count.
+    That is evaluated as max_spend * member_count >= total_spend in integer cents,
+    so there is no rounding and the whole matrix is a single broadcast comparison.
+    """
+
+    def __init__(self, member_ids, max_spend, balance, events):
+        self.member_ids = list(member_ids)
+        self.events = list(events)
+        self.member_count = len(self.member_ids)
+        self._row = {uid: i for i, uid in enumerate(self.member_ids)}
+        self.max_spend = _cents(max_spend)
+        self.balance = _cents(balance)
+        self.totals = _cents([e.total_spend for e in self.events])
+        n = max(self.member_count, 1)
+        # (members, events) boolean matrices
+        self.eligible = self.max_spend[:, None] * n >= self.totals[None, :]
+        self.funded = self.balance[:, None] * n >= self.totals[None, :]
+
+    @classmethod
+    def for_group(cls, group, events=None):
+        rows = list(
+            Profile.objects.filter(user_id__in=directory.member_ids(group.id))
+            .order_by("user_id")
+            .values_list("user_id", "max_spend", "balance")
+        )
+        if events is None:
+            events = group.events.exclude(status=Event.Status.ARCHIVED).order_by("date", "id")
+        member_ids = [r[0] for r in rows]
+        return cls(member_ids, [r[1] for r in rows], [r[2] for r in rows], events)
+
+    def index_of(self, event_id):
+        for i, event in enumerate(self.events):
+            if event.id == event_id:
+                return i
+        raise KeyError(event_id)
+
+    def share(self, event_index):
+        if self.member_count == 0:
+            return 0
+        return self.events[event_index].total_spend / Decimal(self.member_count)
+
+    def all_eligible(self):
+        """Boolean per event: can every member cover their share?"""
+        return self.eligible.all(axis=0)
+
+    def eligible_for(self, user_id, max_spend=None):
+        """Boolean per event for one user; non-members are checked against their own max_spend."""
+        if user_id in self._row:
+            return self.eligible[self._row[user_id]]
+        if self.member_count == 0:
+            return np.ones(len(self.events), dtype=bool)
+        if max_spend is None:
+            return np.zeros(len(self.events), dtype=bool)
+        return _cents([max_spend]) * self.member_count >= self.totals
+
+    def statuses(self):
+        """Status each non-archived event should have, keyed by event id."""
+        ok = self.all_eligible()
+        result = {}
+        for i, event in enumerate(self.events):
+            if event.status == Event.Status.ARCHIVED:
+                continue
+            result[event.id] = Event.Status.ACTIVE if ok[i] else Event.Status.PENDING
+        return result
+
+    def refresh_statuses(self):
+        """Write changed statuses back with at most two UPDATE queries; returns the number changed."""
+        wanted = self.statuses()
+        changes = {Event.Status.ACTIVE: [], Event.Status.PENDING: []}
+        for event in self.events:
+            status = wanted.get(event.id)
+            if status is not None and status != event.status:
+                changes[status].append(event.id)
+                EVENT_STATUS_TRANSITIONS.inc(from_status=event.status, to_status=status)
+                event.status = status
+        for status, ids in changes.items():
+            if ids:
+                on_shard(Event, ids[0]).filter(id__in=ids).exclude(status=Event.Status.ARCHIVED).update(status=status)
+        return sum(len(ids) for ids in changes.values())
+
+    def shortfalls(self):
+        """For each event, the member ids who cannot cover their share.
+
+        Returns a list of (event, over_max_spend_ids, short_balance_ids).
+        """
+        result = []
+        for i, event in enumerate(self.events):
+            over = np.flatnonzero(~self.eligible[:, i])
+            short = np.flatnonzero(~self.funded[:, i])
+            result.append((
+                event,
+                [self.member_ids[j] for j in over],
+                [self.member_ids[j] for j in short],
+            ))
+        return result
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ChipinConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'chipin'
+
+    def ready(self):
+        # registers the signals that keep the comment search index and
+        # rendered HTML, the membership directory, stored event shares,
+        # calendar feed versions and the per-shard user copies in sync
+        from . import directory, feed, ical, markup, search, sharding  # noqa: F401
@@ -0,0 +1,147 @@
+"""
+Async versions of the read-heavy pages, served under ASGI (ssa_project.asgi
+routes to them through ssa_project.urls_asgi; WSGI keeps chipin.views).
+
+Django's async ORM methods (aget(), acount(), async for ...) all hand their
+work to the one thread that runs sync code, so gathering them does not make
+queries overlap. Each independent group of queries here is a plain function
+run with sync_to_async(thread_sensitive=False): every group gets a worker
+thread and its own database connection, and the groups of one page run at
+the same time. Everything a template reads is loaded in those groups, so
+rendering makes no queries of its own.
+"""
+
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.db import close_old_connections
+from django.db.models import prefetch_related_objects
+from django.shortcuts import aget_object_or_404, redirect, render
+
+from users.models import Transaction
+from . import views
+from .affordability import AffordabilityMatrix
+from .directory import groups_for
+from .forms import CommentForm
+from .inbox import mark_group_read, unread_counts
+from .models import Comment, Group, GroupJoinRequest
+from .sharding import across_shards, on_shard
+
+
+def _concurrent(func):
+    """Run func on a worker thread with its own connections, closed again per CONN_MAX_AGE."""
+    @functools.wraps(func)
+    def run(*args):
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+@_concurrent
+def _memberships(user):
+    memberships = groups_for(user)
+    # the template compares each group's admin with request.user
+    prefetch_related_objects(memberships['member'], 'admin')
+    return memberships
+
+
+@_concurrent
+def _join_requests(user):
+    return across_shards(GroupJoinRequest.objects.filter(user=user).select_related('group'))
+
+
+@_concurrent
+def _available_groups(user):
+    return across_shards(Group.objects.exclude(members=user).exclude(join_requests__user=user))
+
+
+@_concurrent
+def _transactions(user):
+    return list(Transaction.objects.filter(user=user).order_by('-created_at'))
+
+
+@login_required
+async def home(request):
+    user = request.user = await request.auser()
+    memberships, unread, user_join_requests, available_groups, transactions = await asyncio.gather(
+        _memberships(user),
+        _concurrent(unread_counts)(user),
+        _join_requests(user),
+        _available_groups(user),
+        _transactions(user),
+    )
+    for group in memberships['member']:
+        group.unread = unread.get(group.id, 0)
+    return render(request, 'chipin/home.html', {
+        'pending_invitations': memberships['invited'],
+        'user_groups': memberships['member'],
+        'user_join_requests': user_join_requests,
+        'available_groups': available_groups,
+        'balance': user.profile.balance,
+        'transactions': transactions,
+    })
+
+
+@_concurrent
+def _people(group):
+    # profiles live on default; prefetching (not select_related) keeps that working on a shard
+    prefetch_related_objects(
+        [group], 'admin__profile', 'members__profile', 'join_requests__user__profile',
+    )
+
+
+@_concurrent
+def _comments(group):
+    return list(
+        group.comments.select_related('user').prefetch_related('user__profile').order_by('-created_at')
+    )
+
+
+@_concurrent
+def _event_share_info(group, user):
+    events = list(group.events.all())
+    matrix = AffordabilityMatrix.for_group(group, events=events)
+    eligible = matrix.eligible_for(user.id, max_spend=user.profile.max_spend)
+    joined_ids = set(group.events.filter(members=user).values_list('id', flat=True))
+    return events, {
+        event: {
+            'share': matrix.share(i),
+            'eligible': bool(eligible[i]),
+            'status': event.status,
+            'joined': event.id in joined_ids,
+        }
+        for i, event in enumerate(events)
+    }
+
+
+@login_required
+async def group_detail(request, group_id, edit_comment_id=None):
+    if request.method == 'POST':
+        # posting and editing comments write; the sync view handles them
+        return await sync_to_async(views.group_detail)(request, group_id, edit_comment_id)
+    user = request.user = await request.auser()
+    group = await aget_object_or_404(on_shard(Group, group_id), id=group_id)
+    comment_to_edit = None
+    if edit_comment_id:
+        comment_to_edit = await aget_object_or_404(on_shard(Comment, edit_comment_id), id=edit_comment_id)
+        # only the author or group admin can edit
+        if comment_to_edit.user_id != user.id and group.admin_id != user.id:
+            return redirect('chipin:group_detail', group_id=group.id)
+    _, comments, (events, event_share_info), _ = await asyncio.gather(
+        _people(group),
+        _comments(group),
+        _event_share_info(group, user),
+        _concurrent(mark_group_read)(user, group),
+    )
+    return render(request, 'chipin/group_detail.html', {
+        'group': group,
+        'comments': comments,
+        'form': CommentForm(instance=comment_to_edit) if comment_to_edit else CommentForm(),
+        'comment_to_edit': comment_to_edit,
+        'events': events,
+        'event_share_info': event_share_info,
+    })
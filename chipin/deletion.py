@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from . import search
+from .ical import invalidate_groups
+from .models import (
+    Group, Comment, Event, Invite, GroupJoinRequest, Settlement, InboxItem, UnreadCounter, MemberDirectory,
+)
+from .sharding import shard_for
+
+logger = logging.getLogger(__name__)
+
+# rows removed per DELETE; each chunk is its own short write transaction
+PURGE_CHUNK_SIZE = 1000
+
+
+def schedule_group_deletion(group):
+    """Hide a group immediately and purge its rows from a background thread."""
+    using = group._state.db
+    Group.all_objects.using(using).filter(id=group.id).update(deleted_at=timezone.now())
+    invalidate_groups([group.id])
+    transaction.on_commit(lambda: _start_worker(group.id), using=using)
+
+
+def _start_worker(group_id):
+    thread = threading.Thread(target=_purge_in_background, args=(group_id,), daemon=True,
+                              name=f"purge-group-{group_id}")
+    thread.start()
+    return thread
+
+
+def _purge_in_background(group_id):
+    try:
+        purge_group(group_id)
+    except Exception:
+        # purge_deleted_groups picks up anything left behind
+        logger.exception("Purging group %s failed", group_id)
+    finally:
+        connections.close_all()
+
+
+def _chunked_delete(table, where, params, chunk_size, timings, key="id", using=DEFAULT_DB_ALIAS):
+    """DELETE matching rows from table in chunks of at most chunk_size rows."""
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    sql = (
+        f"DELETE FROM {qn(table)} WHERE {qn(key)} IN "
+        f"(SELECT {qn(key)} FROM {qn(table)} WHERE {where} LIMIT %s)"
+    )
+    total = 0
+    while True:
+        began = time.perf_counter()
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.execute(sql, [*params, chunk_size])
+            deleted = cursor.rowcount
+        timings.append(time.perf_counter() - began)
+        total += deleted
+        if deleted < chunk_size:
+            return total
+
+
+def purge_group(group_id, chunk_size=PURGE_CHUNK_SIZE):
+    """Delete a group marked for deletion and everything that hangs off it.
+
+    Dependents go first, leaf tables before their parents, so no single
+    statement cascades and the write lock is only ever held for one chunk.
+    The group's own rows go from its shard, its inbox and directory rows
+    from the default database. Returns (rows deleted, longest chunk in seconds).
+    """
+    using = shard_for(group_id)
+    groups = Group.all_objects.using(using).filter(id=group_id, deleted_at__isnull=False)
+    if not groups.exists():
+        return 0, 0
+    qn = connections[using].ops.quote_name
+    event_members = Event.members.through._meta.db_table
+    events = Event._meta.db_table
+    in_group_events = f"{qn('event_id')} IN (SELECT {qn('id')} FROM {qn(events)} WHERE {qn('group_id')} = %s)"
+    by_group = f"{qn('group_id')} = %s"
+    settlements = Settlement._meta.db_table
+    in_group_settlements = (
+        f"{qn('settlement_id')} IN (SELECT {qn('id')} FROM {qn(settlements)} WHERE {qn('group_id')} = %s)"
+    )
+    steps = [
+        (Settlement.events.through._meta.db_table, in_group_settlements),
+        (Settlement.transactions.through._meta.db_table, in_group_settlements),
+        (settlements, by_group),
+        (event_members, in_group_events),
+        (events, by_group),
+        (Comment._meta.db_table, by_group),
+        (Invite._meta.db_table, by_group),
+        (GroupJoinRequest._meta.db_table, by_group),
+        (Group.members.through._meta.db_table, by_group),
+        (Group.invited_users.through._meta.db_table, by_group),
+    ]
+    # rows on the default database that name the group by id
+    by_group_id = f"{connections[DEFAULT_DB_ALIAS].ops.quote_name('group_id')} = %s"
+    global_steps = [InboxItem._meta.db_table, UnreadCounter._meta.db_table, MemberDirectory._meta.db_table]
+    timings = []
+    total = 0
+    if search.fts_enabled(using):
+        # the raw DELETEs below skip the signals that keep the search index in sync
+        _chunked_delete(search.FTS_TABLE, f"{qn(search.FTS_TABLE)} MATCH %s", [search.group_match(group_id)],
+                        chunk_size, timings, key="rowid", using=using)
+    for table in global_steps:
+        total += _chunked_delete(table, by_group_id, [group_id], chunk_size, timings)
+    for table, where in steps:
+        total += _chunked_delete(table, where, [group_id], chunk_size, timings, using=using)
+    total += groups.delete()[0]
+    return total, max(timings, default=0)
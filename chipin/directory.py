@@ -0,0 +1,94 @@
+"""
+Cross-shard directory of group membership.
+
+MemberDirectory mirrors Group.members and Group.invited_users on the default
+database, kept current by m2m_changed, so a user's groups (the home page)
+and a group's member ids (inbox fan-out, affordability) never need a join
+across databases. bulk_create() on the through tables skips the signals;
+call add_entries() alongside it.
+"""
+
+from django.db.models import Count
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
+
+from .models import Group, InboxItem, MemberDirectory, UnreadCounter
+from .sharding import shard_for
+
+Kind = MemberDirectory.Kind
+
+_KINDS = {
+    Group.members.through: Kind.MEMBER,
+    Group.invited_users.through: Kind.INVITED,
+}
+
+
+def add_entries(kind, pairs, batch_size=2000):
+    """Record (user id, group id) pairs of one kind; pairs already recorded are skipped."""
+    MemberDirectory.objects.bulk_create(
+        [MemberDirectory(user_id=user_id, group_id=group_id, kind=kind) for user_id, group_id in pairs],
+        ignore_conflicts=True, batch_size=batch_size,
+    )
+
+
+def member_ids(group_id):
+    """The group's member ids as a values() queryset, usable as a subquery on default."""
+    return MemberDirectory.objects.filter(group_id=group_id, kind=Kind.MEMBER).values("user_id")
+
+
+def group_ids(user):
+    """Ids of the groups the user is a member of as a values() queryset, usable as a subquery on default."""
+    return MemberDirectory.objects.filter(user=user, kind=Kind.MEMBER).values("group_id")
+
+
+def member_counts(ids):
+    """{group id: member count} for these groups; groups without members are left out."""
+    entries = MemberDirectory.objects.filter(group_id__in=ids, kind=Kind.MEMBER)
+    return dict(entries.values("group_id").annotate(n=Count("id")).values_list("group_id", "n"))
+
+
+def groups_for(user):
+    """The user's live groups by kind, {"member": [...], "invited": [...]}, in id order.
+
+    One directory query, then one in_bulk() per shard holding any of them.
+    """
+    ids = {kind: [] for kind in Kind.values}
+    entries = MemberDirectory.objects.filter(user=user).order_by("group_id").values_list("kind", "group_id")
+    for kind, group_id in entries:
+        ids[kind].append(group_id)
+    by_shard = {}
+    for group_id in set().union(*ids.values()):
+        by_shard.setdefault(shard_for(group_id), []).append(group_id)
+    groups = {}
+    for alias, group_ids in by_shard.items():
+        groups.update(Group.objects.using(alias).in_bulk(group_ids))
+    return {kind: [groups[g] for g in group_ids if g in groups] for kind, group_ids in ids.items()}
+
+
+def forget_group(group_id):
+    """Delete a group's directory, inbox and unread rows from the default database."""
+    for model in (MemberDirectory, InboxItem, UnreadCounter):
+        model.objects.filter(group_id=group_id).delete()
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+@receiver(m2m_changed, sender=Group.invited_users.through)
+def _membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    kind = _KINDS[sender]
+    # reverse: instance is a user and pk_set holds group ids
+    if action == "post_add":
+        add_entries(kind, [(instance.pk, pk) if reverse else (pk, instance.pk) for pk in pk_set])
+    elif action == "post_remove":
+        if reverse:
+            entries = MemberDirectory.objects.filter(user_id=instance.pk, group_id__in=pk_set)
+        else:
+            entries = MemberDirectory.objects.filter(group_id=instance.pk, user_id__in=pk_set)
+        entries.filter(kind=kind).delete()
+    elif action == "post_clear":
+        field = "user_id" if reverse else "group_id"
+        MemberDirectory.objects.filter(kind=kind, **{field: instance.pk}).delete()
+
+
+@receiver(post_delete, sender=Group)
+def _group_deleted(sender, instance, **kwargs):
+    forget_group(instance.pk)
@@ -0,0 +1,117 @@
+"""
+Cross-group "events I can join" feed.
+
+Event.share stores total_spend / member count rounded up to the cent. Since
+max_spend is itself a whole number of cents, share <= max_spend holds exactly
+when max_spend * members >= total_spend does (AffordabilityMatrix's test), so
+the feed is a single query over event_feed_idx (group, status, date, share)
+for the user's groups, paged by (date, id) instead of by offset. The
+receivers below keep shares current as events are saved and members come
+and go; shares of archived events are left as they were.
+"""
+
+from datetime import datetime
+from decimal import ROUND_CEILING, Decimal
+from heapq import merge
+from itertools import islice
+
+from django.db.models.signals import m2m_changed, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import directory
+from .models import Event, Group
+from .sharding import shard_for, sharding_enabled
+
+FEED_PAGE_SIZE = 20
+OPEN_STATUSES = (Event.Status.PENDING, Event.Status.ACTIVE)
+CENT = Decimal("0.01")
+
+
+def stored_share(total_spend, member_count):
+    return (Decimal(total_spend) / max(member_count, 1)).quantize(CENT, rounding=ROUND_CEILING)
+
+
+def refresh_shares(group_ids):
+    """Recompute the share of every open event in these groups; returns how many changed."""
+    counts = directory.member_counts(group_ids)
+    by_shard = {}
+    for group_id in group_ids:
+        by_shard.setdefault(shard_for(group_id), []).append(group_id)
+    changed = 0
+    for alias, ids in by_shard.items():
+        events = Event.objects.using(alias).filter(group_id__in=ids, status__in=OPEN_STATUSES)
+        stale = []
+        for event in events.only("id", "group_id", "total_spend", "share"):
+            share = stored_share(event.total_spend, counts.get(event.group_id, 0))
+            if share != event.share:
+                event.share = share
+                stale.append(event)
+        Event.objects.using(alias).bulk_update(stale, ["share"], batch_size=1000)
+        changed += len(stale)
+    return changed
+
+
+def joinable_events(user, max_spend, after=None, limit=FEED_PAGE_SIZE):
+    """Upcoming open events in the user's groups that cost them at most max_spend.
+
+    Events the user has already joined are left out. Results are in (date, id)
+    order, starting after the ``after`` cursor (see cursor()). Returns
+    (events, cursor of the next page or None).
+    """
+    start = timezone.now()
+    events = (
+        Event.objects.filter(status__in=OPEN_STATUSES, share__lte=max_spend, group__deleted_at__isnull=True)
+        .exclude(members=user)
+        .select_related("group")
+        .order_by("date", "id")
+    )
+    if after is not None:
+        date, event_id = after
+        start = max(start, date)
+        events = events.exclude(date=date, id__lte=event_id)
+    events = events.filter(date__gte=start)
+    if sharding_enabled():
+        by_shard = {}
+        for group_id in directory.group_ids(user).values_list("group_id", flat=True):
+            by_shard.setdefault(shard_for(group_id), []).append(group_id)
+        pages = [events.using(alias).filter(group_id__in=ids)[:limit + 1] for alias, ids in by_shard.items()]
+        page = list(islice(merge(*pages, key=lambda e: (e.date, e.id)), limit + 1))
+    else:
+        # one statement: the user's groups come from a subquery on the directory
+        page = list(events.filter(group_id__in=directory.group_ids(user))[:limit + 1])
+    if len(page) > limit:
+        return page[:limit], cursor(page[limit - 1])
+    return page, None
+
+
+def cursor(event):
+    return f"{event.date.isoformat()}_{event.id}"
+
+
+def parse_cursor(value):
+    """(date, id) from a cursor() string, or None if it is malformed."""
+    date, _, event_id = (value or "").rpartition("_")
+    date = parse_datetime(date) if date else None
+    if not isinstance(date, datetime) or not event_id.isdigit():
+        return None
+    return date, int(event_id)
+
+
+@receiver(pre_save, sender=Event)
+def _store_share(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "total_spend" in update_fields:
+        instance.share = stored_share(instance.total_spend, directory.member_ids(instance.group_id).count())
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def _members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # runs after chipin.directory's receiver (imported above), so counts are current
+    if action == "pre_clear" and reverse:
+        # the user's groups are forgotten by the time post_clear arrives
+        instance._feed_cleared_groups = list(directory.group_ids(instance).values_list("group_id", flat=True))
+    elif action in ("post_add", "post_remove"):
+        refresh_shares(list(pk_set) if reverse else [instance.pk])
+    elif action == "post_clear":
+        refresh_shares(instance.__dict__.pop("_feed_cleared_groups", []) if reverse else [instance.pk])
@@ -0,0 +1,218 @@
+"""
+iCalendar feeds of upcoming events, per user and per group.
+
+Calendar apps poll a feed URL every few minutes without a session, so each
+URL carries a signed token naming the user and their Profile.calendar_key;
+rotate_key() gives the user a new key and every URL issued before stops
+working. Every feed is answered with a strong ETag built from version
+columns (Group.calendar_version, Profile.calendar_version) and the current
+UTC day, the day being where an unchanged feed starts. Checking
+If-None-Match therefore costs an HMAC and a primary-key read or two, and the
+events are only queried, on event_group_date_idx, when the feed has changed.
+The versions live in the database rather than a cache so that every worker
+process sees a change as soon as it is committed.
+
+A group's version moves whenever one of its events is saved or deleted and
+when it is renamed; a user's moves with the groups they are in and when they
+join or leave one. The versions are updated in the same transaction as the
+change, so a feed can never pair old events with a new ETag. Code that
+changes events with queryset.update() (archiving, settlement) must call
+invalidate_groups() itself.
+"""
+
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+from heapq import merge
+
+from django.core import signing
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from users.models import Profile, new_calendar_key
+from . import directory
+from .models import Event, Group, MemberDirectory
+from .sharding import shard_for, sharding_enabled
+
+TOKEN_SALT = "chipin.calendar"
+PRODID = "-//ChipIn//Events//EN"
+CHUNK_SIZE = 500
+
+
+# -- tokens -----------------------------------------------------------------------
+
+def token_for(user):
+    return signing.Signer(salt=TOKEN_SALT).sign(f"{user.pk}.{user.profile.calendar_key}")
+
+
+def token_owner(token):
+    """(user id, calendar version) of the token's owner, or None if it was not issued here or was revoked."""
+    try:
+        user_id, key = signing.Signer(salt=TOKEN_SALT).unsign(token).split(".", 1)
+        user_id = int(user_id)
+    except (signing.BadSignature, ValueError):
+        return None
+    version = (
+        Profile.objects.filter(user_id=user_id, calendar_key=key).values_list("calendar_version", flat=True).first()
+    )
+    return None if version is None else (user_id, version)
+
+
+def rotate_key(user):
+    """Revoke every calendar URL issued to the user so far."""
+    profile = user.profile
+    profile.calendar_key = new_calendar_key()
+    # saved, not updated, so the cached request.user forgets the old key
+    profile.save(update_fields=["calendar_key"])
+
+
+# -- versions -----------------------------------------------------------------------
+
+def group_version(group_id):
+    """The group's calendar version, or None if there is no such (live) group."""
+    return (
+        Group.objects.using(shard_for(group_id)).filter(id=group_id)
+        .values_list("calendar_version", flat=True).first()
+    )
+
+
+def invalidate_groups(group_ids):
+    """Move the calendar version of these groups and of all their members."""
+    group_ids = set(group_ids)
+    if not group_ids:
+        return
+    by_shard = {}
+    for group_id in group_ids:
+        by_shard.setdefault(shard_for(group_id), []).append(group_id)
+    for alias, ids in by_shard.items():
+        Group.all_objects.using(alias).filter(id__in=ids).update(calendar_version=F("calendar_version") + 1)
+    invalidate_users(
+        MemberDirectory.objects.filter(group_id__in=group_ids, kind=directory.Kind.MEMBER)
+        .values_list("user_id", flat=True)
+    )
+
+
+def invalidate_users(user_ids):
+    Profile.objects.filter(user_id__in=user_ids).update(calendar_version=F("calendar_version") + 1)
+
+
+def window_start():
+    """Feeds list events from the start of the current UTC day on."""
+    return datetime.combine(timezone.now().astimezone(dt_timezone.utc).date(), dt_time.min, dt_timezone.utc)
+
+
+def group_etag(group_id, group_version, user_version):
+    # the reader's own version is in it too, so leaving the group ends the 304s
+    return f'"g{group_id}-{group_version:x}-{user_version:x}-{window_start():%Y%m%d}"'
+
+
+def user_etag(user_id, user_version):
+    return f'"u{user_id}-{user_version:x}-{window_start():%Y%m%d}"'
+
+
+# -- feeds --------------------------------------------------------------------------
+
+def _upcoming(queryset, start):
+    return (
+        queryset.filter(date__gte=start, group__deleted_at__isnull=True)
+        .exclude(status=Event.Status.ARCHIVED)
+        .select_related("group")
+        .order_by("date", "id")
+    )
+
+
+def group_events(group_id, start):
+    """The group's upcoming events, one range scan of event_group_date_idx."""
+    return _upcoming(Event.objects.using(shard_for(group_id)).filter(group_id=group_id), start).iterator(CHUNK_SIZE)
+
+
+def user_events(user, start):
+    """Upcoming events in all of the user's groups, in date order."""
+    if not sharding_enabled():
+        return _upcoming(Event.objects.filter(group_id__in=directory.group_ids(user)), start).iterator(CHUNK_SIZE)
+    by_shard = {}
+    for group_id in directory.group_ids(user).values_list("group_id", flat=True):
+        by_shard.setdefault(shard_for(group_id), []).append(group_id)
+    return merge(
+        *(_upcoming(Event.objects.using(alias).filter(group_id__in=ids), start).iterator(CHUNK_SIZE)
+          for alias, ids in by_shard.items()),
+        key=lambda e: (e.date, e.id),
+    )
+
+
+def _escape(text):
+    return (
+        str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _fold(line):
+    # content lines are folded at 75 octets (RFC 5545 3.1)
+    data = line.encode()
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts, start = [], 0
+    while start < len(data):
+        end = min(start + (75 if not parts else 74), len(data))
+        # never split a multi-byte character
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode())
+        start = end
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _stamp(value):
+    return value.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def render(events, name, link):
+    """Yield an iCalendar document for events, a few lines at a time.
+
+    link(event) is the absolute URL of the event's group page. Nothing in
+    the output depends on the time it is generated, so the same version
+    always renders the same bytes.
+    """
+    yield (
+        "BEGIN:VCALENDAR\r\nVERSION:2.0\r\n"
+        f"PRODID:{PRODID}\r\nCALSCALE:GREGORIAN\r\n" + _fold(f"X-WR-CALNAME:{_escape(name)}")
+    )
+    for event in events:
+        yield (
+            "BEGIN:VEVENT\r\n"
+            f"UID:event-{event.id}@chipin\r\n"
+            f"DTSTAMP:{_stamp(event.created_at)}\r\n"
+            f"DTSTART:{_stamp(event.date)}\r\n"
+            + _fold(f"SUMMARY:{_escape(event.name)}")
+            + _fold(f"DESCRIPTION:{_escape(f'{event.group.name}: total spend ${event.total_spend}')}")
+            + _fold(f"URL:{link(event)}")
+            + "END:VEVENT\r\n"
+        )
+    yield "END:VCALENDAR\r\n"
+
+
+# -- receivers ------------------------------------------------------------------------
+
+@receiver([post_save, post_delete], sender=Event)
+def _event_changed(sender, instance, **kwargs):
+    invalidate_groups([instance.group_id])
+
+
+@receiver(post_save, sender=Group)
+def _group_changed(sender, instance, created, **kwargs):
+    # the group's name is in every event's description
+    if not created:
+        invalidate_groups([instance.pk])
+
+
+@receiver(m2m_changed, sender=Group.members.through)
+def _members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # reverse: instance is a user and pk_set holds group ids
+    if action == "pre_clear" and not reverse:
+        # the members are gone from the directory by the time post_clear arrives
+        instance._ical_cleared_members = list(directory.member_ids(instance.pk).values_list("user_id", flat=True))
+    elif action in ("post_add", "post_remove"):
+        invalidate_users([instance.pk] if reverse else pk_set)
+    elif action == "post_clear":
+        invalidate_users([instance.pk] if reverse else instance.__dict__.pop("_ical_cleared_members", []))
@@ -0,0 +1,131 @@
+"""
+Per-member activity inbox.
+
+Activity is fanned out when it happens: each recipient gets an InboxItem row
+and their UnreadCounter for the group goes up by one, a batch of recipients
+at a time, so reading "what's new" is a lookup on the reader's own rows
+(see unread_counts()) instead of a query across every group they are in.
+"""
+
+import time
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+
+from .models import InboxItem, MemberDirectory, UnreadCounter
+
+# recipients written per INSERT/UPDATE round
+FANOUT_BATCH_SIZE = 2000
+INBOX_RETENTION_DAYS = 30
+TRIM_BATCH_SIZE = 5000
+
+
+def _upsert_counters_sql(qn, counters, select):
+    return (
+        f"INSERT INTO {qn(counters)} ({qn('user_id')}, {qn('group_id')}, {qn('count')}) {select} "
+        f"ON CONFLICT ({qn('user_id')}, {qn('group_id')}) "
+        f"DO UPDATE SET {qn('count')} = {qn(counters)}.{qn('count')} + 1"
+    )
+
+
+def fan_out(group, kind, text, actor=None, recipients=None, batch_size=FANOUT_BATCH_SIZE):
+    """Write an inbox item for every recipient and bump their unread counter.
+
+    recipients defaults to the group's members; the actor never notifies
+    themselves. Members are handled batch_size at a time in user id order,
+    each batch as one INSERT ... SELECT of items straight from the membership
+    directory (which sits on this database however groups are sharded) and
+    one counter upsert (count = count + 1), so no per-member rows travel
+    through Python. Everything runs in one transaction. Returns the number
+    of recipients.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    actor_id = actor.id if actor is not None else None
+    text = text[:200]
+    qn = connection.ops.quote_name
+    items, counters = InboxItem._meta.db_table, UnreadCounter._meta.db_table
+    total = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+        if recipients is not None:
+            recipients = [uid for uid in recipients if uid != actor_id]
+            cursor.executemany(
+                f"INSERT INTO {qn(items)} ({qn('user_id')}, {qn('group_id')}, {qn('kind')}, {qn('actor_id')}, "
+                f"{qn('text')}, {qn('created_at')}) VALUES (%s, %s, %s, %s, %s, %s)",
+                [(uid, group.id, kind, actor_id, text, now) for uid in recipients],
+            )
+            cursor.executemany(_upsert_counters_sql(qn, counters, "VALUES (%s, %s, 1)"),
+                               [(uid, group.id) for uid in recipients])
+            return len(recipients)
+
+        members = MemberDirectory._meta.db_table
+        is_member = f"{qn('group_id')} = %s AND {qn('kind')} = '{MemberDirectory.Kind.MEMBER}'"
+        # the WHERE clause also keeps SQLite from reading ON CONFLICT as part of a join
+        member_range = (
+            f"FROM {qn(members)} WHERE {is_member} AND {qn('user_id')} > %s "
+            f"AND {qn('user_id')} <= %s AND {qn('user_id')} <> %s"
+        )
+        last = 0
+        while True:
+            # upper user id of the next batch
+            cursor.execute(
+                f"SELECT MAX({qn('user_id')}) FROM (SELECT {qn('user_id')} FROM {qn(members)} "
+                f"WHERE {is_member} AND {qn('user_id')} > %s ORDER BY {qn('user_id')} LIMIT %s) batch",
+                [group.id, last, batch_size],
+            )
+            upto = cursor.fetchone()[0]
+            if upto is None:
+                return total
+            params = [group.id, last, upto, actor_id or 0]
+            cursor.execute(
+                f"INSERT INTO {qn(items)} ({qn('user_id')}, {qn('group_id')}, {qn('kind')}, {qn('actor_id')}, "
+                f"{qn('text')}, {qn('created_at')}) SELECT {qn('user_id')}, %s, %s, %s, %s, %s {member_range}",
+                [group.id, kind, actor_id, text, now] + params,
+            )
+            total += cursor.rowcount
+            cursor.execute(
+                _upsert_counters_sql(qn, counters, f"SELECT {qn('user_id')}, %s, 1 {member_range}"),
+                [group.id] + params,
+            )
+            last = upto
+
+
+def unread_counts(user):
+    """{group id: unread count} for a user, from one query on their counters."""
+    return dict(UnreadCounter.objects.filter(user=user, count__gt=0).values_list("group_id", "count"))
+
+
+def mark_group_read(user, group):
+    UnreadCounter.objects.filter(user=user, group=group, count__gt=0).update(count=0)
+
+
+def trim_inbox(retention_days=INBOX_RETENTION_DAYS, batch_size=TRIM_BATCH_SIZE, pause=0.0):
+    """Delete inbox items older than the retention window, batch_size rows per DELETE.
+
+    Unread items are a member's newest ones, so an unread counter can never
+    be higher than the items they still have in that group; each batch caps
+    the counters of the members it touched at that, in the same transaction
+    as the DELETE, so home does not announce items that are gone.
+    """
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted = 0
+    while True:
+        rows = list(
+            InboxItem.objects.filter(created_at__lt=cutoff).values_list("id", "user_id", "group_id")[:batch_size]
+        )
+        if not rows:
+            return deleted
+        remaining = (
+            InboxItem.objects.filter(user_id=OuterRef("user_id"), group_id=OuterRef("group_id"))
+            .order_by().values("user_id").annotate(n=Count("id")).values("n")
+        )
+        with transaction.atomic():
+            deleted += InboxItem.objects.filter(id__in=[pk for pk, _, _ in rows]).delete()[0]
+            # any counter may be capped, so users x groups of the batch is close enough
+            UnreadCounter.objects.filter(
+                user_id__in={uid for _, uid, _ in rows}, group_id__in={gid for _, _, gid in rows}, count__gt=0,
+            ).update(count=Least(F("count"), Coalesce(Subquery(remaining), 0)))
+        if pause:
+            time.sleep(pause)
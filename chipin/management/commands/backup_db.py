@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from chipin.sharding import replica_aliases
+from ssa_project.backup import backup_settings, snapshot, snapshots, verify
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot the default database and every group shard with SQLite's online backup API while "
+        "the site keeps writing, gzip the snapshots and keep the newest --keep of each. With --verify, "
+        "integrity-check snapshots instead (the newest of each database unless paths are given)."
+    )
+
+    def add_arguments(self, parser):
+        config = backup_settings()
+        parser.add_argument("--database", action="append", dest="databases",
+                            help="Alias to back up (repeatable); defaults to all of them")
+        parser.add_argument("--dir", default=str(config["DIR"]))
+        parser.add_argument("--keep", type=int, default=config["KEEP"], help="Snapshots kept per database")
+        parser.add_argument("--pages", type=int, default=config["PAGES_PER_STEP"],
+                            help="Pages copied per step; doubled each time a write restarts the copy")
+        parser.add_argument("--sleep", type=float, default=config["STEP_SLEEP"], help="Seconds between steps")
+        parser.add_argument("--verify", nargs="*", metavar="PATH", help="Check snapshots instead of taking them")
+        parser.add_argument("--full", action="store_true", help="With --verify, run integrity_check, not quick_check")
+
+    def handle(self, *args, **options):
+        aliases = options["databases"] or [DEFAULT_DB_ALIAS] + replica_aliases()
+        for alias in aliases:
+            if alias not in connections or connections[alias].vendor != "sqlite":
+                raise CommandError(f"{alias} is not an SQLite database")
+        if options["verify"] is not None:
+            return self._verify(options["verify"] or self._newest(aliases, options["dir"]), options["full"])
+        for alias in aliases:
+            taken = snapshot(alias, options["dir"], pages=options["pages"], sleep=options["sleep"], keep=options["keep"])
+            self.stdout.write(
+                f"{alias}: {taken['path']} ({taken['size'] / 1e6:.2f} MB, {taken['compressed'] / 1e6:.2f} MB "
+                f"gzipped) in {taken['seconds']:.2f} s; {taken['steps']} step(s), {taken['restarts']} restart(s), "
+                f"longest step {taken['longest_step'] * 1000:.1f} ms at {taken['pages_per_step']} pages"
+            )
+            for path in taken["removed"]:
+                self.stdout.write(f"  removed {path}")
+
+    def _newest(self, aliases, directory):
+        paths = []
+        for alias in aliases:
+            existing = snapshots(alias, directory)
+            if not existing:
+                raise CommandError(f"No snapshot of {alias} in {directory}")
+            paths.append(existing[-1])
+        return paths
+
+    def _verify(self, paths, full):
+        failed = 0
+        for path in paths:
+            problems = verify(path, full=full)
+            if problems:
+                failed += 1
+                self.stdout.write(f"{path}: FAILED")
+                for problem in problems[:20]:
+                    self.stdout.write(f"  {problem}")
+            else:
+                self.stdout.write(f"{path}: ok")
+        if failed:
+            raise CommandError(f"{failed} of {len(paths)} snapshot(s) failed verification")
@@ -0,0 +1,67 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from chipin.affordability import AffordabilityMatrix
+from chipin.directory import add_entries
+from chipin.models import Group, Event, MemberDirectory
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = "Benchmark the group affordability matrix against per-event checks (data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=5000)
+        parser.add_argument("--events", type=int, default=500)
+        parser.add_argument("--sample", type=int, default=5, help="Events to time with the per-event loop")
+
+    def handle(self, *args, **options):
+        members, events = options["members"], options["events"]
+        rng = random.Random(0)
+        with transaction.atomic():
+            users = User.objects.bulk_create(
+                User(username=f"bench-aff-{i}") for i in range(members)
+            )
+            Profile.objects.bulk_create(
+                Profile(user=u, nickname=f"bench-aff-{u.id}",
+                        max_spend=Decimal(rng.randint(1, 200)), balance=Decimal(rng.randint(0, 200)))
+                for u in users
+            )
+            group = Group.objects.create(name="bench-aff", admin=users[0])
+            Group.members.through.objects.bulk_create(
+                Group.members.through(group_id=group.id, user_id=u.id) for u in users
+            )
+            # bulk_create skips the m2m signals that fill the directory
+            add_entries(MemberDirectory.Kind.MEMBER, [(u.id, group.id) for u in users])
+            now = timezone.now()
+            Event.objects.bulk_create(
+                Event(name=f"e{i}", date=now, group=group,
+                      total_spend=Decimal(rng.randint(1, members * 150)))
+                for i in range(events)
+            )
+
+            with CaptureQueriesContext(connection) as ctx:
+                began = time.perf_counter()
+                matrix = AffordabilityMatrix.for_group(group)
+                statuses = matrix.statuses()
+                matrix_time = time.perf_counter() - began
+
+            sample = list(Event.objects.filter(group=group)[:options["sample"]])
+            began = time.perf_counter()
+            for event in sample:
+                event.check_status(save=False)
+            loop_time = (time.perf_counter() - began) / max(len(sample), 1) * events
+
+            transaction.set_rollback(True)
+
+        active = sum(1 for s in statuses.values() if s == Event.Status.ACTIVE)
+        self.stdout.write(f"{members} members x {events} events ({active} active)")
+        self.stdout.write(f"matrix: {matrix_time * 1000:.1f} ms, {len(ctx.captured_queries)} queries")
+        self.stdout.write(f"per-event check_status (extrapolated from {len(sample)}): {loop_time * 1000:.1f} ms")
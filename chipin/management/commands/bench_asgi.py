@@ -0,0 +1,238 @@
+import asyncio
+import io
+import itertools
+import sys
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from chipin.deletion import purge_group
+from chipin.models import Group
+from chipin.sharding import across_shards, sharding_enabled
+from users.models import Transaction
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(pct / 100 * len(sorted_values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare home and group_detail served in-process by the WSGI application (a pool of "
+        "--threads worker threads, like gunicorn gthread) and the ASGI application (one event "
+        "loop with the async views, like one uvicorn worker) at rising numbers of concurrent "
+        "clients. Bench data is created, committed and deleted again afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated concurrent clients")
+        parser.add_argument("--seconds", type=float, default=5.0, help="Per mode and concurrency level")
+        parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads")
+        parser.add_argument("--members", type=int, default=30)
+        parser.add_argument("--comments", type=int, default=100)
+        parser.add_argument("--events", type=int, default=10)
+        parser.add_argument("--transactions", type=int, default=100, help="Ledger rows per member")
+        parser.add_argument("--db-latency-ms", type=float, default=0.0,
+                            help="Sleep added to every query, standing in for a database across the network")
+        parser.add_argument("--slo-ms", type=float, default=250.0,
+                            help="p99 latency a concurrency level has to stay under to count as served")
+
+    # -- data ----------------------------------------------------------------------------
+
+    def _setup(self, options):
+        stamp = time.monotonic_ns()
+        users = [User.objects.create_user(username=f"bench-asgi-{i}-{stamp}") for i in range(options["members"])]
+        # saved rather than objects.create()d so each lands on a shard when sharding is on
+        group = Group(name="bench-asgi", admin=users[0])
+        group.save()
+        group.members.add(*users)
+        Group(name="bench-asgi other", admin=users[0]).save()
+        now = timezone.now()
+        group.comments.bulk_create(
+            group.comments.model(group=group, user=users[i % len(users)], content=f"bench comment {i}")
+            for i in range(options["comments"])
+        )
+        for i in range(options["events"]):
+            group.events.create(name=f"bench event {i}", date=now + timedelta(days=i),
+                                total_spend=Decimal("10.00"))
+        Transaction.objects.bulk_create(
+            Transaction(user=user, amount=Decimal("1.00"), description=f"bench top-up {i}")
+            for user in users for i in range(options["transactions"])
+        )
+        return users, group
+
+    def _sessions(self, users):
+        cookies = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            cookies.append(f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}")
+        return cookies
+
+    def _teardown(self, users, cookies):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        for cookie in cookies:
+            store(cookie.split("=", 1)[1]).delete()
+        ids = [u.id for u in users]
+        for group in across_shards(Group.all_objects.filter(admin_id__in=ids)):
+            Group.all_objects.using(group._state.db).filter(id=group.id).update(deleted_at=timezone.now())
+            purge_group(group.id)
+        if sharding_enabled():
+            # a user delete cascades through tables that only exist on the shards
+            self.stdout.write(f"Left {len(ids)} bench-asgi-* account(s) in place on the sharded databases.")
+            return
+        # profiles and the ledger go with the users
+        User.objects.filter(id__in=ids).delete()
+
+    # -- serving modes -----------------------------------------------------------------------
+
+    def _wsgi_level(self, paths, cookies, concurrency, seconds, threads):
+        from ssa_project.wsgi import application
+
+        workers = threading.Semaphore(threads)
+        samples, lock = [], threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def client(n):
+            local = []
+            while time.perf_counter() < deadline:
+                path = paths[len(local) % len(paths)]
+                environ = {
+                    "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "",
+                    "SERVER_NAME": "127.0.0.1", "SERVER_PORT": "8000", "REMOTE_ADDR": "127.0.0.1",
+                    "SERVER_PROTOCOL": "HTTP/1.1", "HTTP_COOKIE": cookies[n % len(cookies)],
+                    "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http",
+                    "wsgi.version": (1, 0), "wsgi.multithread": True, "wsgi.multiprocess": False,
+                    "wsgi.run_once": False,
+                }
+                status = []
+                began = time.perf_counter()
+                # a connection waits for a free worker thread before it is served
+                with workers:
+                    b"".join(application(environ, lambda s, h, *a: status.append(s)))
+                local.append((time.perf_counter() - began, int(status[0][:3])))
+            with lock:
+                samples.extend(local)
+
+        clients = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return samples
+
+    def _asgi_level(self, paths, cookies, concurrency, seconds):
+        from ssa_project.asgi import application
+
+        async def request(path, cookie):
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+                "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+                "root_path": "", "headers": [(b"host", b"127.0.0.1:8000"), (b"cookie", cookie.encode())],
+                "client": ("127.0.0.1", 50000), "server": ("127.0.0.1", 8000),
+            }
+            sent = False
+            status = []
+
+            async def receive():
+                nonlocal sent
+                if not sent:
+                    sent = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                # the client never disconnects; Django cancels this once it has responded
+                await asyncio.Future()
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+
+            await application(scope, receive, send)
+            return status[0]
+
+        async def client(n, deadline, samples):
+            while time.perf_counter() < deadline:
+                path = paths[len(samples) % len(paths)]
+                began = time.perf_counter()
+                code = await request(path, cookies[n % len(cookies)])
+                samples.append((time.perf_counter() - began, code))
+
+        async def level():
+            deadline = time.perf_counter() + seconds
+            per_client = [[] for _ in range(concurrency)]
+            await asyncio.gather(*(client(n, deadline, per_client[n]) for n in range(concurrency)))
+            return [s for samples in per_client for s in samples]
+
+        return asyncio.run(level())
+
+    # -------------------------------------------------------------------------------------------
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(c) for c in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of integers.")
+        latency = options["db_latency_ms"] / 1000
+        queries = itertools.count()
+
+        def measure(execute, sql, params, many, context):
+            next(queries)
+            if latency:
+                time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def watch(sender, connection, **kwargs):
+            # every connection either mode opens, on whichever thread it is opened
+            if measure not in connection.execute_wrappers:
+                connection.execute_wrappers.insert(0, measure)
+
+        connection_created.connect(watch, weak=False)
+
+        users, group = self._setup(options)
+        cookies = self._sessions(users)
+        paths = [reverse("chipin:home"), reverse("chipin:group_detail", args=[group.id])]
+        seconds, slo = options["seconds"], options["slo_ms"]
+        self.stdout.write(
+            f"home + group_detail, {options['members']} members, {options['comments']} comments, "
+            f"{options['events']} events, {options['db_latency_ms']:g} ms per query, "
+            f"{options['threads']} WSGI threads, {seconds:g}s per level"
+        )
+        self.stdout.write(
+            f"{'mode':>5} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'q/req':>6} {'errors':>7}"
+        )
+        capacity = {}
+        try:
+            for concurrency in levels:
+                for mode in ("wsgi", "asgi"):
+                    before = next(queries)
+                    if mode == "wsgi":
+                        samples = self._wsgi_level(paths, cookies, concurrency, seconds, options["threads"])
+                    else:
+                        samples = self._asgi_level(paths, cookies, concurrency, seconds)
+                    per_request = (next(queries) - before - 1) / max(len(samples), 1)
+                    latencies = sorted(s[0] for s in samples)
+                    errors = sum(1 for s in samples if s[1] != 200)
+                    p50, p99 = _percentile(latencies, 50) * 1000, _percentile(latencies, 99) * 1000
+                    self.stdout.write(
+                        f"{mode:>5} {concurrency:>5} {len(samples) / seconds:>8.1f} {p50:>8.1f} {p99:>8.1f} {per_request:>6.0f} {errors:>7}"
+                    )
+                    if p99 <= slo and not errors:
+                        capacity[mode] = concurrency
+        finally:
+            connection_created.disconnect(watch)
+            self._teardown(users, cookies)
+        for mode in ("wsgi", "asgi"):
+            self.stdout.write(
+                f"{mode}: served up to {capacity.get(mode, 0)} concurrent client(s) with p99 under {slo:g} ms"
+            )
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from chipin.deletion import purge_group
+from chipin.models import Comment, Group
+from ssa_project.backup import backup_settings, snapshot
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(pct / 100 * len(sorted_values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Post comments from a background thread and report their latency with no backup running, "
+        "during a throttled online backup and during a backup copied in one step. The bench group "
+        "is committed so the backup sees it, and purged again afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comments", type=int, default=100_000, help="Rows padding the database")
+        parser.add_argument("--interval", type=float, default=0.01, help="Seconds between foreground writes")
+        parser.add_argument("--idle-seconds", type=float, default=3.0)
+
+    def _writer(self, group, user, stop, latencies):
+        try:
+            while not stop.is_set():
+                began = time.perf_counter()
+                Comment.objects.create(group=group, user=user, content="posted during the backup")
+                latencies.append(time.perf_counter() - began)
+                time.sleep(self._interval)
+        finally:
+            connections.close_all()
+
+    def _phase(self, group, user, work):
+        stop, latencies = threading.Event(), []
+        writer = threading.Thread(target=self._writer, args=(group, user, stop, latencies))
+        writer.start()
+        try:
+            result = work()
+        finally:
+            stop.set()
+            writer.join()
+        return sorted(latencies), result
+
+    def handle(self, *args, **options):
+        self._interval = options["interval"]
+        user = User.objects.create_user(username=f"bench-backup-{time.monotonic_ns()}")
+        group = Group.objects.create(name="bench-backup", admin=user)
+        group.members.add(user)
+        for start in range(0, options["comments"], 10_000):
+            Comment.objects.bulk_create(
+                Comment(user=user, group=group, content=f"padding comment {i} " * 8)
+                for i in range(start, min(start + 10_000, options["comments"]))
+            )
+        pages = backup_settings()["PAGES_PER_STEP"]
+        directory = tempfile.mkdtemp(prefix="bench-backup-")
+        rows = []
+        try:
+            rows.append(("no backup", *self._phase(group, user, lambda: time.sleep(options["idle_seconds"]))))
+            rows.append((f"{pages} pages/step", *self._phase(
+                group, user, lambda: snapshot(DEFAULT_DB_ALIAS, directory, keep=0)
+            )))
+            rows.append(("one step", *self._phase(
+                group, user, lambda: snapshot(DEFAULT_DB_ALIAS, directory, pages=-1, sleep=0, keep=0)
+            )))
+        finally:
+            os.rmdir(directory)
+            Group.all_objects.filter(id=group.id).update(deleted_at=timezone.now())
+            purge_group(group.id)
+            user.delete()
+
+        self.stdout.write(
+            f"{'backup':>16} {'writes':>7} {'p50':>8} {'p99':>8} {'max':>8} {'took':>7} {'restarts':>8} {'longest step':>13}"
+        )
+        for label, latencies, taken in rows:
+            line = (
+                f"{label:>16} {len(latencies):>7} {_percentile(latencies, 50) * 1000:>6.1f}ms "
+                f"{_percentile(latencies, 99) * 1000:>6.1f}ms {latencies[-1] * 1000 if latencies else 0:>6.1f}ms"
+            )
+            if taken:
+                line += (
+                    f" {taken['seconds']:>6.2f}s {taken['restarts']:>8} "
+                    f"{taken['longest_step'] * 1000:>9.1f}ms"
+                )
+            self.stdout.write(line)
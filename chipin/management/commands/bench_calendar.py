@@ -0,0 +1,70 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from chipin import ical
+from chipin.directory import add_entries
+from chipin.models import Event, Group, MemberDirectory
+
+
+class Command(BaseCommand):
+    help = (
+        "Time a user's calendar feed when it has changed (200, full body) against a poll "
+        "that finds it unchanged (304) (data is rolled back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--groups", type=int, default=50, help="Groups the user belongs to")
+        parser.add_argument("--events", type=int, default=40, help="Upcoming events per group")
+        parser.add_argument("--runs", type=int, default=50)
+
+    def _time(self, client, url, runs, **headers):
+        times = []
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(runs):
+                began = time.perf_counter()
+                response = client.get(url, headers=headers)
+                size = len(b"".join(response.streaming_content)) if response.streaming else len(response.content)
+                times.append(time.perf_counter() - began)
+        times.sort()
+        return response, size, times[len(times) // 2] * 1000, len(ctx.captured_queries) / runs
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        with transaction.atomic():
+            reader = User.objects.create_user(username=f"bench-calendar-{time.monotonic_ns()}")
+            groups = Group.objects.bulk_create(
+                Group(name=f"bench-calendar {i}", admin=reader) for i in range(options["groups"])
+            )
+            Group.members.through.objects.bulk_create(
+                Group.members.through(group_id=g.id, user_id=reader.id) for g in groups
+            )
+            # bulk_create skips the m2m signals that fill the directory
+            add_entries(MemberDirectory.Kind.MEMBER, [(reader.id, g.id) for g in groups])
+            Event.objects.bulk_create(
+                (Event(name=f"bench event {i}", group=g, total_spend=Decimal("25.00"),
+                       date=now + timedelta(days=i, hours=g.id % 24))
+                 for g in groups for i in range(options["events"])),
+                batch_size=2000,
+            )
+            url = reverse("chipin:calendar_feed", args=[ical.token_for(reader)])
+            client = Client(SERVER_NAME="127.0.0.1")
+            response, size, full_ms, full_queries = self._time(client, url, options["runs"])
+            etag = response["ETag"]
+            response, _, cached_ms, cached_queries = self._time(client, url, options["runs"], if_none_match=etag)
+            assert response.status_code == 304
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"user in {options['groups']} groups, {options['groups'] * options['events']} upcoming events"
+        )
+        self.stdout.write(f"changed:   {full_ms:.2f} ms median, {size} bytes, {full_queries:.0f} queries")
+        self.stdout.write(f"unchanged: {cached_ms:.2f} ms median, 304, {cached_queries:.0f} queries")
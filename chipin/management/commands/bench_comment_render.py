@@ -0,0 +1,81 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import engines
+
+from chipin.directory import add_entries
+from chipin.markup import mentionable_in, mentioned_names, render_all, render_comment
+from chipin.models import Comment, Group, MemberDirectory
+
+PAGE = engines["django"].from_string(
+    "{% for comment in comments %}<p><strong>{{ comment.user_id }}</strong>: "
+    "{% if comment.content_html %}{{ comment.content_html|safe }}{% else %}{{ comment.content }}{% endif %}"
+    "</p>{% endfor %}"
+)
+
+SNIPPETS = [
+    "**bring** the tent, I've got the _stove_",
+    "see https://example.com/trip?id=42&day=3 for the route",
+    "who's in for `dinner` on friday?",
+    "[booking](https://example.com/b/991) is done, thanks @{name}!",
+    "plain text with <angle brackets> & ampersands",
+    "*totally* fine\nsecond line",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering a page of comments from stored HTML against rendering their markup on "
+        "every read (data is rolled back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comments", type=int, default=5000)
+        parser.add_argument("--page-size", type=int, default=50)
+        parser.add_argument("--pages", type=int, default=50)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            stamp = time.monotonic_ns()
+            users = User.objects.bulk_create(User(username=f"bench-markup-{i}-{stamp}") for i in range(5))
+            group = Group.objects.create(name="bench-markup", admin=users[0])
+            Group.members.through.objects.bulk_create(
+                Group.members.through(group_id=group.id, user_id=u.id) for u in users
+            )
+            # bulk_create skips the m2m signals that fill the directory
+            add_entries(MemberDirectory.Kind.MEMBER, [(u.id, group.id) for u in users])
+            Comment.objects.bulk_create(
+                Comment(user=rng.choice(users), group=group,
+                        content=rng.choice(SNIPPETS).format(name=rng.choice(users).username))
+                for _ in range(options["comments"])
+            )
+            began = time.perf_counter()
+            rendered = render_all(group._state.db)
+            write_time = (time.perf_counter() - began) / rendered
+
+            size = options["page_size"]
+            pages = [
+                list(group.comments.order_by("-id")[start:start + size])
+                for start in (rng.randrange(options["comments"] - size) for _ in range(options["pages"]))
+            ]
+            began = time.perf_counter()
+            for page in pages:
+                PAGE.render({"comments": page})
+            stored = (time.perf_counter() - began) / len(pages)
+
+            began = time.perf_counter()
+            for page in pages:
+                for comment in page:
+                    names = mentionable_in(group.id, mentioned_names(comment.content))
+                    comment.content_html = render_comment(comment.content, names)
+                PAGE.render({"comments": page})
+            on_read = (time.perf_counter() - began) / len(pages)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"{rendered} comments rendered at {write_time * 1e6:.0f} us each on write")
+        self.stdout.write(f"page of {size} from stored HTML: {stored * 1000:.2f} ms")
+        self.stdout.write(f"page of {size} rendered on read: {on_read * 1000:.2f} ms")
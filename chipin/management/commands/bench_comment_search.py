@@ -0,0 +1,74 @@
+import random
+import time
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from chipin import search
+from chipin.models import Group, Comment
+
+
+class Command(BaseCommand):
+    help = "Compare FTS5 comment search with the icontains fallback on a large chat history (data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comments", type=int, default=1_000_000)
+        parser.add_argument("--groups", type=int, default=100)
+        parser.add_argument("--queries", type=int, default=20)
+
+    def _build(self, options, rng):
+        user = User.objects.create(username=f"bench-search-{time.monotonic_ns()}")
+        groups = Group.objects.bulk_create(
+            Group(name=f"bench-search-{i}", admin=user) for i in range(options["groups"])
+        )
+        # a Zipf-ish vocabulary so some words are everywhere and some are rare
+        vocabulary = [f"w{i}" for i in range(5000)]
+        weights = [1 / (i + 1) for i in range(len(vocabulary))]
+        for start in range(0, options["comments"], 20_000):
+            count = min(20_000, options["comments"] - start)
+            words = rng.choices(vocabulary, weights, k=count * 12)
+            Comment.objects.bulk_create(
+                Comment(user=user, group=groups[i % len(groups)], content=" ".join(words[i * 12:(i + 1) * 12]))
+                for i in range(count)
+            )
+        return groups, vocabulary
+
+    def _time(self, groups, queries):
+        began = time.perf_counter()
+        found = 0
+        for group, query in zip(groups, queries):
+            found += len(search.search_comments(group.id, query)[0])
+        return (time.perf_counter() - began) / len(queries), found
+
+    def handle(self, *args, **options):
+        if not search.create_index():
+            raise CommandError("This database has no FTS5 support.")
+        rng = random.Random(0)
+        with transaction.atomic():
+            began = time.perf_counter()
+            groups, vocabulary = self._build(options, rng)
+            load = time.perf_counter() - began
+            began = time.perf_counter()
+            # nothing else writes while the bench loads, so no pauses between chunks
+            search.rebuild_index(pause=0)
+            index = time.perf_counter() - began
+            self.stdout.write(f"{options['comments']} comments in {options['groups']} groups: "
+                              f"load {load:.1f} s, index {index:.1f} s")
+
+            sample = [rng.choice(groups) for _ in range(options["queries"])]
+            for label, terms in (
+                ("common word", [vocabulary[rng.randrange(5)] for _ in sample]),
+                ("rare word", [vocabulary[rng.randrange(2000, 5000)] for _ in sample]),
+                ("two words", [f"{vocabulary[rng.randrange(50)]} {vocabulary[rng.randrange(50)]}" for _ in sample]),
+                ("prefix", [f"w{rng.randrange(10, 99)}*" for _ in sample]),
+            ):
+                fts, fts_found = self._time(sample, terms)
+                with mock.patch("chipin.search.fts_enabled", return_value=False):
+                    scan, scan_found = self._time(sample, terms)
+                self.stdout.write(
+                    f"{label:<12} fts {fts * 1000:8.2f} ms/query ({fts_found} hits)   "
+                    f"icontains {scan * 1000:8.2f} ms/query ({scan_found} hits)"
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,114 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from chipin.affordability import AffordabilityMatrix
+from chipin.directory import add_entries
+from chipin.feed import FEED_PAGE_SIZE, joinable_events, parse_cursor, stored_share
+from chipin.models import Event, Group, MemberDirectory
+from users.models import Profile
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the cross-group event feed for a user in many groups against working affordability "
+        "out group by group (data is rolled back)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--groups", type=int, default=300, help="Groups the user belongs to")
+        parser.add_argument("--other-groups", type=int, default=1000, help="Groups the user is not in")
+        parser.add_argument("--events", type=int, default=10, help="Events per group")
+        parser.add_argument("--members", type=int, default=5, help="Members per group")
+        parser.add_argument("--pages", type=int, default=5)
+        parser.add_argument("--runs", type=int, default=5)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        now = timezone.now()
+        with transaction.atomic():
+            stamp = time.monotonic_ns()
+            users = User.objects.bulk_create(
+                User(username=f"bench-feed-{i}-{stamp}") for i in range(options["members"])
+            )
+            Profile.objects.bulk_create(Profile(user=u, nickname=u.username[:30]) for u in users)
+            reader = users[0]
+            groups = Group.objects.bulk_create(
+                Group(name=f"bench-feed {i}", admin=reader)
+                for i in range(options["groups"] + options["other_groups"])
+            )
+            mine = groups[:options["groups"]]
+            mine_ids = {g.id for g in mine}
+            Group.members.through.objects.bulk_create(
+                Group.members.through(group_id=g.id, user_id=u.id) for g in groups for u in users
+                if g.id in mine_ids or u is not reader
+            )
+            # bulk_create skips the m2m signals that fill the directory
+            add_entries(MemberDirectory.Kind.MEMBER, [
+                (u.id, g.id) for g in groups for u in users if g.id in mine_ids or u is not reader
+            ])
+            events = []
+            for g in groups:
+                count = options["members"] if g.id in mine_ids else options["members"] - 1
+                for i in range(options["events"]):
+                    total = Decimal(rng.randrange(500, 50_000)) / 100
+                    status = rng.choice([Event.Status.PENDING, Event.Status.ACTIVE, Event.Status.ARCHIVED])
+                    events.append(Event(
+                        name=f"bench event {i}", group=g, total_spend=total, status=status,
+                        date=now + timedelta(days=rng.randrange(-30, 90), seconds=rng.randrange(86_400)),
+                        share=stored_share(total, count),
+                    ))
+            Event.objects.bulk_create(events, batch_size=2000)
+            max_spend = Profile.objects.get(user=reader).max_spend
+
+            # the first --pages pages, walked --runs times
+            page_times = []
+            for _ in range(options["runs"]):
+                after = None
+                with CaptureQueriesContext(connection) as ctx:
+                    for _ in range(options["pages"]):
+                        began = time.perf_counter()
+                        page, next_cursor = joinable_events(reader, max_spend, after=after)
+                        page_times.append(time.perf_counter() - began)
+                        if next_cursor is None:
+                            break
+                        after = parse_cursor(next_cursor)
+            pages = len(ctx.captured_queries)
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + ctx.captured_queries[0]["sql"])
+                plan = " | ".join(row[-1] for row in cursor.fetchall())
+
+            # the way it worked before: every group's page computed affordability on its own
+            began = time.perf_counter()
+            with CaptureQueriesContext(connection) as per_group:
+                found = []
+                for g in mine:
+                    open_events = list(g.events.exclude(status=Event.Status.ARCHIVED).filter(date__gte=now))
+                    matrix = AffordabilityMatrix.for_group(g, events=open_events)
+                    eligible = matrix.eligible_for(reader.id, max_spend=max_spend)
+                    found += [e for e, ok in zip(open_events, eligible) if ok]
+            per_group_time = time.perf_counter() - began
+            transaction.set_rollback(True)
+
+        page_times.sort()
+        self.stdout.write(
+            f"user in {options['groups']} groups ({options['groups'] * options['events']} events), "
+            f"{options['other_groups']} other groups, max spend ${max_spend}"
+        )
+        self.stdout.write(
+            f"feed: {page_times[len(page_times) // 2] * 1000:.2f} ms median, "
+            f"{page_times[-1] * 1000:.2f} ms slowest per page of {FEED_PAGE_SIZE}; "
+            f"{pages} queries for {pages} pages"
+        )
+        self.stdout.write(f"plan: {plan}")
+        self.stdout.write(
+            f"group by group: {per_group_time * 1000:.1f} ms, {len(per_group.captured_queries)} queries "
+            f"for all {len(found)} matching events"
+        )
@@ -0,0 +1,61 @@
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from users.exports import export_stream, TRANSACTION_EXPORT_FIELDS
+from users.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Benchmark streaming export of a large ledger (data is rolled back afterwards)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+        parser.add_argument("--gzip", action="store_true")
+        parser.add_argument("--memory", action="store_true", help="Also run a traced pass to report peak memory (slow)")
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        with transaction.atomic():
+            user = User.objects.create_user(username="bench-export-user")
+            self.stdout.write(f"Inserting {rows} transactions...")
+            batch = 10_000
+            for start in range(0, rows, batch):
+                Transaction.objects.bulk_create(
+                    Transaction(user=user, amount=Decimal("1.00"), description=f"bench {i}")
+                    for i in range(start, min(start + batch, rows))
+                )
+
+            def run():
+                total = 0
+                for chunk in export_stream(
+                    Transaction.objects.filter(user=user), TRANSACTION_EXPORT_FIELDS,
+                    fmt=options["format"], gzip=options["gzip"],
+                ):
+                    total += len(chunk)
+                return total
+
+            began = time.perf_counter()
+            total_bytes = run()
+            elapsed = time.perf_counter() - began
+
+            peak = None
+            if options["memory"]:
+                tracemalloc.start()
+                run()
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"Exported {rows} rows ({total_bytes / 1e6:.1f} MB) in {elapsed:.2f}s "
+            f"({rows / elapsed:,.0f} rows/s)"
+        )
+        if peak is not None:
+            self.stdout.write(f"Peak Python memory while streaming: {peak / 1e6:.2f} MB")
@@ -0,0 +1,70 @@
+import time
+import tracemalloc
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from chipin.deletion import purge_group
+from chipin.models import Group, Comment, Event
+
+
+class Command(BaseCommand):
+    help = "Compare Group.delete() with the chunked purge on a large group (data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--comments", type=int, default=100_000)
+        parser.add_argument("--events", type=int, default=200)
+        parser.add_argument("--members", type=int, default=200)
+
+    def _build(self, options):
+        users = User.objects.bulk_create(
+            User(username=f"bench-del-{i}-{time.monotonic_ns()}") for i in range(options["members"])
+        )
+        group = Group.objects.create(name="bench-del", admin=users[0])
+        group.members.add(*users)
+        now = timezone.now()
+        events = Event.objects.bulk_create(
+            Event(name=f"e{i}", date=now, total_spend=Decimal("10.00"), group=group)
+            for i in range(options["events"])
+        )
+        Event.members.through.objects.bulk_create(
+            Event.members.through(event_id=e.id, user_id=u.id) for e in events for u in users[:20]
+        )
+        for start in range(0, options["comments"], 10_000):
+            Comment.objects.bulk_create(
+                Comment(user=users[i % len(users)], group=group, content=f"comment {i}")
+                for i in range(start, min(start + 10_000, options["comments"]))
+            )
+        return group
+
+    def _measure(self, fn):
+        tracemalloc.start()
+        began = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - began
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return elapsed, peak, result
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            sid = transaction.savepoint()
+            group = self._build(options)
+            cascade = self._measure(group.delete)
+            transaction.savepoint_rollback(sid)
+
+            group = self._build(options)
+            Group.all_objects.filter(id=group.id).update(deleted_at=timezone.now())
+            chunked = self._measure(lambda: purge_group(group.id))
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"Group.delete():  {cascade[0]:.2f}s in one transaction, peak memory {cascade[1] / 1e6:.1f} MB"
+        )
+        self.stdout.write(
+            f"chunked purge:   {chunked[0]:.2f}s, longest chunk {chunked[2][1] * 1000:.1f} ms, "
+            f"peak memory {chunked[1] / 1e6:.1f} MB"
+        )
@@ -0,0 +1,55 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from chipin.inbox import FANOUT_BATCH_SIZE, fan_out, unread_counts
+from chipin.directory import add_entries
+from chipin.models import Group, InboxItem, MemberDirectory
+
+
+class Command(BaseCommand):
+    help = "Time inbox fan-out for one activity in a large group (data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=10_000)
+        parser.add_argument("--activities", type=int, default=5)
+        parser.add_argument("--batch-size", type=int, default=FANOUT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stamp = time.monotonic_ns()
+            users = User.objects.bulk_create(
+                User(username=f"bench-inbox-{i}-{stamp}") for i in range(options["members"])
+            )
+            group = Group.objects.create(name="bench-inbox", admin=users[0])
+            Group.members.through.objects.bulk_create(
+                Group.members.through(group_id=group.id, user_id=u.id) for u in users
+            )
+            # bulk_create skips the m2m signals that fill the directory
+            add_entries(MemberDirectory.Kind.MEMBER, [(u.id, group.id) for u in users])
+            timings = []
+            for i in range(options["activities"]):
+                with CaptureQueriesContext(connection) as ctx:
+                    began = time.perf_counter()
+                    fan_out(group, InboxItem.Kind.COMMENT, f"activity {i}", actor=users[0],
+                            batch_size=options["batch_size"])
+                    timings.append(time.perf_counter() - began)
+            with CaptureQueriesContext(connection) as read:
+                began = time.perf_counter()
+                counts = unread_counts(users[-1])
+                read_time = time.perf_counter() - began
+            transaction.set_rollback(True)
+
+        first, rest = timings[0], timings[1:] or timings
+        self.stdout.write(f"{options['members']} members, batch size {options['batch_size']}")
+        self.stdout.write(f"first fan-out (creates counters): {first * 1000:.1f} ms")
+        self.stdout.write(
+            f"later fan-outs: {sum(rest) / len(rest) * 1000:.1f} ms each, {len(ctx.captured_queries)} queries, "
+            f"{(options['members'] - 1) / (sum(rest) / len(rest)):.0f} recipients/s"
+        )
+        self.stdout.write(
+            f"home unread counts: {read_time * 1000:.2f} ms, {len(read.captured_queries)} query, {counts}"
+        )
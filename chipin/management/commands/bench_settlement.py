@@ -0,0 +1,81 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from chipin.models import Group, Event
+from chipin.settlement import settle_event, settle_events_netted
+from users.models import Profile, Transaction
+
+WRITE_VERBS = ("INSERT", "UPDATE", "DELETE")
+
+
+class Command(BaseCommand):
+    help = "Compare per-event settlement with netted settlement of the same events (data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--members", type=int, default=50)
+        parser.add_argument("--events", type=int, default=200)
+        parser.add_argument("--joined", type=float, default=0.5, help="Fraction of members joining each event")
+
+    def _build(self, options, rng):
+        stamp = time.monotonic_ns()
+        users = User.objects.bulk_create(
+            User(username=f"bench-settle-{i}-{stamp}") for i in range(options["members"])
+        )
+        Profile.objects.bulk_create(
+            Profile(user=u, nickname=f"bench-settle-{u.id}", balance=Decimal("100000.00")) for u in users
+        )
+        group = Group.objects.create(name="bench-settle", admin=users[0])
+        group.members.add(*users)
+        now = timezone.now()
+        events = Event.objects.bulk_create(
+            Event(name=f"e{i}", date=now, group=group, status=Event.Status.ACTIVE,
+                  total_spend=Decimal(rng.randint(10, 500)))
+            for i in range(options["events"])
+        )
+        size = max(1, int(len(users) * options["joined"]))
+        Event.members.through.objects.bulk_create(
+            Event.members.through(event_id=e.id, user_id=u.id) for e in events for u in rng.sample(users, size)
+        )
+        return group, [u.id for u in users]
+
+    def _run(self, fn):
+        before = Transaction.objects.count()
+        with CaptureQueriesContext(connection) as ctx:
+            began = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - began
+        writes = sum(1 for q in ctx.captured_queries if q["sql"].lstrip().upper().startswith(WRITE_VERBS))
+        return elapsed, len(ctx.captured_queries), writes, Transaction.objects.count() - before
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        with transaction.atomic():
+            sid = transaction.savepoint()
+            group, user_ids = self._build(options, rng)
+            per_event = self._run(lambda: [
+                settle_event(event)
+                for event in Event.objects.filter(group=group).select_related("group__admin").order_by("date", "id")
+            ])
+            expected = dict(Profile.objects.filter(user_id__in=user_ids).values_list("user_id", "balance"))
+            transaction.savepoint_rollback(sid)
+
+            group, user_ids = self._build(options, random.Random(0))
+            netted = self._run(lambda: settle_events_netted(group))
+            actual = dict(Profile.objects.filter(user_id__in=user_ids).values_list("user_id", "balance"))
+            transaction.set_rollback(True)
+
+        # users are created in the same order both times, so compare balances position by position
+        drift = max(abs(actual[a] - expected[e]) for a, e in zip(sorted(actual), sorted(expected)))
+        self.stdout.write(f"{options['members']} members, {options['events']} events")
+        for label, (elapsed, queries, writes, rows) in (("per-event", per_event), ("netted", netted)):
+            self.stdout.write(
+                f"{label:<10} {elapsed * 1000:8.1f} ms  {queries:6} queries  {writes:6} writes  {rows:6} ledger rows"
+            )
+        self.stdout.write(f"largest balance difference between the two: {drift}")
@@ -0,0 +1,119 @@
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# creates the bench user and groups_per_shard groups on every shard
+SETUP = r"""
+import sys
+import django
+django.setup()
+from django.contrib.auth.models import User
+from chipin.models import Group
+from chipin.sharding import shard_aliases
+
+user = User.objects.create_user(username="bench-shard")
+for alias in shard_aliases():
+    for i in range(int(sys.argv[1])):
+        group = Group(name=f"bench {alias} {i}", admin=user)
+        group.save(using=alias)
+        group.members.add(user)
+"""
+
+# one writer process: posts comments to random groups, one transaction each
+WORKER = r"""
+import json, random, sys, time
+import django
+django.setup()
+from django.contrib.auth.models import User
+from django.db import OperationalError, transaction
+from chipin.models import Comment, Group
+from chipin.sharding import across_shards
+
+start, seconds, seed = float(sys.argv[1]), float(sys.argv[2]), int(sys.argv[3])
+rng = random.Random(seed)
+user = User.objects.get(username="bench-shard")
+groups = across_shards(Group.objects.all())
+while time.time() < start:
+    time.sleep(0.001)
+writes = errors = 0
+latencies = []
+deadline = start + seconds
+while time.time() < deadline:
+    group = rng.choice(groups)
+    began = time.perf_counter()
+    try:
+        with transaction.atomic(using=group._state.db):
+            Comment(group=group, user=user, content=f"bench comment {writes}").save()
+    except OperationalError:
+        # database is locked: the busy timeout ran out behind other writers
+        errors += 1
+        continue
+    latencies.append(time.perf_counter() - began)
+    writes += 1
+print(json.dumps({"writes": writes, "errors": errors, "latencies": latencies}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure comment write throughput with 1, 2, 4 ... SQLite shards (settings_sharded), "
+        "using several writer processes against fresh databases in a temporary directory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shards", default="1,2,4", help="Comma-separated shard counts to compare")
+        parser.add_argument("--workers", type=int, default=8, help="Writer processes")
+        parser.add_argument("--seconds", type=float, default=5.0)
+        parser.add_argument("--groups-per-shard", type=int, default=8)
+        parser.add_argument("--dir", help="Where to create the databases (default: a temporary directory)")
+
+    def _run(self, env, *args):
+        result = subprocess.run([sys.executable, *args], env=env, cwd=settings.BASE_DIR,
+                                capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        return result.stdout
+
+    def handle(self, *args, **options):
+        workers, seconds = options["workers"], options["seconds"]
+        self.stdout.write(f"{workers} writer process(es), {seconds:g}s per run")
+        self.stdout.write(f"{'shards':>6} {'writes/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'locked':>7} {'speed-up':>9}")
+        baseline = None
+        for count in [int(n) for n in options["shards"].split(",")]:
+            root = tempfile.mkdtemp(prefix="bench-shards-", dir=options["dir"])
+            env = {
+                **os.environ,
+                "DJANGO_SETTINGS_MODULE": "ssa_project.settings_sharded",
+                "DJANGO_SHARD_DIR": root,
+                "DJANGO_SHARD_COUNT": str(count),
+            }
+            try:
+                self._run(env, "manage.py", "migrate_shards", "--verbosity", "0")
+                self._run(env, "-c", SETUP, str(options["groups_per_shard"]))
+                # every worker starts writing at the same moment, after django.setup()
+                start = time.time() + 3
+                procs = [
+                    subprocess.Popen([sys.executable, "-c", WORKER, str(start), str(seconds), str(seed)],
+                                     env=env, cwd=settings.BASE_DIR, stdout=subprocess.PIPE, text=True)
+                    for seed in range(workers)
+                ]
+                results = [json.loads(proc.communicate()[0].strip().splitlines()[-1]) for proc in procs]
+            finally:
+                shutil.rmtree(root, ignore_errors=True)
+            writes = sum(r["writes"] for r in results)
+            errors = sum(r["errors"] for r in results)
+            latencies = sorted(t for r in results for t in r["latencies"])
+            rate = writes / seconds
+            baseline = baseline or rate
+            p50 = latencies[len(latencies) // 2] * 1000 if latencies else 0
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+            self.stdout.write(
+                f"{count:>6} {rate:>10.0f} {p50:>8.2f} {p99:>8.2f} {errors:>7} {rate / baseline:>8.2f}x"
+            )
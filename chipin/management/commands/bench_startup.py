@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# runs in a fresh interpreter per settings module so nothing is warm beforehand
+PROBE = r"""
+import io, json, os, sys, time
+began = time.perf_counter()
+from ssa_project.wsgi import application
+startup = time.perf_counter() - began
+
+from django.template.loader import get_template
+from django.test import RequestFactory
+
+def get(path):
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": "",
+        "SERVER_NAME": "127.0.0.1", "SERVER_PORT": "8000", "REMOTE_ADDR": "127.0.0.1",
+        "SERVER_PROTOCOL": "HTTP/1.1", "wsgi.input": io.BytesIO(), "wsgi.errors": sys.stderr,
+        "wsgi.url_scheme": "http", "wsgi.version": (1, 0), "wsgi.multithread": True,
+        "wsgi.multiprocess": True, "wsgi.run_once": False,
+    }
+    status = []
+    began = time.perf_counter()
+    body = b"".join(application(environ, lambda s, h, *a: status.append(s)))
+    elapsed = time.perf_counter() - began
+    if not status[0].startswith("200"):
+        raise SystemExit(f"GET {path} returned {status[0]}: {body[:300]!r}")
+    return elapsed
+
+path, requests = sys.argv[1], int(sys.argv[2])
+first = get(path)
+steady = sorted(get(path) for _ in range(requests))
+
+request = RequestFactory().get(path)
+renders = []
+for _ in range(requests):
+    began = time.perf_counter()
+    get_template("users/login.html").render({}, request)
+    renders.append(time.perf_counter() - began)
+
+print(json.dumps({
+    "startup_ms": startup * 1000,
+    "first_request_ms": first * 1000,
+    "median_request_ms": steady[len(steady) // 2] * 1000,
+    "median_template_ms": sorted(renders)[len(renders) // 2] * 1000,
+}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure process start-up, time to first request and per-request template time for each "
+        "settings module, each in a fresh interpreter. Production settings need `build_static` first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--settings-modules", default="ssa_project.settings,ssa_project.settings_production")
+        parser.add_argument("--path", default="/users/login/", help="Page to request (no database access needed)")
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--runs", type=int, default=5, help="Fresh processes per settings module")
+
+    def handle(self, *args, **options):
+        columns = ("startup_ms", "first_request_ms", "median_request_ms", "median_template_ms")
+        self.stdout.write(f"{'settings':<32}" + "".join(f"{c:>20}" for c in columns))
+        for module in options["settings_modules"].split(","):
+            env = {**os.environ, "DJANGO_SETTINGS_MODULE": module}
+            runs = []
+            for _ in range(options["runs"]):
+                probe = subprocess.run(
+                    [sys.executable, "-c", PROBE, options["path"], str(options["requests"])],
+                    env=env, cwd=settings.BASE_DIR, capture_output=True, text=True,
+                )
+                if probe.returncode:
+                    raise CommandError(f"{module}: {probe.stderr.strip().splitlines()[-1]}")
+                runs.append(json.loads(probe.stdout.strip().splitlines()[-1]))
+            # median over runs of each figure
+            row = {c: sorted(r[c] for r in runs)[len(runs) // 2] for c in columns}
+            self.stdout.write(f"{module:<32}" + "".join(f"{row[c]:>20.2f}" for c in columns))
@@ -0,0 +1,86 @@
+import gzip
+import io
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import ManifestFilesMixin, staticfiles_storage
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    import brotli
+except ImportError:  # brotli variants are skipped without it
+    brotli = None
+
+try:
+    from PIL import Image
+except ImportError:  # WebP variants are skipped without Pillow
+    Image = None
+
+COMPRESSIBLE = {".css", ".js", ".svg", ".txt", ".json", ".map", ".html", ".xml", ".ico"}
+
+
+class Command(BaseCommand):
+    help = "Collect static files with hashed names, add WebP logo variants and precompress everything."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--skip-collect", action="store_true", help="Reuse an existing STATIC_ROOT")
+
+    def handle(self, *args, **options):
+        if not isinstance(staticfiles_storage, ManifestFilesMixin):
+            raise CommandError("build_static needs a manifest staticfiles storage (run with --settings=ssa_project.settings_production).")
+        if not options["skip_collect"]:
+            call_command("collectstatic", interactive=False, verbosity=0)
+        self._render_webp()
+        written = self._compress(settings.STATIC_ROOT)
+        self.stdout.write(self.style.SUCCESS(f"Static build complete: {written} precompressed file(s)."))
+
+    def _render_webp(self):
+        if Image is None:
+            self.stderr.write("Pillow is not installed; skipping WebP variants.")
+            return
+        storage = staticfiles_storage
+        for source, variants in getattr(settings, "STATIC_IMAGE_VARIANTS", {}).items():
+            path = finders.find(source)
+            if not path:
+                self.stderr.write(f"{source} not found; skipping.")
+                continue
+            with Image.open(path) as original:
+                original = original.convert("RGB")
+                for name, height in variants:
+                    width = round(original.width * height / original.height)
+                    buf = io.BytesIO()
+                    original.resize((width, height), Image.LANCZOS).save(buf, "WEBP", quality=85, method=6)
+                    content = ContentFile(buf.getvalue())
+                    hashed = storage.hashed_name(name, content)
+                    for target in (name, hashed):
+                        if storage.exists(target):
+                            storage.delete(target)
+                        storage.save(target, content)
+                    storage.hashed_files[storage.hash_key(storage.clean_name(name))] = hashed
+                    self.stdout.write(f"{source} -> {hashed} ({width}x{height})")
+        storage.save_manifest()
+
+    def _compress(self, root):
+        written = 0
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if os.path.splitext(filename)[1] not in COMPRESSIBLE:
+                    continue
+                path = os.path.join(dirpath, filename)
+                with open(path, "rb") as f:
+                    data = f.read()
+                variants = [(".gz", gzip.compress(data, compresslevel=9, mtime=0))]
+                if brotli is not None:
+                    variants.append((".br", brotli.compress(data, quality=11)))
+                for suffix, packed in variants:
+                    # keep only variants that are actually smaller
+                    if len(packed) < len(data):
+                        with open(path + suffix, "wb") as f:
+                            f.write(packed)
+                        written += 1
+        if brotli is None:
+            self.stderr.write("brotli is not installed; only gzip variants were written.")
+        return written
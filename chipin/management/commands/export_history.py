@@ -0,0 +1,47 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chipin.models import Comment
+from chipin.views import COMMENT_EXPORT_FIELDS
+from users.exports import export_stream, EXPORT_CHUNK_SIZE, TRANSACTION_EXPORT_FIELDS
+from users.models import Transaction
+
+
+class Command(BaseCommand):
+    help = "Stream a user's transaction ledger or a group's chat history to csv/jsonl."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["transactions", "comments"])
+        parser.add_argument("--user", type=int, help="User id (transactions only; omit for all users)")
+        parser.add_argument("--group", type=int, help="Group id (required for comments)")
+        parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+        parser.add_argument("--gzip", action="store_true", help="Compress the output on the fly")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE)
+        parser.add_argument("-o", "--output", help="Output file (default: stdout)")
+
+    def handle(self, *args, **options):
+        if options["kind"] == "transactions":
+            queryset = Transaction.objects.all()
+            if options["user"]:
+                queryset = queryset.filter(user_id=options["user"])
+            fields = TRANSACTION_EXPORT_FIELDS
+        else:
+            if not options["group"]:
+                raise CommandError("--group is required when exporting comments.")
+            queryset = Comment.objects.filter(group_id=options["group"])
+            fields = COMMENT_EXPORT_FIELDS
+
+        chunks = export_stream(
+            queryset, fields,
+            fmt=options["format"], gzip=options["gzip"], chunk_size=options["chunk_size"],
+        )
+        out = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if options["output"]:
+                out.close()
+            else:
+                out.flush()
@@ -0,0 +1,345 @@
+import http.client
+import json
+import random
+import re
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from chipin.deletion import purge_group
+from chipin.models import Group, Event
+from users.backends import invalidate_users
+
+USER_PREFIX = "loadtest-"
+
+# flow name -> relative weight in the mix
+FLOWS = {
+    "home": 30,
+    "group_detail": 25,
+    "post_comment": 10,
+    "join_leave_event": 10,
+    "top_up": 8,
+    "login": 5,
+    "transfer_funds": 2,
+}
+
+
+class _StubRecaptcha(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        body = b'{"success": true, "score": 0.9}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _HttpClient:
+    """One keep-alive connection with a cookie jar; redirects are not followed."""
+
+    def __init__(self, base_url, cookies=None):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.cookies = dict(cookies or {})
+        self.conn = None
+
+    def request(self, method, path, data=None):
+        headers = {}
+        if self.cookies:
+            headers["Cookie"] = "; ".join(f"{k}={v}" for k, v in self.cookies.items())
+        body = None
+        if data is not None:
+            if "csrftoken" in self.cookies:
+                data = {"csrfmiddlewaretoken": self.cookies["csrftoken"], **data}
+            body = urlencode(data)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                payload = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # server closed the keep-alive connection; retry once on a new one
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        for header in response.msg.get_all("Set-Cookie") or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return response.status, payload
+
+
+class _VirtualUser:
+    def __init__(self, base_url, user, password, sessions, group, events, rng):
+        # sessions maps user id -> session cookie; the group admin's is used for transfers
+        self.client = _HttpClient(base_url, {settings.SESSION_COOKIE_NAME: sessions[user.id]})
+        self.admin_client = _HttpClient(base_url, {settings.SESSION_COOKIE_NAME: sessions[group.admin_id]})
+        self.base_url = base_url
+        self.user, self.password, self.group, self.events, self.rng = user, password, group, events, rng
+
+    def _ensure_csrf(self, client):
+        if "csrftoken" not in client.cookies:
+            client.request("GET", reverse("chipin:group_detail", args=[self.group.id]))
+
+    def home(self):
+        return [self.client.request("GET", reverse("chipin:home"))]
+
+    def group_detail(self):
+        return [self.client.request("GET", reverse("chipin:group_detail", args=[self.group.id]))]
+
+    def post_comment(self):
+        self._ensure_csrf(self.client)
+        url = reverse("chipin:group_detail", args=[self.group.id])
+        return [self.client.request("POST", url, {"content": f"load test {self.rng.random():.6f}"})]
+
+    def join_leave_event(self):
+        event = self.rng.choice(self.events)
+        args = [self.group.id, event]
+        return [
+            self.client.request("GET", reverse("chipin:join_event", args=args)),
+            self.client.request("GET", reverse("chipin:leave_event", args=args)),
+        ]
+
+    def top_up(self):
+        self._ensure_csrf(self.client)
+        return [self.client.request("POST", reverse("users:top_up"), {"amount": "1.00"})]
+
+    def login(self):
+        # a fresh anonymous client going through the whole login form
+        client = _HttpClient(self.base_url)
+        status, page = client.request("GET", reverse("users:login"))
+        if status != 200:
+            return [(status, page)]
+        nonce = re.search(rb'name="hp_nonce" value="([^"]+)"', page).group(1).decode()
+        return [(status, page), client.request("POST", reverse("users:login"), {
+            "hp_nonce": nonce,
+            "elapsed": "3.0",
+            "recaptcha-token": "loadtest",
+            "username": self.user.username,
+            "password": self.password,
+        })]
+
+    def transfer_funds(self):
+        self._ensure_csrf(self.admin_client)
+        event = Event.objects.create(
+            name=f"loadtest transfer {self.rng.random():.6f}", date=timezone.now(),
+            total_spend=Decimal("1.00"), group=self.group,
+        )
+        return [self.admin_client.request(
+            "POST", reverse("chipin:transfer_funds", args=[self.group.id, event.id]), {}
+        )]
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _summarise(samples, elapsed):
+    latencies = sorted(s[1] for s in samples)
+    errors = sum(1 for s in samples if s[2] == 0 or (s[2] >= 400 and s[2] != 429))
+    throttled = sum(1 for s in samples if s[2] == 429)
+    return {
+        "requests": len(samples),
+        "throughput": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "throttled": throttled,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a weighted mix of ChipIn flows against a running server and report "
+        "throughput, latency percentiles and error rates per concurrency level. The accounts, "
+        "group and events it needs are created in the configured database with a password "
+        "made up for the run, and deleted again at the end; it only runs with DEBUG on or "
+        "--allow-db. Start the server with the loadtest settings, whose reCAPTCHA verifier "
+        "is the stub on --stub-port, e.g. "
+        "DJANGO_SETTINGS_MODULE=ssa_project.settings_loadtest gunicorn ssa_project.wsgi -w 4"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+        parser.add_argument("--concurrency", default="1,2,4,8,16",
+                            help="Comma-separated list of concurrent virtual users")
+        parser.add_argument("--duration", type=float, default=15.0, help="Seconds per concurrency level")
+        parser.add_argument("--users", type=int, default=50, help="Accounts to create for the test group")
+        parser.add_argument("--events", type=int, default=5)
+        parser.add_argument("--stub-port", type=int, default=8765, help="Port for the stub reCAPTCHA verifier")
+        parser.add_argument("--label", default="", help="Build label stored with the results (e.g. a git sha)")
+        parser.add_argument("--results-dir", default=str(Path(settings.BASE_DIR) / "loadtest_results"))
+        parser.add_argument("--compare", help="Previous results file to diff against")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--allow-db", action="store_true",
+                            help="Run against the configured database even with DEBUG off")
+
+    def _setup(self, options, password):
+        hashed = make_password(password)
+        existing = set(User.objects.filter(username__startswith=USER_PREFIX).values_list("username", flat=True))
+        names = [f"{USER_PREFIX}{i}@example.com" for i in range(options["users"])]
+        for name in names:
+            if name not in existing:
+                # the post_save signal creates each profile
+                User.objects.create(username=name, email=name, password=hashed)
+        # accounts left by an interrupted run get this run's password
+        stale = User.objects.filter(username__in=existing & set(names))
+        stale.update(password=hashed)
+        invalidate_users(stale.values_list("id", flat=True))
+        users = list(User.objects.filter(username__in=names).order_by("id"))
+        group, _ = Group.objects.get_or_create(name="loadtest", admin=users[0])
+        group.members.add(*users)
+        events = list(group.events.exclude(status=Event.Status.ARCHIVED).values_list("id", flat=True))
+        for i in range(len(events), options["events"]):
+            events.append(Event.objects.create(
+                name=f"loadtest event {i}", date=timezone.now() + timedelta(days=7),
+                total_spend=Decimal("10.00"), group=group,
+            ).id)
+        return users, group, events[:options["events"]]
+
+    def _teardown(self, users, group):
+        Group.all_objects.filter(id=group.id).update(deleted_at=timezone.now())
+        purge_group(group.id)
+        # profiles, sessions' owners and top-up transactions go with the users
+        User.objects.filter(id__in=[u.id for u in users]).delete()
+
+    def _run_level(self, vusers, concurrency, duration, rng):
+        flows, weights = zip(*FLOWS.items())
+        samples = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def worker(vuser, seed):
+            local_rng = random.Random(seed)
+            local = []
+            while time.perf_counter() < deadline:
+                flow = local_rng.choices(flows, weights)[0]
+                began = time.perf_counter()
+                try:
+                    statuses = [status for status, _ in getattr(vuser, flow)()]
+                except Exception:
+                    statuses = [0]
+                elapsed = (time.perf_counter() - began) / len(statuses)
+                local.extend((flow, elapsed, status) for status in statuses)
+            with lock:
+                samples.extend(local)
+
+        threads = [
+            threading.Thread(target=worker, args=(vusers[i % len(vusers)], rng.random()))
+            for i in range(concurrency)
+        ]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+        result = _summarise(samples, elapsed)
+        result["flows"] = {
+            flow: _summarise([s for s in samples if s[0] == flow], elapsed) for flow in flows
+        }
+        return result
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(c) for c in options["concurrency"].split(",")]
+        except ValueError:
+            raise CommandError("--concurrency must be a comma-separated list of integers.")
+        if not settings.DEBUG and not options["allow_db"]:
+            raise CommandError(
+                "loadtest creates and deletes accounts in the configured database; "
+                "run it with DEBUG on, or pass --allow-db if that database is meant for it."
+            )
+        rng = random.Random(options["seed"])
+        password = secrets.token_urlsafe(16)
+        users, group, events = self._setup(options, password)
+        try:
+            report = self._run(options, levels, rng, users, password, group, events)
+        finally:
+            self._teardown(users, group)
+
+        results_dir = Path(options["results_dir"])
+        results_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = results_dir / f"{stamp}{'-' + options['label'] if options['label'] else ''}.json"
+        path.write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"Results written to {path}")
+
+        if options["compare"]:
+            self._compare(json.loads(Path(options["compare"]).read_text()), report)
+
+    def _run(self, options, levels, rng, users, password, group, events):
+        stub = HTTPServer(("127.0.0.1", options["stub_port"]), _StubRecaptcha)
+        threading.Thread(target=stub.serve_forever, daemon=True).start()
+
+        # sessions are minted directly so the login flow is the only one paying for PBKDF2
+        sessions = {}
+        for user in users[:max(levels)] + [group.admin]:
+            client = Client()
+            client.force_login(user)
+            sessions[user.id] = client.cookies[settings.SESSION_COOKIE_NAME].value
+        vusers = [
+            _VirtualUser(options["base_url"], user, password, sessions, group, events, random.Random(rng.random()))
+            for user in users[:max(levels)]
+        ]
+
+        report = {
+            "label": options["label"],
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "base_url": options["base_url"],
+            "duration": options["duration"],
+            "mix": FLOWS,
+            "levels": {},
+        }
+        try:
+            self.stdout.write(f"{'conc':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>8} {'429s':>6}")
+            for concurrency in levels:
+                result = self._run_level(vusers, concurrency, options["duration"], rng)
+                report["levels"][str(concurrency)] = result
+                self.stdout.write(
+                    f"{concurrency:>5} {result['throughput']:>9.1f} {result['p50_ms']:>9.1f} "
+                    f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} "
+                    f"{result['error_rate'] * 100:>7.2f}% {result['throttled']:>6}"
+                )
+        finally:
+            stub.shutdown()
+        return report
+
+    def _compare(self, before, after):
+        self.stdout.write(f"Compared with {before.get('label') or before.get('started_at')}:")
+        for level, result in after["levels"].items():
+            old = before["levels"].get(level)
+            if not old:
+                continue
+            self.stdout.write(
+                f"  c={level}: throughput {result['throughput'] - old['throughput']:+.1f} req/s, "
+                f"p95 {result['p95_ms'] - old['p95_ms']:+.1f} ms, "
+                f"p99 {result['p99_ms'] - old['p99_ms']:+.1f} ms, "
+                f"errors {(result['error_rate'] - old['error_rate']) * 100:+.2f} pts"
+            )
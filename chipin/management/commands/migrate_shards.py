@@ -0,0 +1,36 @@
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from chipin.sharding import replica_aliases, replicate_users, shard_aliases
+
+COPY_CHUNK_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Migrate the default database and every group shard (each shard starts its ids at its own "
+        "range), then copy existing users onto the shards."
+    )
+
+    def handle(self, *args, **options):
+        aliases = [DEFAULT_DB_ALIAS] + [alias for alias in shard_aliases() if alias != DEFAULT_DB_ALIAS]
+        for alias in aliases:
+            connection = connections[alias]
+            if connection.vendor == "sqlite":
+                Path(connection.settings_dict["NAME"]).parent.mkdir(parents=True, exist_ok=True)
+            self.stdout.write(f"Migrating {alias}")
+            call_command("migrate", database=alias, interactive=False,
+                         verbosity=options["verbosity"], stdout=self.stdout)
+        copied, last_id = 0, 0
+        while replica_aliases():
+            users = list(User.objects.filter(id__gt=last_id).order_by("id")[:COPY_CHUNK_SIZE])
+            if not users:
+                break
+            replicate_users(users)
+            copied += len(users)
+            last_id = users[-1].id
+        self.stdout.write(f"Migrated {len(aliases)} database(s); copied {copied} user(s) to the shards.")
@@ -0,0 +1,49 @@
+import glob
+import io
+import json
+import os
+import pstats
+
+from django.core.management.base import BaseCommand
+
+from ssa_project.profiling import profiling_settings
+
+
+class Command(BaseCommand):
+    help = "Aggregate saved request profiles into top functions by cumulative time per view."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Profile directory (default: PROFILING['DIR'])")
+        parser.add_argument("--view", action="append", help="Only report these URL names")
+        parser.add_argument("--limit", type=int, default=15, help="Functions to show per view")
+
+    def handle(self, *args, **options):
+        directory = options["dir"] or str(profiling_settings()["DIR"])
+        by_view = {}
+        for meta_path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+            prof_path = meta_path[:-len(".json")] + ".prof"
+            if not os.path.exists(prof_path):
+                continue
+            with open(meta_path) as f:
+                meta = json.load(f)
+            view = meta.get("url_name") or "unresolved"
+            if options["view"] and view not in options["view"]:
+                continue
+            by_view.setdefault(view, []).append((prof_path, meta["duration_ms"]))
+
+        if not by_view:
+            self.stdout.write(f"No profiles found in {directory}.")
+            return
+
+        for view, entries in sorted(by_view.items()):
+            durations = sorted(d for _, d in entries)
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{view}: {len(entries)} request(s), median {durations[len(durations) // 2]:.1f} ms, "
+                f"max {durations[-1]:.1f} ms"
+            ))
+            out = io.StringIO()
+            stats = pstats.Stats(*(path for path, _ in entries), stream=out)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(options["limit"])
+            # drop pstats' own preamble; keep the table
+            table = out.getvalue()
+            self.stdout.write(table[table.find("   ncalls"):].rstrip() + "\n")
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from chipin.deletion import purge_group, PURGE_CHUNK_SIZE
+from chipin.models import Group
+from chipin.sharding import across_shards
+
+
+class Command(BaseCommand):
+    help = "Finish purging groups marked as deleted (e.g. after a worker was interrupted)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=PURGE_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        ids = across_shards(Group.all_objects.filter(deleted_at__isnull=False).values_list("id", flat=True))
+        for group_id in ids:
+            deleted, longest = purge_group(group_id, chunk_size=options["chunk_size"])
+            self.stdout.write(f"Group {group_id}: {deleted} row(s) deleted, longest chunk {longest * 1000:.1f} ms")
+        self.stdout.write(f"Purged {len(ids)} group(s).")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chipin.search import REBUILD_CHUNK_SIZE, REBUILD_PAUSE, create_index, rebuild_index
+from chipin.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Rebuild the comment full-text index from the comment table (e.g. after bulk loads)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=REBUILD_CHUNK_SIZE)
+        parser.add_argument("--pause", type=float, default=REBUILD_PAUSE, help="Seconds to sleep between chunks")
+
+    def handle(self, *args, **options):
+        if not all(create_index(alias) for alias in shard_aliases()):
+            raise CommandError("This database has no FTS5 support; search uses the icontains fallback.")
+        indexed = 0
+        for alias in shard_aliases():
+            # commits per chunk, so comments can be posted while it runs
+            indexed += rebuild_index(options["chunk_size"], using=alias, pause=options["pause"])
+        self.stdout.write(f"Indexed {indexed} comment(s).")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chipin.markup import RENDER_CHUNK_SIZE, render_all
+from chipin.sharding import shard_aliases
+
+
+class Command(BaseCommand):
+    help = "Store rendered HTML for comments saved without it (e.g. before markup support or by bulk loads)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Re-render every comment, e.g. after the markup rules change")
+        parser.add_argument("--chunk-size", type=int, default=RENDER_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        rendered = 0
+        for alias in shard_aliases():
+            with transaction.atomic(using=alias):
+                rendered += render_all(alias, everything=options["all"], chunk_size=options["chunk_size"])
+        self.stdout.write(f"Rendered {rendered} comment(s).")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from chipin.inbox import INBOX_RETENTION_DAYS, TRIM_BATCH_SIZE, trim_inbox
+
+
+class Command(BaseCommand):
+    help = "Delete inbox items older than the retention window in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=INBOX_RETENTION_DAYS)
+        parser.add_argument("--batch-size", type=int, default=TRIM_BATCH_SIZE)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches")
+
+    def handle(self, *args, **options):
+        deleted = trim_inbox(options["days"], options["batch_size"], options["pause"])
+        self.stdout.write(f"Deleted {deleted} inbox item(s).")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from ssa_project.warmup import warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Compile the chipin and users templates, populate the URL resolver and import lazy "
+        "modules, reporting how long each step takes. wsgi.py/asgi.py do the same at import "
+        "time when WARMUP_ON_IMPORT is set."
+    )
+
+    def handle(self, *args, **options):
+        total = 0.0
+        for step, (items, seconds) in warm_up().items():
+            total += seconds
+            self.stdout.write(f"{step:<10} {items:>4} item(s) {seconds * 1000:>9.1f} ms")
+        self.stdout.write(f"{'total':<10} {'':>12} {total * 1000:>9.1f} ms")
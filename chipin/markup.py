@@ -0,0 +1,122 @@
+"""
+Comment markup.
+
+Comments are written in a small Markdown subset: **bold**, *italic* or
+_italic_, `code`, [text](https://...) links, bare http(s) URLs, @username
+mentions of group members and line breaks. render_comment() escapes the
+source as it goes and only ever writes the tags and attributes listed in
+ALLOWED_TAGS, so there is nothing for a later pass to sanitize. It runs once
+per save (pre_save below) and the result is stored in Comment.content_html,
+which group_detail emits as is. bulk_create/update() skip the signal; run
+``manage.py render_comments`` after bulk loads, and with --all after the
+rules here change.
+"""
+
+import re
+
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save
+from django.dispatch import receiver
+from django.utils.html import escape
+
+from .directory import member_ids
+from .models import Comment
+
+# everything render_comment() can produce
+ALLOWED_TAGS = {
+    "a": {"href", "rel"},
+    "br": set(),
+    "code": set(),
+    "em": set(),
+    "span": {"class"},
+    "strong": set(),
+}
+RENDER_CHUNK_SIZE = 2000
+
+# every variable run stops at its own closing delimiter, so an unclosed "**" or
+# "[" is given up at the next one and matching stays linear in the comment length
+_INLINE = re.compile(
+    r"`(?P<code>[^`\n]+)`"
+    r"|\[(?P<label>[^\[\]\n]+)\]\((?P<href>https?://[^\s()<>\"']+)\)"
+    r"|(?<![\w/])(?P<url>https?://[^\s<>()\[\]\"']*[^\s<>()\[\]\"'.,;:!?])"
+    r"|\*\*(?P<strong>[^*\s](?:[^*\n]*?[^*\s])?)\*\*"
+    r"|(?<![\w*])\*(?P<em>[^*\s](?:[^*\n]*?[^*\s])?)\*(?![\w*])"
+    r"|(?<!\w)_(?P<em_>[^_\s](?:[^_\n]*?[^_\s])?)_(?!\w)"
+    r"|(?<![\w@])@(?P<mention>\w(?:[\w.+-]*\w)?)"
+)
+
+
+def mentioned_names(text):
+    return {m.group("mention") for m in _INLINE.finditer(text) if m.group("mention")}
+
+
+def _link(href, label_html):
+    return f'<a href="{escape(href)}" rel="nofollow noopener">{label_html}</a>'
+
+
+def _inline(text, mentionable):
+    out, pos = [], 0
+    for m in _INLINE.finditer(text):
+        out.append(escape(text[pos:m.start()]))
+        pos = m.end()
+        kind = m.lastgroup
+        if kind == "code":
+            out.append(f"<code>{escape(m.group('code'))}</code>")
+        elif kind == "href":
+            out.append(_link(m.group("href"), _inline(m.group("label"), mentionable)))
+        elif kind == "url":
+            out.append(_link(m.group("url"), escape(m.group("url"))))
+        elif kind == "strong":
+            out.append(f"<strong>{_inline(m.group('strong'), mentionable)}</strong>")
+        elif kind in ("em", "em_"):
+            out.append(f"<em>{_inline(m.group(kind), mentionable)}</em>")
+        elif m.group("mention") in mentionable:
+            out.append(f'<span class="mention">@{escape(m.group("mention"))}</span>')
+        else:
+            out.append(escape(m.group(0)))
+    out.append(escape(text[pos:]))
+    return "".join(out)
+
+
+def render_comment(text, mentionable=frozenset()):
+    """Safe HTML for a comment's source; @names in mentionable become mentions."""
+    lines = text.replace("\r\n", "\n").strip().split("\n")
+    return "<br>".join(_inline(line, mentionable) for line in lines)
+
+
+def mentionable_in(group_id, names):
+    """The names that are usernames of the group's members."""
+    if not names:
+        return set()
+    return set(
+        User.objects.filter(id__in=member_ids(group_id), username__in=names).values_list("username", flat=True)
+    )
+
+
+def render_stored(comment):
+    comment.content_html = render_comment(
+        comment.content, mentionable_in(comment.group_id, mentioned_names(comment.content))
+    )
+
+
+def render_all(using, everything=False, chunk_size=RENDER_CHUNK_SIZE):
+    """Render comments stored without HTML (or all of them) on one database; returns how many."""
+    comments = Comment.objects.using(using).order_by("id").only("id", "group_id", "content", "content_html")
+    if not everything:
+        comments = comments.filter(content_html="")
+    total, last_id = 0, 0
+    while True:
+        chunk = list(comments.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return total
+        for comment in chunk:
+            render_stored(comment)
+        Comment.objects.using(using).bulk_update(chunk, ["content_html"], batch_size=chunk_size)
+        total += len(chunk)
+        last_id = chunk[-1].id
+
+
+@receiver(pre_save, sender=Comment)
+def _render(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or "content" in update_fields:
+        render_stored(instance)
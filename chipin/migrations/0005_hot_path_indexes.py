@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def remove_duplicate_join_requests(apps, schema_editor):
+    # keep the oldest request per (user, group) so the unique constraint can be added
+    GroupJoinRequest = apps.get_model('chipin', 'GroupJoinRequest')
+    requests = GroupJoinRequest.objects.using(schema_editor.connection.alias)
+    seen = set()
+    duplicates = []
+    for pk, user_id, group_id in requests.order_by('id').values_list('id', 'user_id', 'group_id'):
+        if (user_id, group_id) in seen:
+            duplicates.append(pk)
+        else:
+            seen.add((user_id, group_id))
+    requests.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipin', '0004_event_archived_at_alter_event_status'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['group', '-created_at'], name='comment_group_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['group', 'status', 'date'], name='event_group_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invite',
+            index=models.Index(fields=['group', 'invited_user'], name='invite_group_user_idx'),
+        ),
+        # hints let the shard router run this only where join requests live
+        migrations.RunPython(remove_duplicate_join_requests, migrations.RunPython.noop,
+                             hints={'model_name': 'groupjoinrequest'}),
+        migrations.AddConstraint(
+            model_name='groupjoinrequest',
+            constraint=models.UniqueConstraint(fields=('user', 'group'), name='unique_join_request'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations, OperationalError
+
+
+def create_comment_search(apps, schema_editor):
+    # FTS5 is SQLite-only; other engines use chipin.search's icontains fallback
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE chipin_comment_fts USING fts5("
+            "content, grp, tokenize='unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        return
+    schema_editor.execute(
+        "INSERT INTO chipin_comment_fts (rowid, content, grp) "
+        "SELECT id, replace(replace(content, char(2), ''), char(3), ''), 'g' || group_id FROM chipin_comment"
+    )
+
+
+def drop_comment_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS chipin_comment_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipin', '0006_group_deleted_at'),
+    ]
+
+    operations = [
+        # hints let the shard router run this only where comments live
+        migrations.RunPython(create_comment_search, drop_comment_search, hints={'model_name': 'comment'}),
+    ]
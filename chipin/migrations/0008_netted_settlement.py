@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipin', '0007_comment_search'),
+        ('users', '0005_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Settlement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('events', models.ManyToManyField(related_name='settlements', to='chipin.event')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='settlements', to='chipin.group')),
+                ('transactions', models.ManyToManyField(related_name='settlements', to='users.transaction')),
+            ],
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-19 08:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, migrations, models
+
+
+def fill_directory(apps, schema_editor):
+    # only where the membership tables sit next to the directory (a single database)
+    if schema_editor.connection.alias != DEFAULT_DB_ALIAS:
+        return
+    Group = apps.get_model('chipin', 'Group')
+    MemberDirectory = apps.get_model('chipin', 'MemberDirectory')
+    qn = schema_editor.connection.ops.quote_name
+    for field, kind in (('members', 'member'), ('invited_users', 'invited')):
+        through = Group._meta.get_field(field).remote_field.through._meta.db_table
+        schema_editor.execute(
+            f"INSERT INTO {qn(MemberDirectory._meta.db_table)} ({qn('user_id')}, {qn('group_id')}, {qn('kind')}) "
+            f"SELECT {qn('user_id')}, {qn('group_id')}, %s FROM {qn(through)}",
+            [kind],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipin', '0009_activity_inbox'),
+        ('users', '0005_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inboxitem',
+            name='group',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='chipin.group'),
+        ),
+        migrations.AlterField(
+            model_name='settlement',
+            name='transactions',
+            field=models.ManyToManyField(db_constraint=False, related_name='settlements', to='users.transaction'),
+        ),
+        migrations.AlterField(
+            model_name='unreadcounter',
+            name='group',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='chipin.group'),
+        ),
+        migrations.CreateModel(
+            name='MemberDirectory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_id', models.BigIntegerField()),
+                ('kind', models.CharField(choices=[('member', 'Member'), ('invited', 'Invited')], max_length=10)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='directory_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['group_id', 'kind', 'user'], name='directory_group_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'group_id'), name='unique_directory_entry')],
+            },
+        ),
+        migrations.RunPython(fill_directory, migrations.RunPython.noop, hints={'model_name': 'group'}),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:30
+
+from decimal import ROUND_CEILING, Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_shares(apps, schema_editor):
+    # events and their group's memberships sit on the same database (shard)
+    using = schema_editor.connection.alias
+    Event = apps.get_model('chipin', 'Event')
+    through = apps.get_model('chipin', 'Group')._meta.get_field('members').remote_field.through
+    counts = dict(
+        through.objects.using(using).values('group_id').annotate(n=Count('id')).values_list('group_id', 'n')
+    )
+    events = list(Event.objects.using(using).exclude(status='Archived').only('id', 'group_id', 'total_spend'))
+    for event in events:
+        n = max(counts.get(event.group_id, 0), 1)
+        event.share = (event.total_spend / n).quantize(Decimal('0.01'), rounding=ROUND_CEILING)
+    Event.objects.using(using).bulk_update(events, ['share'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipin', '0010_member_directory'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='event',
+            name='event_group_status_date_idx',
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='share',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+        migrations.RunPython(fill_shares, migrations.RunPython.noop, hints={'model_name': 'event'}),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['group', 'status', 'date', 'share'], name='event_feed_idx'),
+        ),
+    ]
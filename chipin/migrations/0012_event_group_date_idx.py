@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipin', '0011_event_share'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['group', 'date'], name='event_group_date_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chipin', '0014_comment_content_max_length'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='calendar_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -3,6 +3,7 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 import uuid
 from decimal import Decimal
+from ssa_project.metrics import EVENT_STATUS_TRANSITIONS
 
 
 # helper for invite expiration used previously in migrations
@@ -11,11 +12,23 @@ def default_invite_expiry():
     return timezone.now() + timezone.timedelta(days=7)
 
 
+class GroupManager(models.Manager):
+    # groups marked for deletion disappear everywhere while their rows are purged
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Group(models.Model):
     name = models.CharField(max_length=100)
     admin = models.ForeignKey(User, related_name='admin_groups', on_delete=models.CASCADE)
     members = models.ManyToManyField(User, related_name='group_memberships', blank=True)
     invited_users = models.ManyToManyField(User, related_name='pending_invitations', blank=True)
+    deleted_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # moved by chipin.ical whenever the group's calendar feed changes
+    calendar_version = models.BigIntegerField(default=0, editable=False)
+
+    objects = GroupManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return self.name
@@ -30,6 +43,11 @@ class Invite(models.Model):
     invited_by = models.ForeignKey(User, related_name='sent_invites', on_delete=models.CASCADE)
     invited_user = models.ForeignKey(User, related_name='group_invites', on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', 'invited_user'], name='invite_group_user_idx'),
+        ]
+
     def __str__(self):
         return f"Invite to {self.invited_user.username} for {self.group.name} (accepted={self.accepted})"
 
@@ -45,17 +63,32 @@ class GroupJoinRequest(models.Model):
     group = models.ForeignKey(Group, related_name='join_requests', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            # also serves as the (user, group) lookup index
+            models.UniqueConstraint(fields=['user', 'group'], name='unique_join_request'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} requests to join {self.group.name}"  
 
 
+COMMENT_MAX_LENGTH = 4000
+
+
 class Comment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)  # User who posted the comment
     group = models.ForeignKey(Group, related_name='comments', on_delete=models.CASCADE)  # Group associated with the comment
-    content = models.TextField()  # The comment content
+    content = models.TextField(max_length=COMMENT_MAX_LENGTH)  # The comment content
+    content_html = models.TextField(blank=True, editable=False)  # content rendered by chipin.markup on save
     created_at = models.DateTimeField(auto_now_add=True)  # Timestamp when the comment was posted
     updated_at = models.DateTimeField(auto_now=True)  # Timestamp for the latest update
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['group', '-created_at'], name='comment_group_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username}: {self.content[:20]}..."  # Show only first 20 chars for preview
 
@@ -79,6 +112,16 @@ class Event(models.Model):
     )
     archived_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # total_spend / member count rounded up to the cent, kept current by chipin.feed
+    share = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            # group pages by status and date; the cross-group feed also filters on share in the index
+            models.Index(fields=['group', 'status', 'date', 'share'], name='event_feed_idx'),
+            # calendar feeds: a group's events from a date on, whatever their status
+            models.Index(fields=['group', 'date'], name='event_group_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.group.name})"
@@ -90,14 +133,13 @@ class Event(models.Model):
     def check_status(self, save=True):
         if self.status == self.Status.ARCHIVED:
             return self.status
-        share = self.calculate_share()
-        for member in self.group.members.all():
-            if member.profile.max_spend < share:
-                self.status = self.Status.PENDING
-                if save:
-                    self.save(update_fields=["status"])
-                return self.status
-        self.status = self.Status.ACTIVE
+        # chipin.affordability imports this module
+        from .affordability import AffordabilityMatrix
+        previous = self.status
+        # one profile query for the whole group rather than one per member
+        self.status = AffordabilityMatrix.for_group(self.group, events=[self]).statuses()[self.id]
+        if self.status != previous:
+            EVENT_STATUS_TRANSITIONS.inc(from_status=previous, to_status=self.status)
         if save:
             self.save(update_fields=["status"])
         return self.status
@@ -106,4 +148,85 @@ class Event(models.Model):
         self.status = self.Status.ARCHIVED
         self.archived_at = timezone.now()
         if save:
-            self.save(update_fields=["status", "archived_at"])
\ No newline at end of file
+            self.save(update_fields=["status", "archived_at"])
+
+class Settlement(models.Model):
+    """One netted settlement of several events; links its ledger rows to the events they cover."""
+    group = models.ForeignKey(Group, related_name='settlements', on_delete=models.CASCADE)
+    events = models.ManyToManyField(Event, related_name='settlements')
+    # the ledger is on the default database, so no foreign key when groups are sharded
+    transactions = models.ManyToManyField('users.Transaction', related_name='settlements', db_constraint=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Settlement #{self.id} ({self.group.name})"
+
+
+class InboxItem(models.Model):
+    """One "something happened in your group" entry, written to each recipient (fan-out on write)."""
+    class Kind(models.TextChoices):
+        COMMENT      = "comment",      "New comment"
+        EVENT        = "event",        "New event"
+        JOIN_REQUEST = "join_request", "Join request"
+        INVITE       = "invite",       "Invitation"
+
+    user = models.ForeignKey(User, related_name='inbox_items', on_delete=models.CASCADE)
+    # groups may live on another database (chipin.sharding); chipin.directory
+    # removes these rows when a group is deleted
+    group = models.ForeignKey(Group, related_name='+', on_delete=models.DO_NOTHING, db_constraint=False)
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    actor = models.ForeignKey(User, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    text = models.CharField(max_length=200)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-id'], name='inbox_user_id_idx'),
+            models.Index(fields=['created_at'], name='inbox_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.text}"
+
+
+class UnreadCounter(models.Model):
+    """Denormalised count of a member's unread inbox items for one group."""
+    user = models.ForeignKey(User, related_name='unread_counters', on_delete=models.CASCADE)
+    group = models.ForeignKey(Group, related_name='+', on_delete=models.DO_NOTHING, db_constraint=False)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'group'], name='unique_unread_counter'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} / {self.group.name}: {self.count}"
+
+
+class MemberDirectory(models.Model):
+    """Global index of who belongs to (or is invited to) which group.
+
+    Lives on the default database next to the users, so "this user's groups"
+    and "this group's member ids" are one query however the groups are
+    sharded. chipin.directory keeps it in step with the membership tables.
+    """
+    class Kind(models.TextChoices):
+        MEMBER  = "member",  "Member"
+        INVITED = "invited", "Invited"
+
+    user = models.ForeignKey(User, related_name='directory_entries', on_delete=models.CASCADE)
+    # a plain id: the group may live on another database
+    group_id = models.BigIntegerField()
+    kind = models.CharField(max_length=10, choices=Kind.choices)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'group_id'], name='unique_directory_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['group_id', 'kind', 'user'], name='directory_group_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} {self.kind} of group {self.group_id}"
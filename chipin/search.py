@@ -0,0 +1,307 @@
+"""
+Full-text search over group chat.
+
+On SQLite (with FTS5) comment text is copied into the chipin_comment_fts
+virtual table, keyed by comment id, together with a ``grp`` token
+("g<group id>") so a per-group search is an intersection of two doclists
+instead of a filter over every match. Signals keep the index in step with
+Comment saves and deletes; bulk_create/update() bypass them, so run
+``manage.py rebuild_comment_search`` after bulk loads (the site keeps
+posting and searching while it runs, see rebuild_index()). Each shard (see
+chipin.sharding) indexes its own comments. Other engines (or a SQLite built
+without FTS5) fall back to AND-ed icontains filters, newest first.
+"""
+
+import re
+import time
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.html import escape
+
+from .models import Comment
+from .sharding import on_shard, shard_aliases, shard_for
+
+FTS_TABLE = "chipin_comment_fts"
+SEARCH_PAGE_SIZE = 20
+SNIPPET_TOKENS = 24
+REBUILD_CHUNK_SIZE = 1000
+# seconds between rebuild chunks, so comment posts waiting for the lock get it
+REBUILD_PAUSE = 0.05
+
+# snippet() wraps matches in these; they're stripped from indexed text and
+# swapped for <mark> after the snippet has been HTML-escaped
+_OPEN, _CLOSE = "\x02", "\x03"
+
+# alias -> whether the FTS5 index exists there
+_enabled = {}
+
+
+def fts_enabled(using=DEFAULT_DB_ALIAS):
+    """True when the FTS5 index exists on the given database."""
+    if using not in _enabled:
+        connection = connections[using]
+        _enabled[using] = connection.vendor == "sqlite" and FTS_TABLE in connection.introspection.table_names()
+    return _enabled[using]
+
+
+def _create_table_sql(table):
+    return (
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+        "content, grp, tokenize='unicode61 remove_diacritics 2')"
+    )
+
+
+def create_index(using=DEFAULT_DB_ALIAS):
+    """Create the FTS5 table if possible; returns whether search can use it."""
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(_create_table_sql(FTS_TABLE))
+    except OperationalError:
+        # this SQLite was built without FTS5
+        return False
+    _enabled[using] = True
+    return True
+
+
+def _indexed_text(content):
+    return content.replace(_OPEN, "").replace(_CLOSE, "")
+
+
+def _group_token(group_id):
+    return f"g{group_id}"
+
+
+def index_comment(comment):
+    with connections[comment._state.db].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [comment.id])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, content, grp) VALUES (%s, %s, %s)",
+            [comment.id, _indexed_text(comment.content), _group_token(comment.group_id)],
+        )
+
+
+def unindex_comment(comment_id, using=DEFAULT_DB_ALIAS):
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [comment_id])
+
+
+def group_match(group_id):
+    """MATCH expression selecting every indexed comment of a group."""
+    return f'grp : "{_group_token(group_id)}"'
+
+
+def _mirror_triggers(table):
+    """Triggers copying every comment write into table while it is being rebuilt."""
+    comments = Comment._meta.db_table
+    # the same text and group token index_comment writes
+    values = f"new.id, replace(replace(new.content, char(2), ''), char(3), ''), 'g' || new.group_id"
+    return [
+        f"CREATE TRIGGER {table}_ai AFTER INSERT ON {comments} BEGIN "
+        f"INSERT INTO {table} (rowid, content, grp) VALUES ({values}); END",
+        f"CREATE TRIGGER {table}_au AFTER UPDATE ON {comments} BEGIN "
+        f"DELETE FROM {table} WHERE rowid = old.id; "
+        f"INSERT INTO {table} (rowid, content, grp) VALUES ({values}); END",
+        f"CREATE TRIGGER {table}_ad AFTER DELETE ON {comments} BEGIN "
+        f"DELETE FROM {table} WHERE rowid = old.id; END",
+    ]
+
+
+def _drop_mirror(cursor, table):
+    for suffix in ("ai", "au", "ad"):
+        cursor.execute(f"DROP TRIGGER IF EXISTS {table}_{suffix}")
+    cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def rebuild_index(chunk_size=REBUILD_CHUNK_SIZE, using=None, pause=REBUILD_PAUSE):
+    """Re-copy comments into their shard's index in id order; returns the number indexed.
+
+    Covers every shard, or just the one given as using. The copy goes into a
+    shadow table, one transaction per chunk, so comment posts only ever wait
+    for a single chunk; triggers on the comment table mirror writes made in
+    the meantime into the shadow, and the live index keeps answering
+    searches until a short final transaction swaps the shadow in. An
+    interrupted rebuild leaves the shadow and its triggers behind until the
+    next one starts over.
+    """
+    if using is None:
+        return sum(rebuild_index(chunk_size, alias, pause) for alias in shard_aliases())
+    if not create_index(using):
+        return 0
+    connection = connections[using]
+    shadow = f"{FTS_TABLE}_new"
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        _drop_mirror(cursor, shadow)
+        cursor.execute(_create_table_sql(shadow))
+        for sql in _mirror_triggers(shadow):
+            cursor.execute(sql)
+        # later comments reach the shadow through the triggers alone, so the
+        # copy has an end however fast comments are posted
+        newest = Comment.objects.using(using).aggregate(newest=Max("id"))["newest"] or 0
+    comments = Comment.objects.using(using).filter(id__lte=newest)
+    table = connection.ops.quote_name(Comment._meta.db_table)
+    total, last_id = 0, 0
+    while True:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            # the triggers may already have put comments of this range that were
+            # edited meanwhile into the shadow; clear it and copy it afresh.
+            # Writing first also takes the write lock before anything is read:
+            # a transaction that reads and then writes fails at once when a
+            # comment post is waiting for the lock.
+            cursor.execute(
+                f"DELETE FROM {shadow} WHERE rowid > %s AND rowid <= (SELECT MAX(id) FROM "
+                f"(SELECT id FROM {table} WHERE id > %s AND id <= %s ORDER BY id LIMIT %s))",
+                [last_id, last_id, newest, chunk_size],
+            )
+            rows = list(
+                comments.filter(id__gt=last_id).order_by("id").values_list("id", "content", "group_id")[:chunk_size]
+            )
+            if not rows:
+                break
+            cursor.executemany(
+                f"INSERT INTO {shadow} (rowid, content, grp) VALUES (%s, %s, %s)",
+                [(pk, _indexed_text(content), _group_token(group_id)) for pk, content, group_id in rows],
+            )
+        total += len(rows)
+        last_id = rows[-1][0]
+        if pause:
+            time.sleep(pause)
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        for suffix in ("ai", "au", "ad"):
+            cursor.execute(f"DROP TRIGGER {shadow}_{suffix}")
+        cursor.execute(f"DROP TABLE {FTS_TABLE}")
+        cursor.execute(f"ALTER TABLE {shadow} RENAME TO {FTS_TABLE}")
+    return total
+
+
+@receiver(post_save, sender=Comment)
+def _comment_saved(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if fts_enabled(using):
+        index_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def _comment_deleted(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if fts_enabled(using):
+        unindex_comment(instance.id, using)
+
+
+# -- querying ------------------------------------------------------------------
+
+def parse_terms(query):
+    """Split a search box query into terms; a trailing * makes a term a prefix search."""
+    return [term for term in query.split() if term.strip("*")][:16]
+
+
+def _fts_expression(group_id, terms):
+    phrases = []
+    for term in terms:
+        prefix = term.endswith("*")
+        phrase = '"' + term.rstrip("*").replace('"', '""') + '"'
+        phrases.append(phrase + (" *" if prefix else ""))
+    return f"{group_match(group_id)} AND content : ({' AND '.join(phrases)})"
+
+
+def _mark(snippet):
+    return escape(snippet).replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def _fallback_snippet(content, terms):
+    pattern = re.compile("|".join(re.escape(t.rstrip("*")) for t in terms), re.I)
+    content = _indexed_text(content)
+    width = SNIPPET_TOKENS * 8
+    if len(content) > width:
+        first = pattern.search(content)
+        start = max(0, (first.start() if first else 0) - width // 4)
+        content = ("…" if start else "") + content[start:start + width] + ("…" if start + width < len(content) else "")
+    return _mark(pattern.sub(lambda m: f"{_OPEN}{m.group(0)}{_CLOSE}", content))
+
+
+def _search_fts(group_id, terms, after, limit):
+    expression = _fts_expression(group_id, terms)
+    sql = (
+        f"SELECT rowid, rank, snippet({FTS_TABLE}, 0, %s, %s, '…', %s) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid <= %s"
+    )
+    with connections[shard_for(group_id)].cursor() as cursor:
+        if after is None:
+            # comments posted after the first page stay out of later pages
+            cursor.execute(f"SELECT rowid FROM {FTS_TABLE} ORDER BY rowid DESC LIMIT 1")
+            newest = cursor.fetchone()
+            bound = newest[0] if newest else 0
+        else:
+            bound, rank, last = after
+            # bm25 scores every row against the whole index, so new or
+            # deleted comments move every rank; re-read the last hit's rank
+            # rather than comparing today's scores to the cursor's
+            cursor.execute(f"SELECT rank FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = %s", [expression, last])
+            current = cursor.fetchone()
+            if current:
+                rank = current[0]
+        params = [_OPEN, _CLOSE, SNIPPET_TOKENS, expression, bound]
+        if after is not None:
+            # bm25 ranks are negative, best first; (rank, rowid) is the keyset
+            sql += " AND (rank > %s OR (rank = %s AND rowid > %s))"
+            params += [rank, rank, last]
+        sql += " ORDER BY rank, rowid LIMIT %s"
+        cursor.execute(sql, params + [limit + 1])
+        rows = cursor.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    cursor_value = f"{bound}:{rows[-1][1]!r}:{rows[-1][0]}" if more else None
+    return [(pk, _mark(snippet)) for pk, _, snippet in rows], cursor_value
+
+
+def _search_fallback(group_id, terms, after, limit):
+    qs = on_shard(Comment, group_id).filter(group_id=group_id)
+    for term in terms:
+        qs = qs.filter(content__icontains=term.rstrip("*"))
+    if after is not None:
+        qs = qs.filter(id__lt=after[2])
+    rows = list(qs.order_by("-id").values_list("id", "content")[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    # newest first by id, so later comments never reach the following pages
+    cursor_value = f"0:0:{rows[-1][0]}" if more else None
+    return [(pk, _fallback_snippet(content, terms)) for pk, content in rows], cursor_value
+
+
+def _parse_cursor(value):
+    """(newest rowid searched, rank, rowid) of the last hit on the previous page."""
+    try:
+        bound, rank, pk = value.split(":")
+        return int(bound), float(rank), int(pk)
+    except (AttributeError, ValueError):
+        return None
+
+
+def search_comments(group_id, query, after=None, limit=SEARCH_PAGE_SIZE):
+    """One page of a group's comments matching every term in query.
+
+    Returns (hits, next_cursor) where each hit is {"comment", "snippet"} with
+    the snippet already HTML-escaped and matches wrapped in <mark>. Pass
+    next_cursor back as ``after`` for the following page; it is None on the
+    last page. FTS results are ordered by relevance, fallback results newest
+    first. Comments posted after the first page never show up on later ones.
+    FTS ranks are recomputed on every page and the cursor's hit is re-ranked
+    with them, so scores drifting as the index changes do not skip or repeat
+    hits; only two hits whose order flips between pages can be.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        return [], None
+    using = shard_for(group_id)
+    search = _search_fts if fts_enabled(using) else _search_fallback
+    rows, next_cursor = search(group_id, terms, _parse_cursor(after), limit)
+    # profiles stay on the default database when groups are sharded
+    comments = (
+        Comment.objects.using(using).select_related("user").prefetch_related("user__profile")
+        .in_bulk([pk for pk, _ in rows])
+    )
+    hits = [{"comment": comments[pk], "snippet": snippet} for pk, snippet in rows if pk in comments]
+    return hits, next_cursor
@@ -0,0 +1,237 @@
+import heapq
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Value, When
+from django.utils import timezone
+
+from ssa_project.metrics import SETTLEMENTS, SETTLEMENT_AMOUNT
+from users.backends import invalidate_users
+from users.models import Profile, Transaction
+from .ical import invalidate_groups
+from .models import Event
+
+CENT = Decimal("0.01")
+
+
+class SettlementError(Exception):
+    """Raised when an event cannot be settled; the message is shown to the user."""
+
+
+def _split(total_spend, payer_ids, balances):
+    """Work out who pays how much for one event, given current balances.
+
+    Anyone with no money at all is dropped, the share is worked out over the
+    rest, then anyone who still can't cover it is excluded and the share is
+    recalculated over the final payers, rounded to cents. Returns (share,
+    final ids, excluded ids).
+    """
+    rough_eligible = [i for i in payer_ids if balances[i] > 0]
+    if not rough_eligible:
+        raise SettlementError("No members have a positive balance to contribute.")
+
+    share = total_spend / Decimal(len(rough_eligible))
+    final = [i for i in rough_eligible if balances[i] >= share]
+    excluded = [i for i in rough_eligible if balances[i] < share]
+    if not final:
+        raise SettlementError("No participants could afford the share amount. Transfer cancelled.")
+    share = (total_spend / Decimal(len(final))).quantize(CENT, rounding=ROUND_HALF_UP)
+    return share, final, excluded
+
+
+def settle_event(event):
+    """Collect an event's cost from its payers and credit the group admin.
+
+    Payers are the event members (or every group member if nobody joined) plus
+    the admin. Anyone who cannot cover the share is excluded and the share is
+    recalculated over the rest. The share is in whole cents and the admin is
+    credited with what was actually collected, so the cent remainder of an
+    uneven split stays with the admin (as in settle_events_netted) and every
+    balance moves by exactly its ledger row. Balances move with one UPDATE
+    per side and the ledger rows are written with bulk_create.
+
+    Returns (final_share, final_payers, excluded).
+    """
+    group = event.group
+    if event.status == Event.Status.ARCHIVED:
+        raise SettlementError("Funds have already been transferred for this event.")
+
+    # Start from event members; if none, fall back to group members
+    payer_ids = list(event.members.values_list("id", flat=True))
+    if not payer_ids:
+        payer_ids = list(group.members.values_list("id", flat=True))
+
+    # Include admin
+    if group.admin_id not in payer_ids:
+        payer_ids.append(group.admin_id)
+
+    # memberships live with the group, users and balances on the default database
+    users = User.objects.select_related("profile").in_bulk(payer_ids)
+    final_share, final_ids, excluded_ids = _split(
+        event.total_spend, [i for i in payer_ids if i in users], {i: u.profile.balance for i, u in users.items()}
+    )
+    final_payers = [users[i] for i in final_ids]
+    excluded = [users[i] for i in excluded_ids]
+    collected = final_share * len(final_payers)
+    now = timezone.now()
+
+    # All money movements and the event archive happen inside one atomic transaction
+    # per database (the event's shard and default are the same one unless sharded)
+    with transaction.atomic(using=event._state.db), transaction.atomic():
+        # Archive first so two concurrent settlements can't both go through
+        archived = Event.objects.using(event._state.db).filter(id=event.id).exclude(status=Event.Status.ARCHIVED).update(
+            status=Event.Status.ARCHIVED, archived_at=now,
+        )
+        if not archived:
+            raise SettlementError("Funds have already been transferred for this event.")
+        invalidate_groups([group.id])
+
+        Profile.objects.filter(user__in=final_payers).update(balance=F("balance") - final_share)
+        Profile.objects.filter(user_id=group.admin_id).update(balance=F("balance") + collected)
+        invalidate_users([u.id for u in final_payers] + [group.admin_id])
+        Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    user=u,
+                    amount=-final_share,
+                    created_at=now,
+                    description=f"Contribution for event '{event.name}'",
+                )
+                for u in final_payers
+            ]
+            + [
+                Transaction(
+                    user_id=group.admin_id,
+                    amount=collected,
+                    created_at=now,
+                    description=f"Funds received for event '{event.name}'",
+                )
+            ]
+        )
+
+    event.status = Event.Status.ARCHIVED
+    event.archived_at = now
+    SETTLEMENTS.inc(mode="event")
+    SETTLEMENT_AMOUNT.inc(float(event.total_spend), mode="event")
+    return final_share, final_payers, excluded
+
+
+def simplify_debts(nets):
+    """Turn net positions into a short list of transfers.
+
+    nets maps user id -> amount (positive: owed money, negative: owes money)
+    and must sum to zero. The largest debtor repeatedly pays the largest
+    creditor, so n people with a non-zero position need at most n - 1
+    transfers. Returns [(debtor id, creditor id, amount)].
+    """
+    debtors = [(amount, uid) for uid, amount in nets.items() if amount < 0]
+    creditors = [(-amount, uid) for uid, amount in nets.items() if amount > 0]
+    heapq.heapify(debtors)
+    heapq.heapify(creditors)
+    transfers = []
+    while debtors and creditors:
+        owes, debtor = heapq.heappop(debtors)
+        owed, creditor = heapq.heappop(creditors)
+        amount = min(-owes, -owed)
+        transfers.append((debtor, creditor, amount))
+        if -owes > amount:
+            heapq.heappush(debtors, (owes + amount, debtor))
+        if -owed > amount:
+            heapq.heappush(creditors, (owed + amount, creditor))
+    return transfers
+
+
+def settle_events_netted(group, events=None):
+    """Settle a batch of a group's Active events with as few transfers as possible.
+
+    Each event is split exactly as settle_event would, in date order, against
+    balances that already reflect the earlier events in the batch. The
+    resulting per-member positions are netted, rounded to cents (any rounding
+    remainder stays with the admin) and paid with simplify_debts(). All events
+    are archived, every changed balance is written with a single UPDATE and
+    the ledger rows are bulk-created and linked to the events through one
+    Settlement.
+
+    Returns (settlement, transfers, skipped) where skipped lists
+    (event, reason) for events that could not be settled; settlement is None
+    if nothing could be.
+    """
+    if events is None:
+        events = group.events.filter(status=Event.Status.ACTIVE).order_by("date", "id")
+    events = [e for e in events if e.status == Event.Status.ACTIVE]
+    admin_id = group.admin_id
+    members = list(group.members.values_list("id", flat=True))
+    joined = {}
+    for event_id, user_id in Event.members.through.objects.using(group._state.db).filter(
+        event_id__in=[e.id for e in events]
+    ).values_list("event_id", "user_id"):
+        joined.setdefault(event_id, []).append(user_id)
+    # event members who have since left the group still pay from their real balance
+    payers = set(members) | {admin_id} | {uid for ids in joined.values() for uid in ids}
+    balances = dict(Profile.objects.filter(user_id__in=payers).values_list("user_id", "balance"))
+
+    nets = dict.fromkeys(balances, Decimal(0))
+    settled, skipped = [], []
+    for event in events:
+        payer_ids = list(joined.get(event.id) or members)
+        if admin_id not in payer_ids:
+            payer_ids.append(admin_id)
+        for uid in payer_ids:
+            balances.setdefault(uid, Decimal(0))
+            nets.setdefault(uid, Decimal(0))
+        try:
+            share, final_ids, _ = _split(event.total_spend, payer_ids, balances)
+        except SettlementError as e:
+            skipped.append((event, str(e)))
+            continue
+        for uid in final_ids:
+            balances[uid] -= share
+            nets[uid] -= share
+        balances[admin_id] += event.total_spend
+        nets[admin_id] += event.total_spend
+        settled.append(event)
+    if not settled:
+        return None, [], skipped
+
+    cents = {uid: amount.quantize(CENT, rounding=ROUND_HALF_UP) for uid, amount in nets.items()}
+    cents[admin_id] -= sum(cents.values())
+    transfers = simplify_debts({uid: amount for uid, amount in cents.items() if amount})
+
+    now = timezone.now()
+    names = {e.id: e.name for e in settled}
+    label = f"{len(settled)} event(s): " + ", ".join(names.values())
+    with transaction.atomic(using=group._state.db), transaction.atomic():
+        archived = Event.objects.using(group._state.db).filter(id__in=names).filter(status=Event.Status.ACTIVE).update(
+            status=Event.Status.ARCHIVED, archived_at=now,
+        )
+        if archived != len(settled):
+            raise SettlementError("Some of these events were settled or changed in the meantime. Try again.")
+        invalidate_groups([group.id])
+        changed = {uid: amount for uid, amount in cents.items() if amount}
+        if changed:
+            Profile.objects.filter(user_id__in=changed).update(balance=Case(
+                *(When(user_id=uid, then=F("balance") + Value(amount)) for uid, amount in changed.items()),
+                output_field=DecimalField(max_digits=10, decimal_places=2),
+            ))
+            invalidate_users(changed)
+        settlement = group.settlements.create()
+        ledger = Transaction.objects.bulk_create(
+            row
+            for debtor, creditor, amount in transfers
+            for row in (
+                Transaction(user_id=debtor, amount=-amount, created_at=now,
+                            description=f"Net settlement #{settlement.id} of {label}"[:255]),
+                Transaction(user_id=creditor, amount=amount, created_at=now,
+                            description=f"Net settlement #{settlement.id} of {label}"[:255]),
+            )
+        )
+        settlement.events.add(*settled)
+        settlement.transactions.add(*ledger)
+
+    for event in settled:
+        event.status = Event.Status.ARCHIVED
+        event.archived_at = now
+    SETTLEMENTS.inc(len(settled), mode="netted")
+    SETTLEMENT_AMOUNT.inc(float(sum(e.total_spend for e in settled)), mode="netted")
+    return settlement, transfers, skipped
@@ -0,0 +1,224 @@
+"""
+Group sharding.
+
+Everything that belongs to one group (the group row, its memberships,
+comments, events, invites, join requests and settlements) lives on one of
+the database aliases in settings.GROUP_SHARDS. Users, profiles, the ledger,
+sessions and the per-user inbox stay on ``default``. Every sharded table on
+shard k hands out ids from k * SHARD_ID_SPAN (see seed_id_ranges()), so
+shard_for() finds the database of a group, comment or event from its id
+alone, and GroupShardRouter writes the rows that hang off a group next to it.
+
+auth_user is copied onto every shard so membership joins and user foreign
+keys resolve on the shard; chipin.directory answers the questions that cut
+across shards, such as "which groups is this user in?".
+
+With the default GROUP_SHARDS = ["default"] the router stays out of the way
+and everything lives on ``default`` as before.
+"""
+
+import random
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import post_migrate, post_save
+from django.dispatch import receiver
+
+# ids [k * SHARD_ID_SPAN, (k + 1) * SHARD_ID_SPAN) belong to shard k
+SHARD_ID_SPAN = 10 ** 12
+
+SHARDED_MODELS = frozenset({
+    "chipin.group",
+    "chipin.comment",
+    "chipin.event",
+    "chipin.invite",
+    "chipin.groupjoinrequest",
+    "chipin.settlement",
+})
+# copied to every shard so joins against users stay on one database
+REPLICATED_MODELS = frozenset({"auth.user"})
+
+
+def shard_aliases():
+    return list(settings.GROUP_SHARDS)
+
+
+def sharding_enabled():
+    return shard_aliases() != [DEFAULT_DB_ALIAS]
+
+
+def replica_aliases():
+    """Shards that need their own copy of auth_user."""
+    return [alias for alias in shard_aliases() if alias != DEFAULT_DB_ALIAS]
+
+
+def shard_for(pk):
+    """Alias holding the sharded row with this id (any sharded model)."""
+    aliases = shard_aliases()
+    return aliases[min(int(pk) // SHARD_ID_SPAN, len(aliases) - 1)]
+
+
+def shard_index(alias):
+    return shard_aliases().index(alias)
+
+
+def on_shard(model, pk):
+    """model's default manager bound to the shard holding pk, e.g. for get_object_or_404."""
+    return model._default_manager.db_manager(shard_for(pk))
+
+
+def across_shards(queryset):
+    """Evaluate the same query on every shard and concatenate the results."""
+    return [obj for alias in shard_aliases() for obj in queryset.using(alias)]
+
+
+def is_sharded(model):
+    opts = model._meta
+    if opts.auto_created:
+        # m2m through tables live with the model that declares the field
+        opts = opts.auto_created._meta
+    return opts.label_lower in SHARDED_MODELS
+
+
+def _is_replicated(model):
+    return model._meta.label_lower in REPLICATED_MODELS
+
+
+def _home_shard(instance):
+    """Where a sharded instance lives, or will be written if it is new."""
+    if not instance._state.adding:
+        return instance._state.db
+    if getattr(instance, "group_id", None) is not None:
+        return shard_for(instance.group_id)
+    if instance.pk is not None:
+        return shard_for(instance.pk)
+    if instance._meta.label_lower == "chipin.group":
+        return random.choice(shard_aliases())
+    return None
+
+
+class GroupShardRouter:
+    """Routes group-scoped models to their shard; everything else to ``default``.
+
+    Reads and writes of a sharded model follow the instance they are made
+    through (group.comments, event.members, comment.group ...); a new row is
+    placed by its group_id, and a new group on a random shard. Querying a
+    sharded model without an instance needs an explicit .using(), usually
+    via on_shard() or across_shards().
+    """
+
+    def db_for_read(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        instance = hints.get("instance")
+        if is_sharded(model) or _is_replicated(model):
+            if instance is not None and (is_sharded(instance.__class__) or _is_replicated(instance.__class__)):
+                return instance._state.db
+            return DEFAULT_DB_ALIAS if _is_replicated(model) else None
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        instance = hints.get("instance")
+        if is_sharded(model):
+            if instance is not None and is_sharded(instance.__class__):
+                return _home_shard(instance)
+            return None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharding_enabled():
+            return None
+        if obj1._state.adding or obj2._state.adding:
+            return True
+        if is_sharded(obj1.__class__) and is_sharded(obj2.__class__):
+            return obj1._state.db == obj2._state.db
+        # sharded rows point at users (copied everywhere) and global rows at groups by id
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not sharding_enabled():
+            return None
+        label = f"{app_label}.{model_name}"
+        if db == DEFAULT_DB_ALIAS:
+            return label not in SHARDED_MODELS or DEFAULT_DB_ALIAS in shard_aliases()
+        if db in shard_aliases():
+            return label in SHARDED_MODELS or label in REPLICATED_MODELS
+        return None
+
+
+# -- id ranges -----------------------------------------------------------------
+
+def _sharded_tables():
+    from django.apps import apps
+    return [
+        model._meta.db_table
+        for model in apps.get_app_config("chipin").get_models()
+        if model._meta.label_lower in SHARDED_MODELS
+    ]
+
+
+def seed_id_ranges(alias):
+    """Start every sharded table's id sequence on alias at its shard's range.
+
+    Only ever moves a sequence forward, so it is safe to run after every
+    migrate. Returns the number of sequences moved.
+    """
+    start = shard_index(alias) * SHARD_ID_SPAN
+    if not start:
+        return 0
+    connection = connections[alias]
+    moved = 0
+    with connection.cursor() as cursor:
+        for table in _sharded_tables():
+            if connection.vendor == "sqlite":
+                # AUTOINCREMENT tables take max(seq, max(rowid)) + 1 as the next id
+                cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s",
+                               [start, table, start])
+                moved += cursor.rowcount
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                    [table, start, table],
+                )
+                moved += cursor.rowcount
+            elif connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s) "
+                    "WHERE (SELECT COALESCE(MAX(id), 0) FROM " + connection.ops.quote_name(table) + ") < %s",
+                    [table, start, start],
+                )
+                moved += len(cursor.fetchall())
+            else:
+                raise NotImplementedError(f"Shard id ranges are not implemented for {connection.vendor}")
+    return moved
+
+
+@receiver(post_migrate)
+def _seed_after_migrate(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    if sender.label == "chipin" and sharding_enabled() and using in shard_aliases():
+        seed_id_ranges(using)
+
+
+# -- user copies -------------------------------------------------------------------
+
+def replicate_users(users, aliases=None):
+    """Upsert copies of these users onto every shard (or just aliases)."""
+    fields = [f for f in User._meta.concrete_fields if not f.primary_key]
+    users = list(users)
+    if not users:
+        return
+    for alias in replica_aliases() if aliases is None else aliases:
+        # fresh instances, so the caller's objects keep pointing at default
+        copies = [User(pk=u.pk, **{f.attname: getattr(u, f.attname) for f in fields}) for u in users]
+        User.objects.using(alias).bulk_create(
+            copies, update_conflicts=True, unique_fields=["id"], update_fields=[f.name for f in fields],
+        )
+
+
+@receiver(post_save, sender=User)
+def _copy_user_to_shards(sender, instance, using=DEFAULT_DB_ALIAS, **kwargs):
+    if using == DEFAULT_DB_ALIAS and sharding_enabled():
+        replicate_users([instance])
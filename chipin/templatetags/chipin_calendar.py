@@ -0,0 +1,18 @@
+from django import template
+from django.urls import reverse
+
+from chipin.ical import token_for
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def calendar_url(context, group=None):
+    """Subscription URL of the signed-in user's calendar feed, or of one group's."""
+    request = context["request"]
+    token = token_for(request.user)
+    if group is None:
+        path = reverse("chipin:calendar_feed", args=[token])
+    else:
+        path = reverse("chipin:group_calendar_feed", args=[token, group.id])
+    return request.build_absolute_uri(path)
@@ -0,0 +1,29 @@
+from django import template
+from django.contrib.staticfiles.storage import ManifestFilesMixin, staticfiles_storage
+
+register = template.Library()
+
+# (manifest the URLs were read from, {path: url}); a rebuilt or reloaded
+# manifest is a new hashed_files dict, so the URLs are looked up again
+_built_urls = (None, {})
+
+
+def _built_url(path):
+    # generated variants only exist once build_static has added them to the manifest
+    global _built_urls
+    storage = staticfiles_storage
+    if not isinstance(storage, ManifestFilesMixin):
+        return ""
+    manifest, urls = _built_urls
+    if manifest is not storage.hashed_files:
+        manifest, urls = storage.hashed_files, {}
+        _built_urls = (manifest, urls)
+    if path not in urls:
+        urls[path] = storage.url(path) if storage.hash_key(path) in manifest else ""
+    return urls[path]
+
+
+@register.simple_tag
+def built_static(path):
+    """URL of a build_static output such as a WebP variant, or "" if it was not built."""
+    return _built_url(path)
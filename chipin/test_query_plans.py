@@ -0,0 +1,109 @@
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import Transaction
+from . import ical
+from .feed import joinable_events
+from .models import Group, Comment, GroupJoinRequest, Event, Invite
+
+# Scans that are inherent to the page rather than a missing index:
+# home lists every group the user could still join.
+ALLOWED_SCANS = {"chipin_group"}
+
+
+def full_scans(sql):
+    """Tables a SELECT reads with a full scan according to EXPLAIN QUERY PLAN."""
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql)
+        details = [row[-1] for row in cursor.fetchall()]
+    scans = set()
+    for detail in details:
+        # "SCAN t USING [COVERING] INDEX i" walks an index in order and is fine;
+        # a bare "SCAN t" reads the whole table
+        if detail.startswith("SCAN ") and " USING " not in detail:
+            scans.add(detail.split()[1])
+    return scans
+
+
+@skipUnlessDBFeature("supports_explaining_query_execution")
+class QueryPlanTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.group = Group.objects.create(name='trip', admin=self.alice)
+        self.group.members.add(self.alice)
+        self.other = Group.objects.create(name='other', admin=self.bob)
+        self.event = Event.objects.create(name='dinner', date=timezone.now(), total_spend=Decimal('10.00'), group=self.group)
+        self.event.members.add(self.alice)
+        Comment.objects.create(user=self.alice, group=self.group, content='hi')
+        Transaction.objects.create(user=self.alice, amount=Decimal('5.00'))
+        GroupJoinRequest.objects.create(user=self.alice, group=self.other)
+        Invite.objects.create(group=self.group, invited_by=self.alice, invited_user=self.bob)
+        # no ANALYZE here: with only a handful of rows SQLite would rightly prefer
+        # scans; without stats it plans as it would for large tables
+
+    def assertNoFullScans(self, url, method='get'):
+        self.client.login(username='alice', password='pass')
+        with CaptureQueriesContext(connection) as ctx:
+            getattr(self.client, method)(url)
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects)
+        for sql in selects:
+            with self.subTest(sql=sql):
+                self.assertFalse(full_scans(sql) - ALLOWED_SCANS)
+
+    def test_home(self):
+        self.assertNoFullScans(reverse('chipin:home'))
+
+    def test_group_detail(self):
+        self.assertNoFullScans(reverse('chipin:group_detail', args=[self.group.id]))
+
+    def test_request_to_join(self):
+        self.assertNoFullScans(reverse('chipin:request_to_join_group', args=[self.other.id]))
+
+    def test_invite_lookup(self):
+        qs = Invite.objects.filter(group=self.group, invited_user=self.bob)
+        self.assertIn('invite_group_user_idx', self._plan(qs))
+
+    def test_ordered_histories_use_composite_indexes(self):
+        comments = Comment.objects.filter(group=self.group).order_by('-created_at')
+        transactions = Transaction.objects.filter(user=self.alice).order_by('-created_at')
+        events = Event.objects.filter(group=self.group, status=Event.Status.PENDING).order_by('date')
+        for qs, index in ((comments, 'comment_group_created_idx'),
+                          (transactions, 'transaction_user_created_idx'),
+                          (events, 'event_feed_idx')):
+            with self.subTest(index=index):
+                plan = self._plan(qs)
+                self.assertIn(index, plan)
+                self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_event_feed(self):
+        self.assertNoFullScans(reverse('chipin:event_feed'))
+        with CaptureQueriesContext(connection) as ctx:
+            joinable_events(self.alice, Decimal('100.00'))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn('event_feed_idx', self._explain(ctx.captured_queries[0]['sql']))
+
+    def test_calendar_feeds(self):
+        token = ical.token_for(self.alice)
+        self.assertNoFullScans(reverse('chipin:calendar_feed', args=[token]))
+        self.assertNoFullScans(reverse('chipin:group_calendar_feed', args=[token, self.group.id]))
+        # a range scan already in (date, id) order
+        plan = self._plan(ical._upcoming(Event.objects.filter(group=self.group), ical.window_start()))
+        self.assertIn('event_group_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def _plan(self, qs):
+        sql, params = qs.query.sql_with_params()
+        return self._explain(sql, params)
+
+    def _explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            return " | ".join(row[-1] for row in cursor.fetchall())
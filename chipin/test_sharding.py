@@ -0,0 +1,163 @@
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.db import connections
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import Profile, Transaction
+from . import feed, ical, search, sharding
+from .deletion import purge_group, schedule_group_deletion
+from .models import Group, Comment, Event, InboxItem, MemberDirectory
+from .settlement import settle_events_netted
+
+
+@override_settings(GROUP_SHARDS=['shard_a', 'shard_b', 'shard_c'])
+class ShardRouterTests(SimpleTestCase):
+    router = sharding.GroupShardRouter()
+
+    def test_ids_map_to_their_shard(self):
+        span = sharding.SHARD_ID_SPAN
+        self.assertEqual(sharding.shard_for(1), 'shard_a')
+        self.assertEqual(sharding.shard_for(span + 5), 'shard_b')
+        self.assertEqual(sharding.shard_for(str(2 * span)), 'shard_c')
+        # ids past the last range stay on the last shard
+        self.assertEqual(sharding.shard_for(7 * span), 'shard_c')
+
+    def test_through_tables_follow_their_model(self):
+        self.assertTrue(sharding.is_sharded(Group.members.through))
+        self.assertTrue(sharding.is_sharded(Event.members.through))
+        self.assertFalse(sharding.is_sharded(InboxItem))
+        self.assertFalse(sharding.is_sharded(User))
+
+    def test_migrations_are_split_between_default_and_shards(self):
+        allow = self.router.allow_migrate
+        self.assertFalse(allow('default', 'chipin', 'comment'))
+        self.assertTrue(allow('default', 'chipin', 'memberdirectory'))
+        self.assertTrue(allow('default', 'users', 'profile'))
+        self.assertTrue(allow('shard_b', 'chipin', 'comment'))
+        self.assertTrue(allow('shard_b', 'auth', 'user'))
+        self.assertFalse(allow('shard_b', 'auth', 'permission'))
+        self.assertFalse(allow('shard_b', 'users', 'profile'))
+        # data migrations without a model_name hint only run on default
+        self.assertFalse(allow('shard_b', 'auth'))
+
+    def test_rows_are_written_next_to_their_group(self):
+        group = Group(id=sharding.SHARD_ID_SPAN + 1, name='trip')
+        group._state.adding = False
+        group._state.db = 'shard_b'
+        self.assertEqual(self.router.db_for_write(Comment, instance=Comment(group_id=group.id)), 'shard_b')
+        self.assertEqual(self.router.db_for_write(Group.members.through, instance=group), 'shard_b')
+        self.assertEqual(self.router.db_for_read(User, instance=group), 'shard_b')
+        self.assertEqual(self.router.db_for_read(Profile, instance=group), 'default')
+        self.assertEqual(self.router.db_for_write(Transaction), 'default')
+
+    @override_settings(GROUP_SHARDS=['default'])
+    def test_single_database_is_left_alone(self):
+        self.assertFalse(sharding.sharding_enabled())
+        self.assertIsNone(self.router.db_for_write(Comment, instance=Comment(group_id=1)))
+        self.assertIsNone(self.router.allow_migrate('default', 'chipin', 'comment'))
+
+
+# run with: manage.py test chipin.test_sharding --settings=ssa_project.settings_sharded
+@skipUnless(len(sharding.replica_aliases()) >= 2, "needs at least two shard databases")
+class ShardedDatabaseTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.shards = sharding.replica_aliases()[:2]
+        self.groups = []
+        for alias in self.shards:
+            group = Group(name=f'on {alias}', admin=self.alice)
+            group.save(using=alias)
+            group.members.add(self.alice, self.bob)
+            self.groups.append(group)
+
+    def test_users_are_copied_to_every_shard(self):
+        for alias in sharding.replica_aliases():
+            self.assertEqual(User.objects.using(alias).get(id=self.bob.id).username, 'bob')
+        self.bob.username = 'robert'
+        self.bob.save()
+        self.assertEqual(User.objects.using(self.shards[1]).get(id=self.bob.id).username, 'robert')
+
+    def test_ids_come_from_the_shard_range(self):
+        for alias, group in zip(self.shards, self.groups):
+            self.assertEqual(sharding.shard_for(group.id), alias)
+            comment = group.comments.create(user=self.bob, content='hi')
+            self.assertEqual(sharding.shard_for(comment.id), alias)
+            self.assertEqual(Comment.objects.using(alias).get(id=comment.id).user, self.bob)
+
+    def test_pages_work_across_shards(self):
+        self.client.login(username='bob', password='pass')
+        response = self.client.get(reverse('chipin:home'))
+        self.assertEqual([g.id for g in response.context['user_groups']], [g.id for g in self.groups])
+        group = self.groups[1]
+        self.client.post(reverse('chipin:group_detail', args=[group.id]), {'content': 'pizza tonight'})
+        self.assertEqual(Comment.objects.using(self.shards[1]).filter(group=group).count(), 1)
+        self.assertFalse(Comment.objects.using(self.shards[0]).exists())
+        self.assertEqual(InboxItem.objects.get().user, self.alice)
+        hits, _ = search.search_comments(group.id, 'pizza')
+        self.assertEqual([h['comment'].content for h in hits], ['pizza tonight'])
+        response = self.client.get(reverse('chipin:group_detail', args=[group.id]))
+        self.assertContains(response, 'pizza tonight')
+
+    def test_new_group_lands_on_a_shard_with_its_members(self):
+        self.client.login(username='alice', password='pass')
+        self.client.post(reverse('chipin:create_group'), {'name': 'new'})
+        group_id = MemberDirectory.objects.exclude(group_id__in=[g.id for g in self.groups]).get().group_id
+        group = Group.objects.using(sharding.shard_for(group_id)).get(id=group_id)
+        self.assertEqual(list(group.members.all()), [self.alice])
+
+    def test_netted_settlement_spans_shard_and_default(self):
+        group = self.groups[1]
+        Profile.objects.update(balance=Decimal('50.00'))
+        group.events.create(name='dinner', date=timezone.now(), total_spend=Decimal('20.00'),
+                            status=Event.Status.ACTIVE)
+        settlement, transfers, skipped = settle_events_netted(group)
+        self.assertEqual(skipped, [])
+        self.assertEqual(settlement._state.db, self.shards[1])
+        self.assertEqual(Profile.objects.get(user=self.bob).balance, Decimal('40.00'))
+        self.assertEqual(Transaction.objects.count(), 2)
+        self.assertEqual(
+            set(settlement.transactions.through.objects.using(self.shards[1]).values_list('transaction_id', flat=True)),
+            set(Transaction.objects.values_list('id', flat=True)),
+        )
+
+    def test_event_feed_merges_the_shards(self):
+        soon = timezone.now() + timezone.timedelta(days=1)
+        events = [
+            group.events.create(name=f'e{i}', date=soon + timezone.timedelta(hours=i), total_spend=Decimal('8.00'))
+            for i, group in enumerate(self.groups * 2)
+        ]
+        self.assertEqual([e.share for e in events], [Decimal('4.00')] * 4)
+        page, next_cursor = feed.joinable_events(self.bob, Decimal('5.00'), limit=3)
+        self.assertEqual([e.name for e in page], ['e0', 'e1', 'e2'])
+        page, _ = feed.joinable_events(self.bob, Decimal('5.00'), after=feed.parse_cursor(next_cursor))
+        self.assertEqual([(e.name, e._state.db) for e in page], [('e3', self.shards[1])])
+
+    def test_calendar_feed_merges_the_shards(self):
+        soon = timezone.now() + timezone.timedelta(days=1)
+        for i, group in enumerate(self.groups * 2):
+            group.events.create(name=f'e{i}', date=soon + timezone.timedelta(hours=i), total_spend=Decimal('8.00'))
+        events = list(ical.user_events(self.bob, ical.window_start()))
+        self.assertEqual([e.name for e in events], ['e0', 'e1', 'e2', 'e3'])
+        self.assertEqual({e._state.db for e in events}, set(self.shards[:2]))
+        self.assertEqual([e.name for e in ical.group_events(self.groups[1].id, ical.window_start())], ['e1', 'e3'])
+
+    def test_purge_clears_the_shard_and_the_directory(self):
+        group = self.groups[0]
+        group.comments.create(user=self.bob, content='bye')
+        schedule_group_deletion(group)
+        purge_group(group.id)
+        alias = self.shards[0]
+        self.assertFalse(Group.all_objects.using(alias).exists())
+        self.assertFalse(Comment.objects.using(alias).exists())
+        self.assertFalse(MemberDirectory.objects.filter(group_id=group.id).exists())
+        self.assertTrue(MemberDirectory.objects.filter(group_id=self.groups[1].id).exists())
+        with connections[alias].cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM chipin_group_members")
+            self.assertEqual(cursor.fetchone()[0], 0)
@@ -1,7 +1,42 @@
-from django.test import TestCase
+import gc
+import gzip
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import F
+from django.template import engines
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth.models import User
-from django.urls import reverse
-from .models import Group, Comment, GroupJoinRequest
+from django.urls import resolve, reverse
+from django.utils import timezone
+from django.utils.html import escape
+from ssa_project import backup
+from ssa_project.metrics import registry, SETTLEMENTS
+from ssa_project.static_serving import StaticFilesApp
+from ssa_project.warmup import warm_up
+from users import audit, reconciliation
+from users.models import AuditEntry, Profile, Transaction
+from . import feed, ical, inbox, markup, search, settlement as settle
+from .affordability import AffordabilityMatrix
+from .deletion import schedule_group_deletion, purge_group
+from .management.commands import loadtest
+from .models import COMMENT_MAX_LENGTH, Group, Comment, GroupJoinRequest, Event, Settlement, InboxItem, UnreadCounter, MemberDirectory
+from .templatetags.chipin_static import _built_url
 
 
 class GroupChatTests(TestCase):
@@ -41,3 +76,1000 @@ class GroupChatTests(TestCase):
         self.assertEqual(resp2.status_code, 302)
         self.assertTrue(self.other in self.group.members.all())
 
+
+
+class CommentMarkupTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.group = Group.objects.create(name='test', admin=self.alice)
+        self.group.members.add(self.alice)
+
+    def test_markup_renders_only_allowed_html(self):
+        render = markup.render_comment
+        self.assertEqual(render('**bold** *em* _em_ `a<b>`'),
+                         '<strong>bold</strong> <em>em</em> <em>em</em> <code>a&lt;b&gt;</code>')
+        self.assertEqual(render('<script>alert(1)</script>\nnext'),
+                         '&lt;script&gt;alert(1)&lt;/script&gt;<br>next')
+        self.assertEqual(render('see https://x.io/a?b=1&c=2.'),
+                         'see <a href="https://x.io/a?b=1&amp;c=2" rel="nofollow noopener">https://x.io/a?b=1&amp;c=2</a>.')
+        self.assertEqual(render('[**site**](https://x.io)'),
+                         '<a href="https://x.io" rel="nofollow noopener"><strong>site</strong></a>')
+        self.assertEqual(render('[x](javascript:alert(1)) [y](https://x.io/"onclick=z)'),
+                         '[x](javascript:alert(1)) [y](<a href="https://x.io/" rel="nofollow noopener">'
+                         'https://x.io/</a>&quot;onclick=z)')
+        self.assertEqual(render('snake_case_name 2*3*4'), 'snake_case_name 2*3*4')
+
+    def test_unclosed_delimiters_render_in_linear_time(self):
+        for text in ('**a ' * 25_000, '*a ' * 30_000, '_a ' * 30_000, '[a ' * 30_000, '**' * 50_000):
+            began = time.perf_counter()
+            self.assertEqual(markup.render_comment(text), escape(text.strip()))
+            self.assertLess(time.perf_counter() - began, 1.0, text[:4])
+
+    def test_overlong_comment_is_rejected(self):
+        self.group.members.add(self.bob)
+        self.client.login(username='bob', password='pass')
+        url = reverse('chipin:group_detail', args=[self.group.id])
+        self.client.post(url, {'content': 'x' * (COMMENT_MAX_LENGTH + 1)})
+        self.assertFalse(self.group.comments.exists())
+
+    def test_html_is_stored_on_save_with_member_mentions(self):
+        comment = Comment.objects.create(user=self.alice, group=self.group, content='hi @alice and @bob')
+        self.assertEqual(comment.content_html, 'hi <span class="mention">@alice</span> and @bob')
+        self.group.members.add(self.bob)
+        comment.content = 'thanks @bob'
+        comment.save()
+        self.assertEqual(Comment.objects.get(id=comment.id).content_html, 'thanks <span class="mention">@bob</span>')
+
+    def test_group_page_emits_stored_html(self):
+        Comment.objects.create(user=self.alice, group=self.group, content='**hello** <i>')
+        self.client.login(username='alice', password='pass')
+        response = self.client.get(reverse('chipin:group_detail', args=[self.group.id]))
+        self.assertContains(response, '<strong>hello</strong> &lt;i&gt;')
+
+    def test_backfill_renders_rows_without_html(self):
+        Comment.objects.bulk_create(Comment(user=self.alice, group=self.group, content=f'*c{i}*') for i in range(5))
+        Comment.objects.create(user=self.alice, group=self.group, content='done')
+        out = StringIO()
+        call_command('render_comments', chunk_size=2, stdout=out)
+        self.assertIn('Rendered 5 comment(s).', out.getvalue())
+        self.assertFalse(Comment.objects.filter(content_html='').exists())
+        self.assertEqual(Comment.objects.filter(content='*c0*').get().content_html, '<em>c0</em>')
+
+
+class AffordabilityMatrixTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='alice', password='pass')
+        self.poor = User.objects.create_user(username='bob', password='pass')
+        self.poor.profile.max_spend = Decimal('10.00')
+        self.poor.profile.save()
+        self.group = Group.objects.create(name='trip', admin=self.admin)
+        self.group.members.add(self.admin, self.poor)
+        now = timezone.now()
+        self.cheap = Event.objects.create(name='cheap', date=now, total_spend=Decimal('20.00'), group=self.group)
+        self.pricey = Event.objects.create(name='pricey', date=now, total_spend=Decimal('20.02'), group=self.group)
+
+    def test_matrix_matches_decimal_share_exactly(self):
+        matrix = AffordabilityMatrix.for_group(self.group)
+        self.assertEqual(list(matrix.all_eligible()), [True, False])
+        self.assertEqual(list(matrix.eligible_for(self.poor.id)), [True, False])
+        self.assertEqual(matrix.shortfalls()[1][1], [self.poor.id])
+
+    def test_refresh_statuses_updates_in_bulk(self):
+        changed = AffordabilityMatrix.for_group(self.group).refresh_statuses()
+        self.assertEqual(changed, 1)
+        self.cheap.refresh_from_db()
+        self.pricey.refresh_from_db()
+        self.assertEqual(self.cheap.status, Event.Status.ACTIVE)
+        self.assertEqual(self.pricey.status, Event.Status.PENDING)
+
+    def test_check_status_uses_the_matrix(self):
+        self.assertEqual(self.cheap.check_status(), Event.Status.ACTIVE)
+        self.assertEqual(self.pricey.check_status(), Event.Status.PENDING)
+        for i in range(5):
+            self.group.members.add(User.objects.create_user(username=f'extra{i}', password='pass'))
+        # one profile read, the save and its two calendar version bumps, however many members there are
+        with self.assertNumQueries(4):
+            self.pricey.check_status()
+
+    def test_affordability_page_lists_members_who_cannot_pay(self):
+        self.client.login(username='alice', password='pass')
+        response = self.client.get(reverse('chipin:group_affordability', args=[self.group.id]))
+        self.assertContains(response, 'Share above max spend: bob')
+
+    def test_group_detail_uses_matrix_for_current_user(self):
+        self.client.login(username='bob', password='pass')
+        response = self.client.get(reverse('chipin:group_detail', args=[self.group.id]))
+        info = response.context['event_share_info']
+        self.assertTrue(info[self.cheap]['eligible'])
+        self.assertFalse(info[self.pricey]['eligible'])
+        self.assertEqual(info[self.cheap]['share'], Decimal('10.00'))
+
+
+class StaticBuildTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+        }
+        overrides = override_settings(STATIC_ROOT=self.root, STORAGES=storages)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command('build_static', stdout=StringIO(), stderr=StringIO())
+
+    def _get(self, path, encoding=''):
+        captured = {}
+        def start_response(status, headers):
+            captured['status'], captured['headers'] = status, dict(headers)
+        app = StaticFilesApp(lambda environ, start: [b'django'], root=self.root, prefix='/static/')
+        body = b''.join(app({'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'HTTP_ACCEPT_ENCODING': encoding}, start_response))
+        return captured.get('headers', {}), body
+
+    def test_hashed_css_is_served_precompressed_and_immutable(self):
+        hashed = staticfiles_storage.stored_name('chipin/styles.css')
+        self.assertNotEqual(hashed, 'chipin/styles.css')
+        self.assertTrue(os.path.exists(os.path.join(self.root, hashed + '.gz')))
+        headers, body = self._get('/static/' + hashed, encoding='gzip, deflate')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertIn('immutable', headers['Cache-Control'])
+        headers, _ = self._get('/static/' + hashed)
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_encodings_refused_with_q_0_are_not_served(self):
+        hashed = staticfiles_storage.stored_name('chipin/styles.css')
+        headers, _ = self._get('/static/' + hashed, encoding='gzip;q=0, deflate')
+        self.assertNotIn('Content-Encoding', headers)
+        headers, _ = self._get('/static/' + hashed, encoding='br;q=0, GZIP; q=0.5')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+
+    def test_built_urls_follow_a_reloaded_manifest(self):
+        self.assertEqual(_built_url('chipin/styles.css'), staticfiles_storage.url('chipin/styles.css'))
+        staticfiles_storage.hashed_files = {
+            **staticfiles_storage.hashed_files, 'chipin/styles.css': 'chipin/styles.0123456789ab.css',
+        }
+        self.assertEqual(_built_url('chipin/styles.css'), settings.STATIC_URL + 'chipin/styles.0123456789ab.css')
+        staticfiles_storage.hashed_files = {}
+        self.assertEqual(_built_url('chipin/styles.css'), '')
+
+    def test_paths_outside_static_root_fall_through_to_django(self):
+        headers, body = self._get('/static/../../etc/passwd')
+        self.assertEqual(body, b'django')
+
+
+class SettlementAndAdminTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='alice', password='pass', email='a@example.com')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.group = Group.objects.create(name='trip', admin=self.admin)
+        self.group.members.add(self.admin, self.bob)
+        self.event = Event.objects.create(name='dinner', date=timezone.now(), total_spend=Decimal('50.00'), group=self.group)
+
+    def test_transfer_funds_moves_money_and_archives(self):
+        self.client.login(username='alice', password='pass')
+        url = reverse('chipin:transfer_funds', args=[self.group.id, self.event.id])
+        self.client.post(url)
+        self.bob.profile.refresh_from_db()
+        self.admin.profile.refresh_from_db()
+        self.assertEqual(self.bob.profile.balance, Decimal('75.00'))
+        self.assertEqual(self.admin.profile.balance, Decimal('125.00'))
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.status, Event.Status.ARCHIVED)
+        # a second transfer is refused
+        self.client.post(url)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_transfers_invites_and_votes_are_audited(self):
+        audit.flush()
+        AuditEntry.objects.all().delete()
+        carol = User.objects.create_user(username='carol', password='pass')
+        join_request = GroupJoinRequest.objects.create(user=carol, group=self.group)
+        self.client.login(username='alice', password='pass')
+        self.client.post(reverse('chipin:transfer_funds', args=[self.group.id, self.event.id]))
+        self.client.post(reverse('chipin:invite_users', args=[self.group.id]), {'user_id': carol.id})
+        self.client.get(reverse('chipin:vote_on_join_request', args=[self.group.id, join_request.id, 'approve']))
+        audit.flush()
+        entries = {e.action: e for e in AuditEntry.objects.filter(user=self.admin)}
+        self.assertEqual(set(entries), {
+            AuditEntry.Action.TRANSFER, AuditEntry.Action.INVITE, AuditEntry.Action.JOIN_VOTE,
+        })
+        self.assertEqual(entries[AuditEntry.Action.TRANSFER].target, f'event:{self.event.id}')
+        self.assertEqual(entries[AuditEntry.Action.TRANSFER].data['share'], '25.00')
+        self.assertEqual(entries[AuditEntry.Action.INVITE].data, {'invited': carol.id})
+        self.assertEqual(entries[AuditEntry.Action.JOIN_VOTE].data, {'applicant': carol.id, 'vote': 'approve'})
+
+    def test_event_changelist_query_count_does_not_grow_with_rows(self):
+        self.client.login(username='alice', password='pass')
+        url = reverse('admin:chipin_event_changelist')
+        # the first request also loads the session user into the cache
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for i in range(10):
+            other = Group.objects.create(name=f'g{i}', admin=self.bob)
+            Event.objects.create(name=f'e{i}', date=timezone.now(), total_spend=Decimal('1.00'), group=other)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+
+    def test_admin_actions_archive_and_settle(self):
+        self.client.login(username='alice', password='pass')
+        url = reverse('admin:chipin_event_changelist')
+        self.client.post(url, {'action': 'settle_events', '_selected_action': [self.event.id]})
+        self.bob.profile.refresh_from_db()
+        self.assertEqual(self.bob.profile.balance, Decimal('75.00'))
+        other = Event.objects.create(name='lunch', date=timezone.now(), total_spend=Decimal('5.00'), group=self.group)
+        self.client.post(url, {'action': 'archive_events', '_selected_action': [other.id]})
+        other.refresh_from_db()
+        self.assertEqual(other.status, Event.Status.ARCHIVED)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+
+class EventFeedTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        Profile.objects.filter(user=self.bob).update(max_spend=Decimal('10.00'))
+        self.trip = Group.objects.create(name='trip', admin=self.alice)
+        self.trip.members.add(self.alice, self.bob)
+        self.club = Group.objects.create(name='club', admin=self.alice)
+        self.club.members.add(self.alice, self.bob)
+        self.soon = timezone.now() + timezone.timedelta(days=1)
+
+    def event(self, group, total, **kwargs):
+        return Event.objects.create(name=f'{group.name} {total}', date=kwargs.pop('date', self.soon),
+                                    total_spend=Decimal(total), group=group, **kwargs)
+
+    def test_share_is_stored_rounded_up_and_follows_membership(self):
+        event = self.event(self.trip, '20.01')
+        self.assertEqual(event.share, Decimal('10.01'))
+        self.trip.members.add(*(User.objects.create_user(username=f'u{i}') for i in range(2)))
+        event.refresh_from_db()
+        self.assertEqual(event.share, Decimal('5.01'))
+        club = self.event(self.club, '9.00')
+        self.bob.group_memberships.clear()
+        event.refresh_from_db()
+        club.refresh_from_db()
+        self.assertEqual((event.share, club.share), (Decimal('6.67'), Decimal('9.00')))
+
+    def test_feed_lists_affordable_upcoming_events_across_groups(self):
+        cheap = self.event(self.trip, '20.00')
+        club = self.event(self.club, '4.00', date=self.soon + timezone.timedelta(hours=1))
+        self.event(self.trip, '20.02')  # share 10.01 is over bob's max spend
+        self.event(self.trip, '2.00', date=timezone.now() - timezone.timedelta(days=1))
+        self.event(self.club, '2.00', status=Event.Status.ARCHIVED)
+        self.event(Group.objects.create(name='other', admin=self.alice), '1.00')
+        self.event(self.club, '2.00').members.add(self.bob)
+        events, next_cursor = feed.joinable_events(self.bob, Decimal('10.00'))
+        self.assertEqual(events, [cheap, club])
+        self.assertIsNone(next_cursor)
+
+    def test_pages_follow_the_cursor_through_ties(self):
+        events = [self.event(self.trip if i % 2 else self.club, '2.00') for i in range(5)]
+        seen, after = [], None
+        while True:
+            page, next_cursor = feed.joinable_events(self.bob, Decimal('10.00'), after=after, limit=2)
+            seen += page
+            if next_cursor is None:
+                break
+            after = feed.parse_cursor(next_cursor)
+        self.assertEqual(seen, events)
+        self.assertIsNone(feed.parse_cursor('garbage'))
+
+    def test_feed_page(self):
+        self.event(self.trip, '20.00')
+        self.client.login(username='bob', password='pass')
+        response = self.client.get(reverse('chipin:event_feed'))
+        self.assertContains(response, 'trip 20.00')
+        self.assertContains(response, 'your share $10.00')
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.trip = Group.objects.create(name='trip', admin=self.alice)
+        self.trip.members.add(self.alice, self.bob)
+        self.soon = timezone.now() + timezone.timedelta(days=1)
+        Event.objects.create(name='Dinner, then; drinks', date=self.soon, total_spend=Decimal('30.00'), group=self.trip)
+        self.token = ical.token_for(self.bob)
+
+    def get(self, url, **headers):
+        response = self.client.get(url, headers=headers)
+        if response.streaming:
+            response.body = b''.join(response.streaming_content).decode()
+        return response
+
+    def test_feed_streams_upcoming_events_with_an_etag(self):
+        Event.objects.create(name='gone', date=timezone.now() - timezone.timedelta(days=2),
+                             total_spend=Decimal('1.00'), group=self.trip)
+        Event.objects.create(name='settled', date=self.soon, total_spend=Decimal('1.00'), group=self.trip,
+                             status=Event.Status.ARCHIVED)
+        response = self.get(reverse('chipin:calendar_feed', args=[self.token]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        self.assertTrue(response['ETag'].startswith(f'"u{self.bob.id}-'))
+        self.assertIn('SUMMARY:Dinner\\, then\\; drinks\r\n', response.body)
+        self.assertEqual(response.body.count('BEGIN:VEVENT'), 1)
+        self.assertIn(reverse('chipin:group_detail', args=[self.trip.id]), response.body)
+
+    def test_unchanged_feed_is_answered_from_the_version_columns(self):
+        url = reverse('chipin:group_calendar_feed', args=[self.token, self.trip.id])
+        etag = self.get(url)['ETag']
+        # the reader's profile and the group, by primary key
+        with self.assertNumQueries(2):
+            response = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_etag_moves_with_events_membership_and_archiving(self):
+        url = reverse('chipin:calendar_feed', args=[self.token])
+        etags = [self.get(url)['ETag']]
+        event = Event.objects.create(name='Lunch', date=self.soon, total_spend=Decimal('8.00'), group=self.trip)
+        etags.append(self.get(url)['ETag'])
+        club = Group.objects.create(name='club', admin=self.alice)
+        club.members.add(self.bob)
+        etags.append(self.get(url)['ETag'])
+        Event.objects.filter(id=event.id).update(status=Event.Status.ARCHIVED)
+        ical.invalidate_groups([self.trip.id])
+        response = self.get(url)
+        self.assertNotIn('Lunch', response.body)
+        etags.append(response['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+    def test_versions_are_read_from_the_database(self):
+        # another worker process moving the version is seen here: nothing is cached per process
+        url = reverse('chipin:calendar_feed', args=[self.token])
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, if_none_match=etag).status_code, 304)
+        Profile.objects.filter(user=self.bob).update(calendar_version=F('calendar_version') + 1)
+        self.assertEqual(self.get(url, if_none_match=etag).status_code, 200)
+
+    def test_resetting_the_links_revokes_old_urls(self):
+        old = reverse('chipin:calendar_feed', args=[self.token])
+        self.client.login(username='bob', password='pass')
+        self.assertContains(self.client.get(reverse('chipin:home')), old)
+        self.client.post(reverse('chipin:reset_calendar_links'))
+        self.assertEqual(self.get(old).status_code, 404)
+        new = reverse('chipin:calendar_feed', args=[ical.token_for(User.objects.get(id=self.bob.id))])
+        self.assertNotEqual(new, old)
+        self.assertEqual(self.get(new).status_code, 200)
+        self.assertContains(self.client.get(reverse('chipin:home')), new)
+
+    def test_bad_tokens_and_non_members_get_404(self):
+        self.assertEqual(self.get(reverse('chipin:calendar_feed', args=['bob:forged'])).status_code, 404)
+        self.assertIsNone(ical.token_owner(self.token + 'x'))
+        other = Group.objects.create(name='other', admin=self.alice)
+        url = reverse('chipin:group_calendar_feed', args=[self.token, other.id])
+        self.assertEqual(self.get(url).status_code, 404)
+        other.members.add(self.bob)
+        self.assertEqual(self.get(url).status_code, 200)
+        other.members.remove(self.bob)
+        self.assertEqual(self.get(url).status_code, 404)
+
+    def test_long_lines_are_folded(self):
+        name = 'x' * 60 + 'é' * 30
+        Event.objects.create(name=name, date=self.soon, total_spend=Decimal('1.00'), group=self.trip)
+        text = self.get(reverse('chipin:calendar_feed', args=[self.token])).body
+        self.assertTrue(all(len(line.encode()) <= 75 for line in text.split('\r\n')))
+        self.assertIn('SUMMARY:' + name, text.replace('\r\n ', ''))
+
+
+class GroupDeletionTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.group = Group.objects.create(name='doomed', admin=self.admin)
+        self.group.members.add(self.admin, self.bob)
+        event = Event.objects.create(name='e', date=timezone.now(), total_spend=Decimal('1.00'), group=self.group)
+        event.members.add(self.bob)
+        for i in range(7):
+            Comment.objects.create(user=self.bob, group=self.group, content=f'c{i}')
+        GroupJoinRequest.objects.create(user=self.bob, group=self.group)
+
+    def test_delete_hides_group_and_defers_purge(self):
+        self.client.login(username='alice', password='pass')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.get(reverse('chipin:delete_group', args=[self.group.id]))
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(Group.objects.filter(id=self.group.id).exists())
+        self.assertFalse(self.bob.group_memberships.exists())
+        self.assertEqual(self.client.get(reverse('chipin:group_detail', args=[self.group.id])).status_code, 404)
+        # rows are still there until the worker runs
+        self.assertEqual(Comment.objects.filter(group_id=self.group.id).count(), 7)
+
+    def test_hidden_group_refuses_transfers_and_comment_deletes(self):
+        Group.all_objects.filter(id=self.group.id).update(deleted_at=timezone.now())
+        event = Event.objects.get(group_id=self.group.id)
+        balance = Profile.objects.get(user=self.bob).balance
+        self.client.login(username='alice', password='pass')
+        response = self.client.post(reverse('chipin:transfer_funds', args=[self.group.id, event.id]))
+        self.assertEqual(response.status_code, 404)
+        event.refresh_from_db()
+        self.assertNotEqual(event.status, Event.Status.ARCHIVED)
+        self.assertEqual(Profile.objects.get(user=self.bob).balance, balance)
+        self.client.login(username='bob', password='pass')
+        comment = Comment.objects.filter(group_id=self.group.id).first()
+        self.assertEqual(self.client.post(reverse('chipin:delete_comment', args=[comment.id])).status_code, 404)
+        join_request = GroupJoinRequest.objects.get(group_id=self.group.id)
+        self.assertEqual(self.client.post(reverse('chipin:delete_join_request', args=[join_request.id])).status_code, 404)
+        self.assertEqual(Comment.objects.filter(group_id=self.group.id).count(), 7)
+        self.assertTrue(GroupJoinRequest.objects.filter(id=join_request.id).exists())
+
+    def test_purge_removes_dependents_in_chunks(self):
+        schedule_group_deletion(self.group)
+        deleted, _ = purge_group(self.group.id, chunk_size=3)
+        self.assertFalse(Group.all_objects.filter(id=self.group.id).exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertFalse(Event.objects.exists())
+        self.assertFalse(Event.members.through.objects.exists())
+        self.assertFalse(GroupJoinRequest.objects.exists())
+        self.assertFalse(MemberDirectory.objects.exists())
+        # comments, event, event member, join request, members and their directory rows, group
+        self.assertEqual(deleted, 7 + 1 + 1 + 1 + 2 + 2 + 1)
+
+    def test_purge_ignores_live_groups(self):
+        self.assertEqual(purge_group(self.group.id), (0, 0))
+        self.assertTrue(Group.objects.filter(id=self.group.id).exists())
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        User.objects.create_user(username='alice', password='pass')
+
+    def _client(self, **config):
+        overrides = override_settings(PROFILING={'ENABLED': True, 'SAMPLE_RATE': 1, 'DIR': self.dir, **config})
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        client = self.client_class()
+        client.login(username='alice', password='pass')
+        return client
+
+    def test_profiles_matching_views_and_rotates(self):
+        client = self._client(URL_NAMES=['chipin:home'], MAX_FILES=2)
+        for _ in range(3):
+            client.get(reverse('chipin:home'))
+        client.get(reverse('users:login'))
+        profiles = sorted(f for f in os.listdir(self.dir) if f.endswith('.prof'))
+        self.assertEqual(len(profiles), 2)
+        with open(os.path.join(self.dir, profiles[0][:-5] + '.json')) as f:
+            meta = json.load(f)
+        self.assertEqual((meta['url_name'], meta['user'], meta['status']), ('chipin:home', 'alice', 200))
+
+        out = StringIO()
+        call_command('profile_report', dir=self.dir, stdout=out)
+        self.assertIn('chipin:home: 2 request(s)', out.getvalue())
+        self.assertIn('cumtime', out.getvalue())
+
+    def test_latency_threshold_discards_fast_requests(self):
+        client = self._client(MIN_DURATION_MS=60_000)
+        client.get(reverse('chipin:home'))
+        self.assertEqual(os.listdir(self.dir), [])
+
+
+@override_settings(METRICS_TOKEN='scrape-me')
+class MetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.group = Group.objects.create(name='trip', admin=self.alice)
+        self.group.members.add(self.alice, self.bob)
+        self.client.login(username='alice', password='pass')
+
+    def test_endpoint_reports_requests_queries_and_settlements(self):
+        self.client.get(reverse('chipin:home'))
+        event = Event.objects.create(name='dinner', date=timezone.now(), total_spend=Decimal('50.00'), group=self.group)
+        self.client.post(reverse('chipin:transfer_funds', args=[self.group.id, event.id]))
+        body = self.scrape().content.decode()
+        self.assertIn(
+            'chipin_http_request_duration_seconds_count{view="chipin:home",method="GET",status="200"} 1', body)
+        self.assertIn('chipin_db_queries_total{view="chipin:home"}', body)
+        self.assertIn('chipin_settlements_total{mode="event"} 1', body)
+        self.assertIn('chipin_settlement_amount_total{mode="event"} 50.0', body)
+
+    def test_status_transitions_are_counted(self):
+        event = Event.objects.create(name='dinner', date=timezone.now(), total_spend=Decimal('2.00'), group=self.group)
+        event.check_status()
+        event.check_status()
+        snapshot = registry.snapshot()['chipin_event_status_transitions_total']
+        self.assertEqual(snapshot, {(Event.Status.PENDING, Event.Status.ACTIVE): 1})
+
+    def test_multiprocess_snapshots_are_summed(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        # another live worker's flushed totals, and those of one that was killed
+        dead = subprocess.Popen([sys.executable, '-c', ''])
+        dead.wait()
+        for pid, count in ((os.getppid(), 4), (dead.pid, 100)):
+            with open(os.path.join(tmp.name, f'{pid}.json'), 'w') as f:
+                json.dump({'chipin_settlements_total': [[['event'], count]]}, f)
+        with override_settings(METRICS_MULTIPROCESS_DIR=tmp.name):
+            SETTLEMENTS.inc(mode='event')
+            body = self.scrape().content.decode()
+        self.assertIn('chipin_settlements_total{mode="event"} 5', body)
+        self.assertIn(f'{os.getpid()}.json', os.listdir(tmp.name))
+        self.assertNotIn(f'{dead.pid}.json', os.listdir(tmp.name))
+
+    def test_finished_threads_are_folded_into_the_totals(self):
+        shards = len(registry._shards)
+        for _ in range(20):
+            thread = threading.Thread(target=SETTLEMENTS.inc, kwargs={'mode': 'event'})
+            thread.start()
+            thread.join()
+        gc.collect()
+        self.assertLessEqual(len(registry._shards), shards)
+        self.assertEqual(registry.snapshot()['chipin_settlements_total'], {('event',): 20})
+
+    def test_endpoint_needs_an_allowed_ip_and_the_token(self):
+        self.assertEqual(self.scrape().status_code, 200)
+        self.assertEqual(self.scrape(REMOTE_ADDR='203.0.113.5').status_code, 403)
+        # a reverse proxy on the same host: the peer is local but the token is missing
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        with override_settings(METRICS_TOKEN=None):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def scrape(self, **extra):
+        return self.client.get('/metrics', **{'HTTP_AUTHORIZATION': 'Bearer scrape-me', **extra})
+
+
+class WarmupTests(TestCase):
+    def test_warm_up_compiles_app_templates_into_the_cached_loader(self):
+        engine = engines['django'].engine
+        loader = engine.template_loaders[0]
+        loader.reset()
+        timings = warm_up()
+        self.assertIn('chipin/group_detail.html', loader.get_template_cache)
+        self.assertIn('users/login.html', loader.get_template_cache)
+        self.assertEqual(set(timings), {'imports', 'urls', 'templates'})
+        self.assertGreater(timings['urls'][0], 20)
+
+    def test_production_settings_cache_templates_and_connections(self):
+        from ssa_project import settings_production as prod
+        self.assertFalse(prod.DEBUG)
+        self.assertEqual(prod.TEMPLATES[0]['OPTIONS']['loaders'][0][0], 'django.template.loaders.cached.Loader')
+        self.assertFalse(prod.TEMPLATES[0]['APP_DIRS'])
+        self.assertGreater(prod.DATABASES['default']['CONN_MAX_AGE'], 0)
+        self.assertTrue(prod.WARMUP_ON_IMPORT)
+
+
+class BackupTests(TransactionTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.user = User.objects.create_user(username='alice', password='pass')
+        Group.objects.create(name='trip', admin=self.user)
+
+    def _restore(self, path):
+        with gzip.open(path) as f:
+            data = f.read()
+        restored = os.path.join(self.dir, 'restored.sqlite3')
+        with open(restored, 'wb') as f:
+            f.write(data)
+        db = sqlite3.connect(restored)
+        self.addCleanup(db.close)
+        return db
+
+    def test_snapshot_is_a_compressed_copy_and_old_ones_are_rotated(self):
+        out = StringIO()
+        for _ in range(3):
+            call_command('backup_db', dir=self.dir, keep=2, pages=8, stdout=out)
+        paths = backup.snapshots('default', self.dir)
+        self.assertEqual(len(paths), 2)
+        self.assertIn('removed', out.getvalue())
+        db = self._restore(paths[-1])
+        self.assertEqual(db.execute('SELECT name FROM chipin_group').fetchall(), [('trip',)])
+        self.assertEqual(backup.verify(paths[-1]), [])
+        self.assertEqual(backup.verify(paths[-1], full=True), [])
+
+    def test_verify_reports_a_damaged_snapshot(self):
+        path = backup.snapshot('default', self.dir)['path']
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) // 2)
+        self.assertTrue(backup.verify(path)[0].startswith('cannot decompress'))
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 of 1 snapshot(s) failed'):
+            call_command('backup_db', dir=self.dir, verify=[], stdout=out)
+        self.assertIn('FAILED', out.getvalue())
+
+    def test_copy_restarted_by_a_write_takes_bigger_steps(self):
+        source_path = os.path.join(self.dir, 'source.sqlite3')
+        source = sqlite3.connect(source_path)
+        self.addCleanup(source.close)
+        source.execute('CREATE TABLE t (x)')
+        source.executemany('INSERT INTO t VALUES (?)', [('x' * 500,) for _ in range(200)])
+        source.commit()
+        writer = sqlite3.connect(source_path)
+        self.addCleanup(writer.close)
+        writes = []
+
+        class WrittenToOnce:
+            def backup(self, target, pages, progress, sleep):
+                def step(status, remaining, total):
+                    if not writes:
+                        writes.append(writer.execute('INSERT INTO t VALUES (1)'))
+                        writer.commit()
+                    progress(status, remaining, total)
+                source.backup(target, pages=pages, progress=step, sleep=sleep)
+
+        steps, restarts, pages, _ = backup._copy(WrittenToOnce(), os.path.join(self.dir, 'copy.sqlite3'), 4, 0)
+        self.assertEqual((restarts, pages), (1, 8))
+        copy = sqlite3.connect(os.path.join(self.dir, 'copy.sqlite3'))
+        self.addCleanup(copy.close)
+        self.assertEqual(copy.execute('SELECT count(*) FROM t').fetchone(), (201,))
+
+
+class CommentSearchTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.group = Group.objects.create(name='trip', admin=self.alice)
+        self.group.members.add(self.alice)
+        self.other = Group.objects.create(name='other', admin=self.bob)
+        self.client.login(username='alice', password='pass')
+
+    def _comment(self, content, group=None):
+        return Comment.objects.create(user=self.alice, group=group or self.group, content=content)
+
+    def _index_size(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT count(*) FROM {search.FTS_TABLE}')
+            return cursor.fetchone()[0]
+
+    def test_index_follows_saves_and_deletes(self):
+        self.assertTrue(search.fts_enabled())
+        comment = self._comment('pizza on friday')
+        self.assertEqual(len(search.search_comments(self.group.id, 'pizza')[0]), 1)
+        comment.content = 'tacos on friday'
+        comment.save()
+        self.assertEqual(search.search_comments(self.group.id, 'pizza')[0], [])
+        self.assertEqual(len(search.search_comments(self.group.id, 'taco*')[0]), 1)
+        comment.delete()
+        self.assertEqual(self._index_size(), 0)
+
+    def test_results_are_scoped_ranked_highlighted_and_escaped(self):
+        self._comment('pizza pizza pizza')
+        self._comment('who wants <b>pizza</b> or pasta tonight')
+        self._comment('pizza', group=self.other)
+        hits, cursor = search.search_comments(self.group.id, 'pizza')
+        self.assertIsNone(cursor)
+        self.assertEqual(len(hits), 2)
+        self.assertEqual(hits[0]['snippet'].count('<mark>'), 3)
+        self.assertIn('&lt;b&gt;<mark>pizza</mark>&lt;/b&gt;', hits[1]['snippet'])
+        # an FTS operator in the query is searched for, not parsed
+        self.assertEqual(search.search_comments(self.group.id, 'pizza NOT pasta')[0], [])
+
+    def test_keyset_pages_cover_every_match_once(self):
+        ids = {self._comment(f'lunch {"plan " * i}').id for i in range(7)}
+        seen, cursor = [], None
+        while True:
+            hits, cursor = search.search_comments(self.group.id, 'lunch', after=cursor, limit=3)
+            seen += [hit['comment'].id for hit in hits]
+            if cursor is None:
+                break
+        self.assertEqual(sorted(seen), sorted(ids))
+
+    def test_pages_are_stable_while_comments_are_posted(self):
+        ids = {self._comment(f'lunch {"plan " * i}').id for i in range(7)}
+        hits, cursor = search.search_comments(self.group.id, 'lunch', limit=3)
+        seen = [hit['comment'].id for hit in hits]
+        # more rows shift every bm25 score; the new match is past the first page's snapshot
+        for i in range(40):
+            self._comment(f'unrelated chatter number {i}')
+        self._comment('lunch')
+        while cursor is not None:
+            hits, cursor = search.search_comments(self.group.id, 'lunch', after=cursor, limit=3)
+            seen += [hit['comment'].id for hit in hits]
+        self.assertEqual(sorted(seen), sorted(ids))
+
+    def test_fallback_without_fts(self):
+        self._comment('first pizza')
+        self._comment('second <i>pizza</i> night')
+        with mock.patch('chipin.search.fts_enabled', return_value=False):
+            hits, cursor = search.search_comments(self.group.id, 'PIZZA night', limit=1)
+        self.assertIsNone(cursor)
+        self.assertEqual(hits[0]['snippet'], 'second &lt;i&gt;<mark>pizza</mark>&lt;/i&gt; <mark>night</mark>')
+
+    def test_view_is_members_only(self):
+        self._comment('pizza tonight?')
+        url = reverse('chipin:comment_search', args=[self.group.id])
+        response = self.client.get(url, {'q': 'pizza'})
+        self.assertContains(response, '<mark>pizza</mark>')
+        response = self.client.get(reverse('chipin:comment_search', args=[self.other.id]), {'q': 'pizza'})
+        self.assertRedirects(response, reverse('chipin:group_detail', args=[self.other.id]), fetch_redirect_response=False)
+
+    def test_rebuild_keeps_writes_made_while_it_runs(self):
+        first, second = self._comment('bulk one'), self._comment('bulk two')
+        for i in range(4):
+            self._comment(f'bulk {i}')
+        token, calls = search._group_token, []
+
+        def write_midway(group_id):
+            calls.append(group_id)
+            if len(calls) == 3:
+                # the first chunk is committed and the live index still answers
+                self.assertEqual(len(search.search_comments(self.group.id, 'bulk')[0]), 6)
+                self._comment('late arrival')
+                first.content = 'edited'
+                first.save()
+                second.delete()
+            return token(group_id)
+
+        with mock.patch.object(search, '_group_token', side_effect=write_midway):
+            self.assertGreaterEqual(search.rebuild_index(chunk_size=2), 6)
+        self.assertEqual(len(search.search_comments(self.group.id, 'late')[0]), 1)
+        self.assertEqual(len(search.search_comments(self.group.id, 'edited')[0]), 1)
+        self.assertEqual(len(search.search_comments(self.group.id, 'bulk')[0]), 4)
+        self.assertEqual(self._index_size(), Comment.objects.count())
+
+    def test_rebuild_and_purge(self):
+        Comment.objects.bulk_create(Comment(user=self.alice, group=self.group, content=f'bulk {i}') for i in range(5))
+        self.assertEqual(search.search_comments(self.group.id, 'bulk')[0], [])
+        call_command('rebuild_comment_search', stdout=StringIO())
+        self.assertEqual(len(search.search_comments(self.group.id, 'bulk')[0]), 5)
+        self._comment('kept', group=self.other)
+        schedule_group_deletion(self.group)
+        purge_group(self.group.id, chunk_size=2)
+        self.assertEqual(self._index_size(), 1)
+
+
+class NettedSettlementTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.carol = User.objects.create_user(username='carol', password='pass')
+        self.group = Group.objects.create(name='trip', admin=self.admin)
+        self.group.members.add(self.admin, self.bob, self.carol)
+        self.events = [
+            Event.objects.create(name=f'e{i}', date=timezone.now(), total_spend=Decimal(spend),
+                                 group=self.group, status=Event.Status.ACTIVE)
+            for i, spend in enumerate(['30.00', '50.00', '10.00'])
+        ]
+        # only bob joined the last one
+        self.events[2].members.add(self.bob)
+
+    def _balances(self):
+        return dict(Profile.objects.values_list('user__username', 'balance'))
+
+    def test_simplify_debts_needs_at_most_n_minus_one_transfers(self):
+        nets = {1: Decimal('-40'), 2: Decimal('-10'), 3: Decimal('30'), 4: Decimal('20')}
+        transfers = settle.simplify_debts(nets)
+        self.assertLessEqual(len(transfers), 3)
+        moved = dict.fromkeys(nets, Decimal(0))
+        for debtor, creditor, amount in transfers:
+            moved[debtor] -= amount
+            moved[creditor] += amount
+        self.assertEqual(moved, nets)
+
+    def test_matches_per_event_settlement_with_fewer_writes(self):
+        with transaction.atomic():
+            with CaptureQueriesContext(connection) as per_event:
+                for event in self.events:
+                    settle.settle_event(Event.objects.get(id=event.id))
+            expected = self._balances()
+            ledger_rows = Transaction.objects.count()
+            transaction.set_rollback(True)
+
+        with CaptureQueriesContext(connection) as netted:
+            settlement, transfers, skipped = settle.settle_events_netted(self.group)
+        self.assertEqual(skipped, [])
+        for name, balance in self._balances().items():
+            self.assertAlmostEqual(balance, expected[name], delta=Decimal('0.01'))
+        self.assertEqual(len(transfers), 2)
+        self.assertEqual(Transaction.objects.count(), 4)
+        self.assertLess(Transaction.objects.count(), ledger_rows)
+
+        def writes(ctx):
+            return sum(1 for q in ctx.captured_queries if q['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE'))
+        self.assertLess(writes(netted), writes(per_event))
+
+        self.assertEqual(set(settlement.events.all()), set(self.events))
+        self.assertEqual(settlement.transactions.count(), 4)
+        self.assertFalse(Event.objects.exclude(status=Event.Status.ARCHIVED).exists())
+
+    def test_event_member_who_left_the_group_pays_from_their_balance(self):
+        self.events[2].members.add(self.carol)
+        self.group.members.remove(self.carol)
+        with transaction.atomic():
+            for event in self.events:
+                settle.settle_event(Event.objects.get(id=event.id))
+            expected = self._balances()
+            transaction.set_rollback(True)
+
+        settlement, transfers, skipped = settle.settle_events_netted(self.group)
+        self.assertEqual(skipped, [])
+        # cent rounding remainders stay with the admin
+        for name, balance in self._balances().items():
+            self.assertAlmostEqual(balance, expected[name], delta=Decimal('0.01'))
+        self.assertLess(expected['carol'], Decimal('100.00'))
+
+    def test_uneven_splits_keep_balances_on_the_ledger(self):
+        def discrepancies():
+            return [d for r in reconciliation.check(workers=1) for d in r[2]]
+
+        for name in ('x', 'y'):
+            event = Event.objects.create(name=name, date=timezone.now(), total_spend=Decimal('100.00'), group=self.group)
+            share, payers, _ = settle.settle_event(event)
+            self.assertEqual(share, Decimal('33.33'))
+        self.assertEqual(discrepancies(), [])
+        self.assertEqual(self._balances(), {
+            'alice': Decimal('233.32'), 'bob': Decimal('33.34'), 'carol': Decimal('33.34'),
+        })
+        # balances written before shares were rounded carry fractions of a cent
+        for _ in range(2):
+            Profile.objects.filter(user=self.bob).update(balance=F('balance') - Decimal(100) / 3 + Decimal('33.33'))
+        found = discrepancies()
+        self.assertEqual([d[0] for d in found], [self.bob.id])
+        self.assertEqual(reconciliation.repair(found), 1)
+        self.assertEqual(discrepancies(), [])
+
+    def test_view_is_admin_only_and_reports_skipped_events(self):
+        self.carol.profile.balance = Decimal('0')
+        self.carol.profile.save()
+        self.bob.profile.balance = Decimal('0')
+        self.bob.profile.save()
+        self.admin.profile.balance = Decimal('0')
+        self.admin.profile.save()
+        url = reverse('chipin:settle_group', args=[self.group.id])
+        self.client.login(username='bob', password='pass')
+        self.client.post(url)
+        self.assertFalse(Event.objects.filter(status=Event.Status.ARCHIVED).exists())
+        self.client.login(username='alice', password='pass')
+        response = self.client.post(url, follow=True)
+        self.assertContains(response, 'No members have a positive balance to contribute.')
+        self.assertFalse(Settlement.objects.exists())
+
+
+class LoadtestCommandTests(TestCase):
+    def test_summary_counts_errors_but_not_throttling(self):
+        samples = [('home', 0.010, 200), ('home', 0.020, 302), ('login', 0.030, 429),
+                   ('login', 0.040, 500), ('home', 0.050, 0)]
+        summary = loadtest._summarise(samples, elapsed=2.0)
+        self.assertEqual((summary['requests'], summary['throughput'], summary['throttled']), (5, 2.5, 1))
+        self.assertAlmostEqual(summary['error_rate'], 0.4)
+        self.assertAlmostEqual(summary['p50_ms'], 30.0)
+        self.assertAlmostEqual(summary['p99_ms'], 50.0)
+        self.assertEqual(loadtest._summarise([], elapsed=0)['throughput'], 0.0)
+
+    def test_compare_reports_deltas_for_shared_levels(self):
+        level = {'throughput': 100.0, 'p95_ms': 20.0, 'p99_ms': 40.0, 'error_rate': 0.01}
+        out = StringIO()
+        command = loadtest.Command(stdout=out)
+        command._compare({'label': 'before', 'levels': {'4': level}},
+                         {'levels': {'4': {**level, 'throughput': 90.0, 'p99_ms': 45.5}, '8': level}})
+        self.assertIn('Compared with before:', out.getvalue())
+        self.assertIn('c=4: throughput -10.0 req/s, p95 +0.0 ms, p99 +5.5 ms, errors +0.00 pts', out.getvalue())
+        self.assertNotIn('c=8', out.getvalue())
+
+    def test_refuses_to_run_without_debug_or_allow_db(self):
+        with self.assertRaisesMessage(CommandError, '--allow-db'):
+            call_command('loadtest', stdout=StringIO())
+        self.assertFalse(User.objects.filter(username__startswith=loadtest.USER_PREFIX).exists())
+
+    def test_setup_uses_the_run_password_and_teardown_removes_everything(self):
+        command = loadtest.Command()
+        leftover = User.objects.create_user(username=f'{loadtest.USER_PREFIX}0@example.com', password='old')
+        users, group, events = command._setup({'users': 3, 'events': 2}, 'run-secret')
+        self.assertEqual(len(users), 3)
+        self.assertEqual(len(events), 2)
+        self.assertIn(leftover, users)
+        self.assertTrue(all(User.objects.get(id=u.id).check_password('run-secret') for u in users))
+        command._teardown(users, group)
+        self.assertFalse(User.objects.filter(username__startswith=loadtest.USER_PREFIX).exists())
+        self.assertFalse(Group.all_objects.filter(id=group.id).exists())
+        self.assertFalse(Event.objects.filter(id__in=events).exists())
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.members = [User.objects.create_user(username=f'm{i}', password='pass') for i in range(5)]
+        self.group = Group.objects.create(name='trip', admin=self.alice)
+        self.group.members.add(self.alice, *self.members)
+
+    def test_fan_out_in_batches_skips_the_actor(self):
+        for _ in range(2):
+            sent = inbox.fan_out(self.group, InboxItem.Kind.EVENT, 'New event', actor=self.alice, batch_size=2)
+        self.assertEqual(sent, 5)
+        self.assertEqual(InboxItem.objects.count(), 10)
+        self.assertFalse(InboxItem.objects.filter(user=self.alice).exists())
+        self.assertEqual(set(UnreadCounter.objects.values_list('count', flat=True)), {2})
+        with self.assertNumQueries(1):
+            self.assertEqual(inbox.unread_counts(self.members[0]), {self.group.id: 2})
+
+    def test_comment_shows_on_home_until_the_group_is_opened(self):
+        self.client.login(username='alice', password='pass')
+        self.client.post(reverse('chipin:group_detail', args=[self.group.id]), {'content': 'hello'})
+        self.client.login(username='m0', password='pass')
+        self.assertContains(self.client.get(reverse('chipin:home')), '1 new')
+        self.assertContains(self.client.get(reverse('chipin:inbox')), 'alice in &quot;trip&quot;: hello')
+        self.client.get(reverse('chipin:group_detail', args=[self.group.id]))
+        self.assertNotContains(self.client.get(reverse('chipin:home')), '1 new')
+        self.assertEqual(inbox.unread_counts(self.alice), {})
+
+    def test_invite_notifies_only_the_invited_user(self):
+        outsider = User.objects.create_user(username='zed', password='pass')
+        self.client.login(username='alice', password='pass')
+        self.client.post(reverse('chipin:invite_users', args=[self.group.id]), {'user_id': outsider.id})
+        self.assertEqual(list(InboxItem.objects.values_list('user__username', 'kind')), [('zed', 'invite')])
+        self.assertEqual(inbox.unread_counts(outsider), {self.group.id: 1})
+
+    def test_trim_deletes_old_items_in_batches(self):
+        inbox.fan_out(self.group, InboxItem.Kind.COMMENT, 'old', actor=self.alice)
+        InboxItem.objects.update(created_at=timezone.now() - timezone.timedelta(days=40))
+        inbox.fan_out(self.group, InboxItem.Kind.COMMENT, 'new', actor=self.alice)
+        out = StringIO()
+        call_command('trim_inbox', batch_size=2, stdout=out)
+        self.assertIn('Deleted 5 inbox item(s).', out.getvalue())
+        self.assertEqual(set(InboxItem.objects.values_list('text', flat=True)), {'new'})
+
+
+    def test_trim_caps_unread_counters_at_the_items_left(self):
+        for text in ('old', 'older'):
+            inbox.fan_out(self.group, InboxItem.Kind.COMMENT, text, actor=self.alice)
+        InboxItem.objects.update(created_at=timezone.now() - timezone.timedelta(days=40))
+        inbox.fan_out(self.group, InboxItem.Kind.COMMENT, 'new', actor=self.alice)
+        self.assertEqual(inbox.unread_counts(self.members[0]), {self.group.id: 3})
+        inbox.trim_inbox(batch_size=1)
+        self.assertEqual(inbox.unread_counts(self.members[0]), {self.group.id: 1})
+        InboxItem.objects.update(created_at=timezone.now() - timezone.timedelta(days=40))
+        inbox.trim_inbox()
+        self.assertEqual(inbox.unread_counts(self.members[0]), {})
+
+# the views' query groups run on other threads and connections, so the data has to be committed
+@override_settings(ROOT_URLCONF='ssa_project.urls_asgi')
+class AsyncViewTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', password='pass')
+        self.bob = User.objects.create_user(username='bob', password='pass')
+        self.group = Group.objects.create(name='trip', admin=self.alice)
+        self.group.members.add(self.alice, self.bob)
+        Group.objects.create(name='other', admin=self.bob)
+        self.group.comments.create(user=self.alice, content='pizza tonight')
+        self.group.events.create(name='dinner', date=timezone.now(), total_spend=Decimal('20.00'))
+        inbox.fan_out(self.group, InboxItem.Kind.COMMENT, 'new', actor=self.alice)
+        registry.reset()
+
+    def test_asgi_serves_the_async_views(self):
+        from ssa_project.asgi import application
+        from . import async_views
+        self.assertEqual(application.request_class.urlconf, 'ssa_project.urls_asgi')
+        match = resolve(reverse('chipin:group_detail', args=[self.group.id]), 'ssa_project.urls_asgi')
+        self.assertIs(match.func, async_views.group_detail)
+
+    async def test_home(self):
+        await self.async_client.alogin(username='bob', password='pass')
+        response = await self.async_client.get(reverse('chipin:home'))
+        self.assertEqual([g.name for g in response.context['user_groups']], ['trip'])
+        self.assertEqual([g.name for g in response.context['available_groups']], ['other'])
+        self.assertContains(response, '1 new')
+        # queries made on the worker threads are counted towards the request
+        queries = registry.snapshot()['chipin_db_queries_total'][('chipin:home',)]
+        self.assertGreaterEqual(queries, 5)
+
+    async def test_group_detail(self):
+        await self.async_client.alogin(username='bob', password='pass')
+        response = await self.async_client.get(reverse('chipin:group_detail', args=[self.group.id]))
+        self.assertContains(response, 'pizza tonight')
+        self.assertContains(response, 'dinner')
+        self.assertEqual(await sync_to_async(inbox.unread_counts)(self.bob), {})
+        missing = await self.async_client.get(reverse('chipin:group_detail', args=[self.group.id + 100]))
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_posting_goes_through_the_sync_view(self):
+        await self.async_client.alogin(username='bob', password='pass')
+        url = reverse('chipin:group_detail', args=[self.group.id])
+        response = await self.async_client.post(url, {'content': 'see you there'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(await self.group.comments.acount(), 2)
+
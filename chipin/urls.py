@@ -3,6 +3,11 @@ from . import views
 
 urlpatterns = [
    path("", views.home, name="home"),
+   path('inbox/', views.inbox, name='inbox'),
+   path('events/', views.event_feed, name='event_feed'),
+   path('calendar/<str:token>.ics', views.calendar_feed, name='calendar_feed'),
+   path('calendar/<str:token>/group/<int:group_id>.ics', views.group_calendar_feed, name='group_calendar_feed'),
+   path('calendar/reset/', views.reset_calendar_links, name='reset_calendar_links'),
    path('create_group/', views.create_group, name='create_group'),
    path('group/<int:group_id>/', views.group_detail, name='group_detail'),
    path('group/<int:group_id>/invite/', views.invite_users, name='invite_users'),
@@ -16,6 +21,8 @@ urlpatterns = [
    path('group/<int:group_id>/edit/<int:edit_comment_id>/', views.group_detail, name='edit_comment'),
    # note: we removed the separate edit_comment endpoint in favour of inline editing above
    path('comment/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
+   path('group/<int:group_id>/comments/export/', views.export_comments, name='export_comments'),
+   path('group/<int:group_id>/comments/search/', views.comment_search, name='comment_search'),
    
    # optional helper route for third‑party invites
    path('group/<int:group_id>/web3invite/<int:invite_id>/', views.web3forms_invite, name='web3forms_invite'),
@@ -23,7 +30,9 @@ urlpatterns = [
    path('group/<int:group_id>/create_event/', views.create_event, name='create_event'),
   path('group/<int:group_id>/event/<int:event_id>/join/', views.join_event, name='join_event'),
   path('group/<int:group_id>/event/<int:event_id>/update_status/', views.update_event_status, name='update_event_status'),
+  path('group/<int:group_id>/affordability/', views.group_affordability, name='group_affordability'),
   path('group/<int:group_id>/event/<int:event_id>/leave/', views.leave_event, name='leave_event'),
   path('group/<int:group_id>/event/<int:event_id>/delete/', views.delete_event, name='delete_event'),
   path('group/<int:group_id>/event/<int:event_id>/transfer_funds/', views.transfer_funds, name='transfer_funds'),
+  path('group/<int:group_id>/settle/', views.settle_group, name='settle_group'),
 ]
\ No newline at end of file
@@ -0,0 +1,14 @@
+from django.urls import path
+from . import async_views, views
+from .urls import urlpatterns as sync_urlpatterns
+
+# chipin.urls with the read-heavy pages served by their async versions (see ssa_project.asgi)
+ASYNC_VIEWS = {
+    views.home: async_views.home,
+    views.group_detail: async_views.group_detail,
+}
+
+urlpatterns = [
+    path(str(p.pattern), ASYNC_VIEWS.get(p.callback, p.callback), p.default_args, p.name)
+    for p in sync_urlpatterns
+]
@@ -3,24 +3,39 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth import login
-from django.utils import timezone
 from django.conf import settings
-from .models import Group, Comment, Invite, GroupJoinRequest, Event
-from users.models import Transaction
+from .models import Group, Comment, Invite, GroupJoinRequest, Event, InboxItem, UnreadCounter
+from users.models import Profile, Transaction
+from users import audit
+from users.exports import streaming_export_response
 from .forms import GroupCreationForm, CommentForm
+from .affordability import AffordabilityMatrix
+from .settlement import settle_event, settle_events_netted, SettlementError
+from .deletion import schedule_group_deletion
+from .search import search_comments
+from .inbox import fan_out, mark_group_read, unread_counts
+from .directory import groups_for, member_ids
+from .feed import joinable_events, parse_cursor
+from . import ical
+from .sharding import across_shards, on_shard
 from django.urls import reverse
-from decimal import Decimal
-from django.db import transaction
-from django.db.models import F
+from django.http import Http404, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.http import require_safe
+from users.exports import buffered
 
 @login_required
 def home(request):
     profile = request.user.profile # Get the logged-in user's profile
     user = request.user
-    pending_invitations = user.pending_invitations.all() # Get pending group invitations for the current user
-    user_groups = user.group_memberships.all()  # Get groups the user is a member of
-    user_join_requests = GroupJoinRequest.objects.filter(user=user)  # Get join requests sent by the user
-    available_groups = Group.objects.exclude(members=user).exclude(join_requests__user=user) # Get groups the user is not a member of and the user has not requested to join
+    memberships = groups_for(user)  # one directory lookup, then the groups from their shards
+    pending_invitations = memberships['invited'] # Get pending group invitations for the current user
+    user_groups = memberships['member']  # Get groups the user is a member of
+    unread = unread_counts(user)  # one indexed query on the user's own counters
+    for group in user_groups:
+        group.unread = unread.get(group.id, 0)
+    user_join_requests = across_shards(GroupJoinRequest.objects.filter(user=user))  # Get join requests sent by the user
+    available_groups = across_shards(Group.objects.exclude(members=user).exclude(join_requests__user=user)) # Get groups the user is not a member of and the user has not requested to join
         # Get all transactions for the logged-in user, newest first
     transactions = Transaction.objects.filter(
         user=request.user
@@ -50,9 +65,9 @@ def create_group(request):
 
 @login_required
 def delete_group(request, group_id):
-    group = get_object_or_404(Group, id=group_id)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
     if request.user == group.admin:
-        group.delete()
+        schedule_group_deletion(group)
         messages.success(request, f'Group "{group.name}" has been deleted.')
     else:
         messages.error(request, "You do not have permission to delete this group.")
@@ -60,8 +75,8 @@ def delete_group(request, group_id):
 
 @login_required
 def invite_users(request, group_id):
-    group = get_object_or_404(Group, id=group_id)
-    users_not_in_group = User.objects.exclude(id__in=group.members.values_list('id', flat=True))
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    users_not_in_group = User.objects.exclude(id__in=member_ids(group.id))
     if request.method == 'POST':
         user_id = request.POST.get('user_id')
         invited_user = get_object_or_404(User, id=user_id)      
@@ -69,6 +84,10 @@ def invite_users(request, group_id):
             messages.info(request, f'{invited_user.username} has already been invited.')
         else:
             group.invited_users.add(invited_user)
+            audit.record(audit.Action.INVITE, user=request.user, request=request,
+                         target=f"group:{group.id}", invited=invited_user.id)
+            fan_out(group, InboxItem.Kind.INVITE, f'{request.user.username} invited you to join "{group.name}".',
+                    actor=request.user, recipients=[invited_user.id])
             messages.success(request, f'Invitation sent to {invited_user.username}.')
         return redirect('chipin:group_detail', group_id=group.id)  
     return render(request, 'chipin/invite_users.html', {
@@ -78,7 +97,8 @@ def invite_users(request, group_id):
 
 @login_required
 def web3forms_invite(request, group_id, invite_id):
-    invite = get_object_or_404(Invite, id=invite_id, group_id=group_id)
+    invite = get_object_or_404(on_shard(Invite, invite_id), id=invite_id, group_id=group_id,
+                               group__deleted_at__isnull=True)
     accept_link = invite.accept_url()
     WEB3FORMS_ACCESS_KEY = getattr(settings, "WEB3FORMS_ACCESS_KEY", "")
 
@@ -100,7 +120,7 @@ def web3forms_invite(request, group_id, invite_id):
 
 @login_required
 def accept_invite(request, group_id):
-    group = get_object_or_404(Group, id=group_id)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
     user_id = request.GET.get('user_id')
     if user_id:
         invited_user = get_object_or_404(User, id=user_id)
@@ -120,8 +140,8 @@ def accept_invite(request, group_id):
 def invite_sent(request):
     group_id = request.GET.get("group")
     invite_id = request.GET.get("invite")
-    group = get_object_or_404(Group, id=group_id) if group_id else None
-    invite = get_object_or_404(Invite, id=invite_id) if invite_id else None
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id) if group_id else None
+    invite = get_object_or_404(on_shard(Invite, invite_id), id=invite_id) if invite_id else None
     return render(
         request,
         "chipin/invite_sent.html",
@@ -133,28 +153,32 @@ def invite_sent(request):
 
 @login_required
 def request_to_join_group(request, group_id):
-    group = get_object_or_404(Group, id=group_id)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
     if request.user in group.members.all():
         messages.info(request, "You’re already a member of this group.")
     else:
-        existing = GroupJoinRequest.objects.filter(user=request.user, group=group).first()
-        if existing:
+        # the unique (user, group) constraint makes this safe against double submits
+        _, created = group.join_requests.get_or_create(user=request.user)
+        if not created:
             messages.info(request, "You have already requested to join this group.")
         else:
-            GroupJoinRequest.objects.create(user=request.user, group=group)
+            fan_out(group, InboxItem.Kind.JOIN_REQUEST, f'{request.user.username} asked to join "{group.name}".',
+                    actor=request.user)
             messages.success(request, "Your request to join the group has been submitted.")
     return redirect('chipin:group_detail', group_id=group.id)
 
 
 @login_required
 def vote_on_join_request(request, group_id, request_id, vote):
-    group = get_object_or_404(Group, id=group_id)
-    join_request = get_object_or_404(GroupJoinRequest, id=request_id, group=group)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    join_request = get_object_or_404(group.join_requests, id=request_id)
 
     if request.user not in group.members.all():
         messages.error(request, "Only group members may vote on join requests.")
         return redirect('chipin:group_detail', group_id=group.id)
 
+    audit.record(audit.Action.JOIN_VOTE, user=request.user, request=request, target=f"group:{group.id}",
+                 applicant=join_request.user_id, vote='approve' if vote == 'approve' else 'reject')
     if vote == 'approve':
         group.members.add(join_request.user)
         join_request.delete()
@@ -168,7 +192,7 @@ def vote_on_join_request(request, group_id, request_id, vote):
 
 @login_required
 def delete_join_request(request, request_id):
-    jr = get_object_or_404(GroupJoinRequest, id=request_id)
+    jr = get_object_or_404(on_shard(GroupJoinRequest, request_id), id=request_id, group__deleted_at__isnull=True)
     if jr.user == request.user or request.user == jr.group.admin:
         jr.delete()
         messages.success(request, "Join request removed.")
@@ -179,7 +203,7 @@ def delete_join_request(request, request_id):
 
 @login_required
 def leave_group(request, group_id):
-    group = get_object_or_404(Group, id=group_id)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
 
     if request.user not in group.members.all():
         messages.error(request, "You’re not a member of this group.")
@@ -190,23 +214,52 @@ def leave_group(request, group_id):
         return redirect("chipin:group_detail", group_id=group.id)
 
     group.members.remove(request.user)
+    UnreadCounter.objects.filter(user=request.user, group=group).delete()
     messages.success(request, f'You left "{group.name}".')
     return redirect("chipin:home")
 
 
 @login_required
 def delete_comment(request, comment_id):
-    comment = get_object_or_404(Comment, id=comment_id)
+    # comments of a group being purged are gone as far as views are concerned
+    comment = get_object_or_404(on_shard(Comment, comment_id), id=comment_id, group__deleted_at__isnull=True)
     if comment.user == request.user or request.user == comment.group.admin:  # Allow author or group admin to delete
         comment.delete()
     return redirect('chipin:group_detail', group_id=comment.group.id)
 
+COMMENT_EXPORT_FIELDS = ("id", "created_at", "user__username", "content")
+
+@login_required
+def export_comments(request, group_id):
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    if not group.members.filter(id=request.user.id).exists():
+        messages.error(request, "Only group members can export the group chat.")
+        return redirect('chipin:group_detail', group_id=group.id)
+    return streaming_export_response(
+        request, group.comments.all(), COMMENT_EXPORT_FIELDS, f"group-{group.id}-comments"
+    )
+
+@login_required
+def comment_search(request, group_id):
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    if not group.members.filter(id=request.user.id).exists():
+        messages.error(request, "Only group members can search the group chat.")
+        return redirect('chipin:group_detail', group_id=group.id)
+    query = request.GET.get('q', '').strip()
+    hits, next_cursor = search_comments(group.id, query, after=request.GET.get('after'))
+    return render(request, 'chipin/comment_search.html', {
+        'group': group,
+        'query': query,
+        'hits': hits,
+        'next_cursor': next_cursor,
+    })
+
 @login_required
 def group_detail(request, group_id, edit_comment_id=None):
-    group = get_object_or_404(Group, id=group_id)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
     comments = group.comments.all().order_by('-created_at')  # Fetch all comments for the group
     if edit_comment_id: # Fetch the comment to edit, if edit_comment_id is provided
-        comment_to_edit = get_object_or_404(Comment, id=edit_comment_id)
+        comment_to_edit = get_object_or_404(on_shard(Comment, edit_comment_id), id=edit_comment_id)
         # only the author or group admin can edit
         if comment_to_edit.user != request.user and request.user != group.admin:
             return redirect('chipin:group_detail', group_id=group.id)
@@ -227,28 +280,26 @@ def group_detail(request, group_id, edit_comment_id=None):
             comment.user = request.user
             comment.group = group
             comment.save()
+            if not comment_to_edit:
+                fan_out(group, InboxItem.Kind.COMMENT,
+                        f'{request.user.username} in "{group.name}": {comment.content[:100]}', actor=request.user)
             return redirect('chipin:group_detail', group_id=group.id)
     else:
         form = CommentForm(instance=comment_to_edit) if comment_to_edit else CommentForm()
+        mark_group_read(request.user, group)
     # include events if present (Event model added)
-    events = group.events.all() if hasattr(group, 'events') else []
-    # Calculate event share for each event and check user eligibility
+    events = list(group.events.all())
+    # One matrix covers share and eligibility for every event
+    matrix = AffordabilityMatrix.for_group(group, events=events)
+    eligible = matrix.eligible_for(request.user.id, max_spend=request.user.profile.max_spend)
+    joined_ids = set(group.events.filter(members=request.user).values_list('id', flat=True))
     event_share_info = {}
-    for event in events:
-        try:
-            event_share = event.calculate_share()
-        except Exception:
-            event_share = 0
-        try:
-            user_eligible = request.user.profile.max_spend >= event_share
-        except Exception:
-            user_eligible = False
-        user_has_joined = request.user in event.members.all() if hasattr(event, 'members') else False
+    for i, event in enumerate(events):
         event_share_info[event] = {
-            'share': event_share,
-            'eligible': user_eligible,
-            'status': getattr(event, 'status', None),
-            'joined': user_has_joined
+            'share': matrix.share(i),
+            'eligible': bool(eligible[i]),
+            'status': event.status,
+            'joined': event.id in joined_ids,
         }
     # Render page with events included
     return render(request, 'chipin/group_detail.html', {
@@ -262,7 +313,7 @@ def group_detail(request, group_id, edit_comment_id=None):
 
 @login_required
 def create_event(request, group_id):
-    group = get_object_or_404(Group, id=group_id)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
     if request.user != group.admin:
         messages.error(request, "Only the group administrator can create events.")
         return redirect('chipin:group_detail', group_id=group.id)
@@ -270,20 +321,20 @@ def create_event(request, group_id):
         event_name = request.POST.get('name')
         event_date = request.POST.get('date')
         total_spend = request.POST.get('total_spend')
-        event = Event.objects.create(
+        event = group.events.create(
             name=event_name,
             date=event_date,
             total_spend=total_spend,
-            group=group
         )
+        fan_out(group, InboxItem.Kind.EVENT, f'New event in "{group.name}": {event_name}', actor=request.user)
         messages.success(request, f'Event "{event_name}" created successfully!')
         return redirect('chipin:group_detail', group_id=group.id)
     return render(request, 'chipin/create_event.html', {'group': group})
 
 @login_required
 def join_event(request, group_id, event_id):
-    group = get_object_or_404(Group, id=group_id)
-    event = get_object_or_404(Event, id=event_id, group=group)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    event = get_object_or_404(group.events, id=event_id)
     event_share = event.calculate_share()  
     # Check if the user is eligible to join based on their max spend
     if request.user.profile.max_spend < event_share:
@@ -298,26 +349,20 @@ def join_event(request, group_id, event_id):
     messages.success(request, f"You have successfully joined the event '{event.name}'.")  
     # Optionally, update the event status if needed
     event.check_status()
-    event.save()
     return redirect('chipin:group_detail', group_id=group.id)
 
 
 @login_required
 def update_event_status(request, group_id, event_id):
-    group = get_object_or_404(Group, id=group_id)
-    event = get_object_or_404(Event, id=event_id, group=group)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    event = get_object_or_404(group.events, id=event_id)
     # Ensure that only the group admin can update the event status
     if request.user != group.admin:
         messages.error(request, "Only the group administrator can update the event status.")
         return redirect('chipin:group_detail', group_id=group.id)
-    # Calculate the share per member
-    event_share = event.calculate_share()
     # Check if all members can afford the event share
-    sufficient_funds = True
-    for member in group.members.all():
-        if member.profile.max_spend < event_share:
-            sufficient_funds = False
-            break
+    matrix = AffordabilityMatrix.for_group(group, events=[event])
+    sufficient_funds = bool(matrix.all_eligible()[0])
     # Update the event status based on the members' ability to cover the share
     if sufficient_funds:
         event.status = "Active"
@@ -329,10 +374,36 @@ def update_event_status(request, group_id, event_id):
     event.save()
     return redirect('chipin:group_detail', group_id=group.id)
 
+@login_required
+def group_affordability(request, group_id):
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    # Only the group admin sees who can't afford what
+    if request.user != group.admin:
+        messages.error(request, "Only the group administrator can view affordability.")
+        return redirect('chipin:group_detail', group_id=group.id)
+    matrix = AffordabilityMatrix.for_group(group)
+    if request.method == 'POST':
+        changed = matrix.refresh_statuses()
+        messages.success(request, f"Recalculated event statuses ({changed} changed).")
+        return redirect('chipin:group_affordability', group_id=group.id)
+    nicknames = dict(
+        Profile.objects.filter(user_id__in=member_ids(group.id)).values_list('user_id', 'nickname')
+    )
+    rows = [
+        {
+            'event': event,
+            'share': matrix.share(i),
+            'over_max_spend': [nicknames[uid] for uid in over],
+            'short_balance': [nicknames[uid] for uid in short],
+        }
+        for i, (event, over, short) in enumerate(matrix.shortfalls())
+    ]
+    return render(request, 'chipin/affordability.html', {'group': group, 'rows': rows})
+
 @login_required
 def leave_event(request, group_id, event_id):
-    group = get_object_or_404(Group, id=group_id)
-    event = get_object_or_404(Event, id=event_id, group=group)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    event = get_object_or_404(group.events, id=event_id)
     # Check if the user is part of the event
     if request.user not in event.members.all():
         messages.error(request, "You are not a member of this event.")
@@ -342,13 +413,12 @@ def leave_event(request, group_id, event_id):
     messages.success(request, f"You have successfully left the event '{event.name}'.")
     # Optionally, check if the event status should be updated
     event.check_status()
-    event.save()
     return redirect('chipin:group_detail', group_id=group.id)
 
 @login_required
 def delete_event(request, group_id, event_id):
-    group = get_object_or_404(Group, id=group_id)
-    event = get_object_or_404(Event, id=event_id, group=group)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    event = get_object_or_404(group.events, id=event_id)
     # Ensure only the group admin can delete the event
     if request.user != group.admin:
         messages.error(request, "Only the group administrator can delete events.")
@@ -364,89 +434,23 @@ def transfer_funds(request, group_id, event_id):
         messages.error(request, "Invalid request method for transferring funds.")
         return redirect('chipin:group_detail', group_id=group_id)
     
-    event = get_object_or_404(Event, id=event_id, group__id=group_id)
-    group = event.group
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    event = get_object_or_404(group.events, id=event_id)
     
     # Only the group admin can perform transfers
     if request.user != group.admin:
         messages.error(request, "Only the group admin can transfer funds.")
         return redirect('chipin:group_detail', group_id=group_id)
 
-    # Funds have already been transferred for this event
-    if event.status == Event.Status.ARCHIVED:
-        messages.error(request, "Funds have already been transferred for this event.")
-        return redirect('chipin:group_detail', group_id=group_id)
-    
-    # Start from event members; if none, fall back to group members
-    payers_qs = event.members.select_related("profile")
-    if not payers_qs.exists():
-        payers_qs = group.members.select_related("profile")
-    payers = list(payers_qs)
-
-    # Include admin
-    include_admin_in_payers = True
-    if include_admin_in_payers and group.admin not in payers:
-        payers.append(group.admin)
-
-    if not payers:
-        messages.error(request, "No payers found for this event.")
+    try:
+        final_share, final_payers, excluded = settle_event(event)
+    except SettlementError as e:
+        messages.error(request, str(e))
         return redirect('chipin:group_detail', group_id=group_id)
 
-    # Remove anyone with no money at all (balance ≤ 0)
-    rough_eligible = [u for u in payers if u.profile.balance > 0]
-
-    if not rough_eligible:
-        messages.error(request, "No members have a positive balance to contribute.")
-        return redirect('chipin:group_detail', group_id=group_id)
-
-    # Recalculate share using roughly eligible members
-    share = event.total_spend / Decimal(len(rough_eligible))
-
-    # Second pass: final eligibility check
-    final_payers = []
-    excluded = []
-    for u in rough_eligible:
-        if u.profile.balance >= share:
-            final_payers.append(u)
-        else:
-            excluded.append(u)
-    
-    if not final_payers:
-        messages.error(request, "No participants could afford the share amount. Transfer cancelled.")
-        return redirect('chipin:group_detail', group_id=group_id)
-
-    # Recalculate each payer's true share based on final payers
-    final_share = event.total_spend / Decimal(len(final_payers))
-
-    # All money movements and the event archive happen inside one atomic transaction
-    with transaction.atomic():
-        # Debit the final eligible payers
-        for u in final_payers:
-            u.profile.balance = F("balance") - final_share
-            u.profile.save(update_fields=["balance"])
-            Transaction.objects.create(
-                user=u,
-                amount=-final_share,
-                created_at=timezone.now(),
-                description=f"Contribution for event '{event.name}'"
-            )
-
-        # Credit admin with the *full* event spend
-        admin_profile = group.admin.profile
-        admin_profile.balance = F("balance") + event.total_spend
-        admin_profile.save(update_fields=["balance"])
-        Transaction.objects.create(
-            user=group.admin,
-            amount=event.total_spend,
-            created_at=timezone.now(),
-            description=f"Funds received for event '{event.name}'"
-        )
-
-        # Archive event
-        event.status = Event.Status.ARCHIVED
-        event.archived_at = timezone.now()
-        event.save(update_fields=["status", "archived_at"])
-
+    audit.record(audit.Action.TRANSFER, user=request.user, request=request, target=f"event:{event.id}",
+                 total=str(event.total_spend), share=str(final_share),
+                 payers=[u.id for u in final_payers], excluded=[u.id for u in excluded])
     msg = (
         f"Transferred ${event.total_spend} "
         f"(${final_share:.2f} each) "
@@ -459,4 +463,112 @@ def transfer_funds(request, group_id, event_id):
     
     messages.success(request, msg)
 
-    return redirect('chipin:group_detail', group_id=group_id)
\ No newline at end of file
+    return redirect('chipin:group_detail', group_id=group_id)
+
+@login_required
+def settle_group(request, group_id):
+    if request.method != "POST":
+        messages.error(request, "Invalid request method for transferring funds.")
+        return redirect('chipin:group_detail', group_id=group_id)
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    if request.user != group.admin:
+        messages.error(request, "Only the group admin can transfer funds.")
+        return redirect('chipin:group_detail', group_id=group_id)
+
+    try:
+        settlement, transfers, skipped = settle_events_netted(group)
+    except SettlementError as e:
+        messages.error(request, str(e))
+        return redirect('chipin:group_detail', group_id=group_id)
+
+    if settlement is None and not skipped:
+        messages.error(request, "There are no active events to settle.")
+    elif settlement is not None:
+        audit.record(audit.Action.SETTLEMENT, user=request.user, request=request,
+                     target=f"settlement:{settlement.id}", group=group.id,
+                     transfers=[[debtor, creditor, str(amount)] for debtor, creditor, amount in transfers])
+        events = settlement.events.count()
+        messages.success(request, f"Settled {events} event(s) with {len(transfers)} transfer(s).")
+    for event, reason in skipped:
+        messages.warning(request, f"{event.name}: {reason}")
+    return redirect('chipin:group_detail', group_id=group_id)
+
+INBOX_PAGE_SIZE = 50
+
+@login_required
+def inbox(request):
+    items = InboxItem.objects.filter(user=request.user).order_by('-id')
+    before = request.GET.get('before')
+    if before and before.isdigit():
+        items = items.filter(id__lt=before)
+    items = list(items[:INBOX_PAGE_SIZE + 1])
+    more = len(items) > INBOX_PAGE_SIZE
+    items = items[:INBOX_PAGE_SIZE]
+    return render(request, 'chipin/inbox.html', {
+        'items': items,
+        'next_before': items[-1].id if more else None,
+    })
+
+
+@login_required
+def event_feed(request):
+    # upcoming events across all the user's groups that fit their max spend
+    events, next_cursor = joinable_events(
+        request.user, request.user.profile.max_spend, after=parse_cursor(request.GET.get('after')),
+    )
+    return render(request, 'chipin/event_feed.html', {
+        'events': events,
+        'next_cursor': next_cursor,
+    })
+
+
+def _calendar_response(request, etag, events, name):
+    base = request.build_absolute_uri('/')[:-1]
+    link = lambda event: base + reverse('chipin:group_detail', args=[event.group_id])
+    response = StreamingHttpResponse(buffered(ical.render(events, name, link)), content_type='text/calendar; charset=utf-8')
+    response['ETag'] = etag
+    return response
+
+
+# Calendar apps subscribe without a session: the signed token in the URL names the user.
+# If-None-Match is answered from the version columns, before any event is read.
+@require_safe
+def calendar_feed(request, token):
+    owner = ical.token_owner(token)
+    if owner is None:
+        raise Http404
+    user_id, user_version = owner
+    etag = ical.user_etag(user_id, user_version)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+    user = get_object_or_404(User, id=user_id)
+    return _calendar_response(request, etag, ical.user_events(user, ical.window_start()), 'ChipIn events')
+
+
+@require_safe
+def group_calendar_feed(request, token, group_id):
+    owner = ical.token_owner(token)
+    group_version = ical.group_version(group_id) if owner is not None else None
+    if group_version is None:
+        raise Http404
+    user_id, user_version = owner
+    etag = ical.group_etag(group_id, group_version, user_version)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+    group = get_object_or_404(on_shard(Group, group_id), id=group_id)
+    if not member_ids(group.id).filter(user_id=user_id).exists():
+        raise Http404
+    return _calendar_response(request, etag, ical.group_events(group.id, ical.window_start()), group.name)
+
+
+@login_required
+def reset_calendar_links(request):
+    if request.method != "POST":
+        return redirect('chipin:home')
+    ical.rotate_key(request.user)
+    messages.success(request, "Your calendar links have been reset; subscribe again with the new ones.")
+    return redirect('chipin:home')
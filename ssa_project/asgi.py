@@ -9,8 +9,27 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.conf import settings
+from django.core.handlers import asgi
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ssa_project.settings')
 
-application = get_asgi_application()
+
+class ASGIRequest(asgi.ASGIRequest):
+    # the async home and group_detail views; wsgi.py keeps serving ROOT_URLCONF
+    urlconf = 'ssa_project.urls_asgi'
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    request_class = ASGIRequest
+
+
+# what get_asgi_application() does, with the request class above
+django.setup(set_prefix=False)
+application = ASGIHandler()
+
+if settings.WARMUP_ON_IMPORT:
+    # with gunicorn --preload this runs once in the master, before workers fork
+    from .warmup import warm_up
+    warm_up()
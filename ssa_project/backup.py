@@ -0,0 +1,168 @@
+"""
+Online snapshots of the SQLite databases.
+
+Copying db.sqlite3 while it is being written can produce a torn file, and
+stopping the writers to copy it stalls transfer_funds and comment posts.
+snapshot() uses SQLite's online backup API instead: it copies PAGES_PER_STEP
+pages under a shared lock, lets go of the lock for STEP_SLEEP seconds so
+waiting writers commit, and carries on. A write from another connection
+makes SQLite start the copy over, so under a steady stream of writes a copy
+in small steps would never finish; each restart therefore doubles the pages
+per step, and the copy completes in a handful of passes while the longest
+lock stays short on a quiet database. The result is gzipped next to the
+older snapshots of the same database and only the newest KEEP are kept.
+
+verify() decompresses a snapshot and runs PRAGMA quick_check on it (or the
+slower integrity_check, which also cross-checks every index). Each database
+(the default one and every group shard) is snapshotted on its own, so
+snapshots of different shards are not from the same instant.
+"""
+
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections
+
+DEFAULTS = {
+    "DIR": "backups",
+    "KEEP": 7,
+    "PAGES_PER_STEP": 256,
+    "STEP_SLEEP": 0.01,
+    "COMPRESSLEVEL": 6,
+}
+SUFFIX = ".sqlite3.gz"
+
+
+def backup_settings():
+    return {**DEFAULTS, **getattr(settings, "BACKUP", {})}
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy(source, target_path, pages, sleep):
+    """Back source up into target_path; returns (steps, restarts, final pages per step, longest step)."""
+    steps = restarts = 0
+    longest = 0.0
+    while True:
+        remaining = [None]
+        stepped_at = [time.perf_counter()]
+
+        def progress(status, left, total):
+            nonlocal steps, longest
+            now = time.perf_counter()
+            steps += 1
+            longest = max(longest, now - stepped_at[0])
+            # the sleep comes after this callback and is not part of the step
+            stepped_at[0] = now + sleep
+            if remaining[0] is not None and left >= remaining[0]:
+                raise _Restarted
+            remaining[0] = left
+
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target, pages=pages, progress=progress, sleep=sleep)
+            return steps, restarts, pages, longest
+        except _Restarted:
+            # written to mid-copy; the next pass starts over with bigger steps
+            restarts += 1
+            pages *= 2
+        finally:
+            target.close()
+
+
+def snapshot(alias, directory=None, pages=None, sleep=None, keep=None):
+    """Write a gzipped snapshot of the database alias; returns what it took."""
+    config = backup_settings()
+    directory = str(directory or config["DIR"])
+    pages = pages or config["PAGES_PER_STEP"]
+    sleep = config["STEP_SLEEP"] if sleep is None else sleep
+    keep = config["KEEP"] if keep is None else keep
+    connection = connections[alias]
+    if connection.vendor != "sqlite":
+        raise ValueError(f"{alias} is not an SQLite database")
+    if connection.in_atomic_block:
+        # the copy would wait forever on the transaction's own lock
+        raise ValueError(f"Cannot snapshot {alias} inside a transaction")
+    os.makedirs(directory, exist_ok=True)
+    connection.ensure_connection()
+    began = time.perf_counter()
+    fd, copy_path = tempfile.mkstemp(prefix=f".{alias}-", suffix=".sqlite3", dir=directory)
+    os.close(fd)
+    path = os.path.join(directory, f"{alias}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}{SUFFIX}")
+    try:
+        steps, restarts, final_pages, longest = _copy(connection.connection, copy_path, pages, sleep)
+        copied = time.perf_counter() - began
+        with open(copy_path, "rb") as src, gzip.open(path + ".tmp", "wb", config["COMPRESSLEVEL"]) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(path + ".tmp", path)
+        size = os.path.getsize(copy_path)
+    finally:
+        for leftover in (copy_path, path + ".tmp"):
+            try:
+                os.remove(leftover)
+            except FileNotFoundError:
+                pass
+    return {
+        "path": path,
+        "size": size,
+        "compressed": os.path.getsize(path),
+        "steps": steps,
+        "restarts": restarts,
+        "pages_per_step": final_pages,
+        "longest_step": longest,
+        "copy_seconds": copied,
+        "seconds": time.perf_counter() - began,
+        "removed": rotate(alias, directory, keep),
+    }
+
+
+def snapshots(alias, directory=None):
+    """Paths of the alias's snapshots in directory, oldest first."""
+    directory = str(directory or backup_settings()["DIR"])
+    if not os.path.isdir(directory):
+        return []
+    return [
+        os.path.join(directory, name)
+        for name in sorted(os.listdir(directory))
+        if name.startswith(f"{alias}-") and name.endswith(SUFFIX)
+    ]
+
+
+def rotate(alias, directory, keep):
+    """Delete all but the newest keep snapshots of alias; returns the paths removed."""
+    existing = snapshots(alias, directory)
+    stale = existing[:max(0, len(existing) - keep)]
+    for path in stale:
+        os.remove(path)
+    return stale
+
+
+def verify(path, full=False):
+    """Problems SQLite finds in a snapshot; an empty list means it is sound."""
+    directory = os.path.dirname(path) or "."
+    fd, copy_path = tempfile.mkstemp(prefix=".verify-", suffix=".sqlite3", dir=directory)
+    try:
+        try:
+            with os.fdopen(fd, "wb") as dst, gzip.open(path, "rb") as src:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        except (OSError, EOFError) as exc:
+            # not gzip, truncated or a bad CRC
+            return [f"cannot decompress: {exc}"]
+        db = sqlite3.connect(f"file:{copy_path}?mode=ro", uri=True)
+        try:
+            rows = db.execute("PRAGMA integrity_check" if full else "PRAGMA quick_check").fetchall()
+        except sqlite3.DatabaseError as exc:
+            return [str(exc)]
+        finally:
+            db.close()
+        return [row[0] for row in rows if row[0] != "ok"]
+    finally:
+        os.remove(copy_path)
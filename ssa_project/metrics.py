@@ -0,0 +1,409 @@
+"""
+In-process metrics with a Prometheus text endpoint.
+
+Every thread records into its own shard, so the hot path is a plain dict
+update with no locking; /metrics merges the shards when scraped. When a
+thread ends its shard is folded into the retired totals and dropped, so a
+thread-per-request server does not pile up one shard per request. Behind a
+pre-forking server set METRICS_MULTIPROCESS_DIR: each worker then writes a
+snapshot of its totals there (at most every METRICS_FLUSH_INTERVAL seconds),
+removes it when it exits, and /metrics sums the snapshots of the workers
+still alive.
+
+/metrics answers peers in METRICS_ALLOWED_IPS that send
+"Authorization: Bearer <METRICS_TOKEN>". Behind a reverse proxy on the same
+host every request comes from 127.0.0.1, so without a token it only answers
+when DEBUG is on.
+"""
+
+import atexit
+import bisect
+import contextvars
+import hmac
+import json
+import os
+import threading
+import time
+import weakref
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _merge(into, values):
+    """Add {key: number or list of numbers} values into into."""
+    for key, value in list(values.items()):
+        if isinstance(value, list):
+            total = into.setdefault(key, [0] * len(value))
+            for i, v in enumerate(value):
+                total[i] += v
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+class _ThreadSentinel:
+    # lives only in its thread's threading.local, so it is collected when the thread ends
+    pass
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._shards = []
+        self._retired = {}
+        # re-entrant: a thread's shard can be retired by garbage collection at any point
+        self._shards_lock = threading.RLock()
+        self._local = threading.local()
+
+    def shard(self):
+        values = getattr(self._local, "values", None)
+        if values is None:
+            # first record on this thread: the only time the registry lock is taken
+            values = self._local.values = {}
+            self._local.sentinel = _ThreadSentinel()
+            weakref.finalize(self._local.sentinel, self._retire, values)
+            with self._shards_lock:
+                self._shards.append(values)
+        return values
+
+    def _retire(self, values):
+        with self._shards_lock:
+            _merge(self._retired, values)
+            self._shards = [shard for shard in self._shards if shard is not values]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name, documentation):
+        return self._register(Gauge(self, name, documentation))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        """Totals for this process: {metric name: {label values: value}}."""
+        totals = {}
+        with self._shards_lock:
+            _merge(totals, self._retired)
+            shards = list(self._shards)
+        for values in shards:
+            _merge(totals, values)
+        merged = {}
+        for (name, labels), value in totals.items():
+            merged.setdefault(name, {})[labels] = value
+        for name, metric in self.metrics.items():
+            if metric.kind == "gauge":
+                merged[name] = {(): metric.function()}
+        return merged
+
+    def reset(self):
+        with self._shards_lock:
+            self._retired.clear()
+            for values in self._shards:
+                values.clear()
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry, self.name, self.documentation = registry, name, documentation
+        self.labelnames = tuple(labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = (self.name, tuple(str(labels[n]) for n in self.labelnames))
+        values = self.registry.shard()
+        values[key] = values.get(key, 0) + amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        self.registry, self.name, self.documentation = registry, name, documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = (self.name, tuple(str(labels[n]) for n in self.labelnames))
+        values = self.registry.shard()
+        # per-bucket counts (last slot is +Inf), then sum, then count
+        series = values.get(key)
+        if series is None:
+            series = values[key] = [0] * (len(self.buckets) + 3)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+
+class Gauge:
+    # read when scraped, from whatever function set_function() was given
+    kind = "gauge"
+    labelnames = ()
+
+    def __init__(self, registry, name, documentation):
+        self.registry, self.name, self.documentation = registry, name, documentation
+        self.function = lambda: 0
+
+    def set_function(self, function):
+        self.function = function
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram, self.labels = histogram, labels
+
+    def __enter__(self):
+        self.began = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.began, **self.labels)
+
+
+registry = Registry()
+# a forked worker must not report what its parent recorded before the fork
+os.register_at_fork(after_in_child=registry.reset)
+
+REQUEST_LATENCY = registry.histogram(
+    "chipin_http_request_duration_seconds", "Request latency by URL name.", ["view", "method", "status"])
+DB_QUERIES = registry.counter(
+    "chipin_db_queries_total", "Database queries executed, by URL name.", ["view"])
+DB_QUERY_SECONDS = registry.counter(
+    "chipin_db_query_seconds_total", "Time spent in database queries, by URL name.", ["view"])
+RECAPTCHA_LATENCY = registry.histogram(
+    "chipin_recaptcha_request_duration_seconds", "Latency of reCAPTCHA verification calls.")
+RECAPTCHA_FAILURES = registry.counter(
+    "chipin_recaptcha_failures_total", "Failed reCAPTCHA verifications.", ["reason"])
+SETTLEMENTS = registry.counter(
+    "chipin_settlements_total", "Completed fund transfers.", ["mode"])
+SETTLEMENT_AMOUNT = registry.counter(
+    "chipin_settlement_amount_total", "Money moved by fund transfers.", ["mode"])
+EVENT_STATUS_TRANSITIONS = registry.counter(
+    "chipin_event_status_transitions_total", "Event status changes.", ["from_status", "to_status"])
+AUDIT_ENTRIES = registry.counter(
+    "chipin_audit_entries_total", "Audit entries queued, by action.", ["action"])
+AUDIT_DROPPED = registry.counter(
+    "chipin_audit_dropped_total", "Audit entries dropped because the queue was full or a write failed.", ["reason"])
+AUDIT_WRITE_SECONDS = registry.histogram(
+    "chipin_audit_write_duration_seconds", "Time to write one batch of audit entries.")
+AUDIT_QUEUE_DEPTH = registry.gauge(
+    "chipin_audit_queue_depth", "Audit entries waiting to be written.")
+HASHING_QUEUE_WAIT = registry.histogram(
+    "chipin_password_hashing_queue_seconds", "Time a password hash waited for a hashing worker.")
+HASHING_REJECTED = registry.counter(
+    "chipin_password_hashing_rejected_total", "Password hashes refused because no worker came free.", ["reason"])
+HASHING_IN_FLIGHT = registry.gauge(
+    "chipin_password_hashing_in_flight", "Password hashes running or waiting for a worker.")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+def render(snapshot):
+    lines = []
+    for name, metric in registry.metrics.items():
+        lines.append(f"# HELP {name} {metric.documentation}")
+        lines.append(f"# TYPE {name} {metric.kind}")
+        for labels, value in sorted(snapshot.get(name, {}).items()):
+            if metric.kind != "histogram":
+                lines.append(f"{name}{_format_labels(metric.labelnames, labels)} {value}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + ("+Inf",), value):
+                cumulative += count
+                le = (("le", bound),)
+                lines.append(f"{name}_bucket{_format_labels(metric.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(metric.labelnames, labels)} {value[-2]}")
+            lines.append(f"{name}_count{_format_labels(metric.labelnames, labels)} {value[-1]}")
+    return "\n".join(lines) + "\n"
+
+
+# -- multi-process aggregation -------------------------------------------------
+
+def _multiprocess_dir():
+    return getattr(settings, "METRICS_MULTIPROCESS_DIR", None)
+
+
+def _encode(snapshot):
+    return {name: [[list(labels), value] for labels, value in series.items()] for name, series in snapshot.items()}
+
+
+def _decode(data):
+    return {name: {tuple(labels): value for labels, value in series} for name, series in data.items()}
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+_last_flush = 0.0
+
+
+def flush(force=False):
+    """Write this process's totals to the multiprocess directory."""
+    global _last_flush
+    directory = _multiprocess_dir()
+    now = time.monotonic()
+    if not directory or (not force and now - _last_flush < getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0)):
+        return
+    _last_flush = now
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{os.getpid()}.json")
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_encode(registry.snapshot()), f)
+    os.replace(tmp, path)
+
+
+def collect():
+    """Totals across every process that has flushed (or just this one)."""
+    directory = _multiprocess_dir()
+    if not directory:
+        return registry.snapshot()
+    flush(force=True)
+    merged = {}
+    for filename in os.listdir(directory):
+        pid = filename[:-len(".json")]
+        if not filename.endswith(".json") or not pid.isdigit():
+            continue
+        path = os.path.join(directory, filename)
+        if not _alive(int(pid)):
+            # a worker killed before it could remove its own snapshot
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                snapshot = _decode(json.load(f))
+        except (OSError, ValueError):
+            continue
+        for name, series in snapshot.items():
+            _merge(merged.setdefault(name, {}), series)
+    return merged
+
+
+def _remove_snapshot():
+    directory = _multiprocess_dir()
+    if directory:
+        try:
+            os.remove(os.path.join(directory, f"{os.getpid()}.json"))
+        except OSError:
+            pass
+
+
+atexit.register(_remove_snapshot)
+
+
+def _authorized(request):
+    if request.META.get("REMOTE_ADDR") not in getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1", "::1")):
+        return False
+    token = getattr(settings, "METRICS_TOKEN", None)
+    if not token:
+        return settings.DEBUG
+    return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+
+
+def metrics_view(request):
+    if not _authorized(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# [queries, seconds] of the request being served; sync_to_async copies it into
+# the threads a request's queries run on, so they all count towards one request
+_request_queries = contextvars.ContextVar("request_queries", default=None)
+
+
+def _count_queries(execute, sql, params, many, context):
+    stats = _request_queries.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    began = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - began
+
+
+@receiver(connection_created)
+def _watch_queries(sender, connection, **kwargs):
+    # first in the list: connection.execute_wrapper() pops whatever was appended last
+    if _count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _count_queries)
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    # an async view under ASGI stays on the event loop instead of the one sync thread
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # a connection opened before this module was imported
+        _watch_queries(None, connection)
+        stats = [0, 0.0]
+        token = _request_queries.set(stats)
+        began = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._observe(request, response, time.perf_counter() - began, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = [0, 0.0]
+        token = _request_queries.set(stats)
+        began = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self._observe(request, response, time.perf_counter() - began, stats)
+        return response
+
+    def _observe(self, request, response, elapsed, stats):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unresolved"
+        REQUEST_LATENCY.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        if stats[0]:
+            DB_QUERIES.inc(stats[0], view=view)
+            DB_QUERY_SECONDS.inc(stats[1], view=view)
+        flush()
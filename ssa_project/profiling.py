@@ -0,0 +1,120 @@
+"""
+Opt-in sampling profiler for production requests.
+
+Enable with PROFILING["ENABLED"]; when disabled the middleware removes itself
+at startup so there is no per-request cost. Sampled requests are run under
+cProfile and, if they match the filters, written to PROFILING["DIR"] as a
+.prof file with a .json sidecar holding the request metadata. Aggregate them
+with ``manage.py profile_report``.
+"""
+
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import Resolver404, resolve
+
+DEFAULTS = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 0.01,
+    "URL_NAMES": [],
+    "USERS": [],
+    "MIN_DURATION_MS": 0,
+    "DIR": "profiles",
+    "MAX_FILES": 500,
+}
+
+
+def profiling_settings():
+    return {**DEFAULTS, **getattr(settings, "PROFILING", {})}
+
+
+def _url_name(path):
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return None
+    return match.view_name
+
+
+class SamplingProfilerMiddleware:
+    # cProfile can only run one profiler at a time per process
+    _busy = threading.Lock()
+
+    def __init__(self, get_response):
+        config = profiling_settings()
+        if not config["ENABLED"]:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.rate = config["SAMPLE_RATE"]
+        self.url_names = set(config["URL_NAMES"])
+        self.users = set(config["USERS"])
+        self.min_duration = config["MIN_DURATION_MS"] / 1000
+        self.directory = str(config["DIR"])
+        self.max_files = config["MAX_FILES"]
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _wanted(self, request):
+        if random.random() >= self.rate:
+            return None
+        url_name = _url_name(request.path_info)
+        if self.url_names and url_name not in self.url_names:
+            return None
+        if self.users and getattr(request.user, "username", None) not in self.users:
+            return None
+        return url_name or ""
+
+    def __call__(self, request):
+        url_name = self._wanted(request)
+        if url_name is None or not self._busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profiler = cProfile.Profile()
+            began = time.perf_counter()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            duration = time.perf_counter() - began
+        finally:
+            self._busy.release()
+        if duration >= self.min_duration:
+            self._save(profiler, request, response, url_name, duration)
+        return response
+
+    def _save(self, profiler, request, response, url_name, duration):
+        stamp = datetime.now(timezone.utc)
+        base = os.path.join(
+            self.directory,
+            f"{stamp:%Y%m%dT%H%M%S%f}-{(url_name or 'unresolved').replace(':', '.')}-{os.getpid()}",
+        )
+        profiler.dump_stats(base + ".prof")
+        user = getattr(request, "user", None)
+        with open(base + ".json", "w") as f:
+            json.dump({
+                "url_name": url_name,
+                "path": request.path,
+                "method": request.method,
+                "status": response.status_code,
+                "user": user.username if user is not None and user.is_authenticated else None,
+                "duration_ms": round(duration * 1000, 3),
+                "timestamp": stamp.isoformat(),
+                "pid": os.getpid(),
+            }, f)
+        self._rotate()
+
+    def _rotate(self):
+        profiles = sorted(name for name in os.listdir(self.directory) if name.endswith(".prof"))
+        for name in profiles[:max(0, len(profiles) - self.max_files)]:
+            for suffix in (".prof", ".json"):
+                try:
+                    os.remove(os.path.join(self.directory, name[:-len(".prof")] + suffix))
+                except FileNotFoundError:
+                    pass
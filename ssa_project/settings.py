@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -18,14 +19,50 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
 ]
 MIDDLEWARE = [
+    'ssa_project.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'ssa_project.profiling.SamplingProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # 503 + Retry-After when every password hashing worker is taken
+    'users.hashers.HashingBusyMiddleware',
 ]
+# sampling request profiler; removes itself from MIDDLEWARE unless ENABLED
+PROFILING = {
+    'ENABLED': os.environ.get('PROFILING_ENABLED') == '1',
+    'SAMPLE_RATE': 0.01,
+    'URL_NAMES': [],        # e.g. ['chipin:group_detail', 'chipin:transfer_funds']
+    'USERS': [],            # usernames to profile; empty means everyone
+    'MIN_DURATION_MS': 0,   # only keep profiles of requests at least this slow
+    'DIR': BASE_DIR / 'profiles',
+    'MAX_FILES': 500,
+}
+# /metrics: set METRICS_MULTIPROCESS_DIR when running several worker processes
+METRICS_MULTIPROCESS_DIR = os.environ.get('METRICS_MULTIPROCESS_DIR')
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+# scrapers send "Authorization: Bearer <token>"; without one /metrics only answers with DEBUG on
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# audit trail of logins, invites, top-ups and transfers, written off-thread (see users.audit)
+AUDIT_LOG = {
+    'SINK': os.environ.get('AUDIT_LOG_SINK', 'db'),     # 'db' (users_auditentry) or 'jsonl'
+    'PATH': BASE_DIR / 'audit.jsonl',                    # the jsonl sink's file
+    'QUEUE_SIZE': 10_000,   # entries held in memory before new ones are dropped
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 1.0,  # seconds an entry may wait for its batch to fill
+}
+# manage.py backup_db: online, throttled snapshots of every database (see ssa_project.backup)
+BACKUP = {
+    'DIR': BASE_DIR / 'backups',
+    'KEEP': 7,               # snapshots kept per database
+    'PAGES_PER_STEP': 256,   # pages copied per lock; doubled each time a write restarts the copy
+    'STEP_SLEEP': 0.01,      # seconds between steps for waiting writers
+    'COMPRESSLEVEL': 6,
+}
 ROOT_URLCONF = 'ssa_project.urls'
 TEMPLATES = [{
 'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -39,10 +76,44 @@ TEMPLATES = [{
             ],},
 },]
 WSGI_APPLICATION = 'ssa_project.wsgi.application'
+CACHES = {'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+}}
+# token buckets checked before any reCAPTCHA call or password hashing
+THROTTLE_CACHE_ALIAS = 'default'
+THROTTLE_RATES = {
+    'login': {'ip': '20/min', 'username': '5/min'},
+    'register': {'ip': '5/min', 'username': '3/min'},
+}
+# sessions are only created on login; reads are served from the cache
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# request.user and request.user.profile come from the cache after the first request
+AUTHENTICATION_BACKENDS = ['users.backends.CachedUserBackend']
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = 60
 DATABASES = {'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
 }}
+# aliases holding group-scoped rows; settings_sharded.py spreads them over several files
+GROUP_SHARDS = ['default']
+DATABASE_ROUTERS = ['chipin.sharding.GroupShardRouter']
+# hashing runs on a bounded pool of threads (see users.hashers); PASSWORD_HASHER=argon2
+# hashes new passwords with Argon2 (needs argon2-cffi)
+PASSWORD_HASHERS = [
+    'users.hashers.PooledPBKDF2PasswordHasher',
+    'users.hashers.PooledArgon2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+if os.environ.get('PASSWORD_HASHER') == 'argon2':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+PASSWORD_HASHING = {
+    'WORKERS': os.cpu_count() or 1,  # hashes running at once; 0 hashes on the request thread
+    'QUEUE_SIZE': 32,       # requests allowed to wait for a worker before new ones are refused
+    'QUEUE_TIMEOUT': 2.0,   # seconds a request waits for a worker before it is refused
+}
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',},
@@ -54,4 +125,21 @@ TIME_ZONE = 'UTC'
 USE_I18N = True
 USE_TZ = True
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+# settings_production.py switches to hashed static names and a warmed-up, preloaded app
+WARMUP_ON_IMPORT = False
+# modules imported by ssa_project.warmup that would otherwise load on first use
+WARMUP_IMPORTS = [
+    'numpy',
+    'requests',
+    'chipin.affordability',
+    'chipin.settlement',
+    'chipin.deletion',
+    'users.exports',
+]
+# WebP variants rendered by build_static: source -> list of (name, height in px)
+STATIC_IMAGE_VARIANTS = {
+    'chipin/logo.jpg': [('chipin/logo.webp', 50), ('chipin/logo@2x.webp', 100)],
+    'chipin/logo1.jpg': [('chipin/logo1.webp', 50), ('chipin/logo1@2x.webp', 100)],
+}
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
\ No newline at end of file
@@ -0,0 +1,12 @@
+"""
+Load-test settings: DJANGO_SETTINGS_MODULE=ssa_project.settings_loadtest
+
+Builds on settings.py for the server that `manage.py loadtest` drives. The
+login view verifies reCAPTCHA tokens against the stub the command starts on
+its --stub-port (RECAPTCHA_VERIFY_URL overrides the address), so never
+serve real traffic with these settings.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+RECAPTCHA_VERIFY_URL = os.environ.get('RECAPTCHA_VERIFY_URL', 'http://127.0.0.1:8765/')
@@ -0,0 +1,45 @@
+"""
+Production settings: DJANGO_SETTINGS_MODULE=ssa_project.settings_production
+
+Builds on settings.py with DEBUG off, templates compiled once per process,
+persistent database connections, hashed static files and an app that is
+warmed up at import time (run gunicorn with --preload so that happens once,
+before the workers fork).
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', ','.join(ALLOWED_HOSTS)).split(',')
+
+# parse every template once per process instead of on each render
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+# keep connections open between requests instead of reconnecting each time
+DATABASES = {'default': {
+    **DATABASES['default'],
+    'CONN_MAX_AGE': int(os.environ.get('DJANGO_CONN_MAX_AGE', 600)),
+    'CONN_HEALTH_CHECKS': True,
+}}
+
+# content-hashed names; run `manage.py build_static` after deploying
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+}
+
+# ssa_project.warmup runs when wsgi.py/asgi.py is imported
+WARMUP_ON_IMPORT = True
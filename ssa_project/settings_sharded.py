@@ -0,0 +1,22 @@
+"""
+Sharded settings: DJANGO_SETTINGS_MODULE=ssa_project.settings_sharded
+
+Builds on settings.py with the global tables (users, profiles, the ledger,
+sessions, the inbox) in one SQLite file and group-scoped rows spread over
+DJANGO_SHARD_COUNT further files by chipin.sharding.GroupShardRouter.
+Create or upgrade every file with `manage.py migrate_shards`.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+SHARD_DIR = Path(os.environ.get('DJANGO_SHARD_DIR', BASE_DIR / 'shards'))
+SHARD_COUNT = int(os.environ.get('DJANGO_SHARD_COUNT', 4))
+
+DATABASES = {
+    'default': {**DATABASES['default'], 'NAME': SHARD_DIR / 'global.sqlite3'},
+    **{
+        f'shard_{i}': {**DATABASES['default'], 'NAME': SHARD_DIR / f'shard_{i}.sqlite3'}
+        for i in range(SHARD_COUNT)
+    },
+}
+GROUP_SHARDS = [f'shard_{i}' for i in range(SHARD_COUNT)]
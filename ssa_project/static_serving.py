@@ -0,0 +1,91 @@
+"""
+Minimal WSGI layer that serves STATIC_ROOT in front of Django.
+
+Prefers the .br / .gz files written by ``manage.py build_static`` when the
+client accepts them, and marks content-hashed files as immutable.
+"""
+
+import mimetypes
+import os
+import re
+from email.utils import formatdate
+
+from django.conf import settings
+
+# ManifestStaticFilesStorage names look like styles.3f2a9c1b04de.css
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.[^./]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=60"
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+class StaticFilesApp:
+    def __init__(self, application, root=None, prefix=None):
+        self.application = application
+        self.root = os.path.realpath(root or settings.STATIC_ROOT)
+        self.prefix = "/" + (prefix or settings.STATIC_URL).strip("/") + "/"
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if environ.get("REQUEST_METHOD") in ("GET", "HEAD") and path.startswith(self.prefix):
+            found = self._resolve(path[len(self.prefix):])
+            if found:
+                return self._serve(environ, start_response, found)
+        return self.application(environ, start_response)
+
+    def _resolve(self, name):
+        path = os.path.realpath(os.path.join(self.root, name))
+        # refuse anything that escapes STATIC_ROOT, and never serve the variants directly
+        if not path.startswith(self.root + os.sep) or path.endswith((".gz", ".br")):
+            return None
+        return path if os.path.isfile(path) else None
+
+    def _serve(self, environ, start_response, path):
+        accepted = _accepted_encodings(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        body_path, encoding = path, None
+        for name, suffix in ENCODINGS:
+            if name in accepted and os.path.isfile(path + suffix):
+                body_path, encoding = path + suffix, name
+                break
+        stat = os.stat(body_path)
+        content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        headers = [
+            ("Content-Type", content_type),
+            ("Content-Length", str(stat.st_size)),
+            ("Last-Modified", formatdate(stat.st_mtime, usegmt=True)),
+            ("Cache-Control", IMMUTABLE if HASHED_NAME.search(path) else REVALIDATE),
+            ("Vary", "Accept-Encoding"),
+        ]
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        start_response("200 OK", headers)
+        if environ["REQUEST_METHOD"] == "HEAD":
+            return [b""]
+        wrapper = environ.get("wsgi.file_wrapper")
+        if wrapper:
+            return wrapper(open(body_path, "rb"), 64 * 1024)
+        return _read_chunks(body_path)
+
+
+def _accepted_encodings(header):
+    """Codings the client takes; "gzip;q=0" (or a bad q) refuses gzip rather than asking for it."""
+    accepted = set()
+    for part in header.split(","):
+        name, *params = part.split(";")
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def _read_chunks(path, size=64 * 1024):
+    with open(path, "rb") as f:
+        while chunk := f.read(size):
+            yield chunk
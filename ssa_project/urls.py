@@ -1,9 +1,11 @@
 from django.contrib import admin 
 from django.urls import include, path
 from django.views.generic import RedirectView 
+from .metrics import metrics_view
 
 urlpatterns = [ 
 	path('admin/', admin.site.urls), 
+	path('metrics', metrics_view, name='metrics'),
 	path('users/', include(("users.urls", "users"), namespace="users")),
 	path('chipin/', include(("chipin.urls", "chipin"), namespace="chipin")),
         path("accounts/login/", RedirectView.as_view(pattern_name="users:login", permanent=False)),
@@ -0,0 +1,8 @@
+from django.urls import include, path
+from .urls import urlpatterns as wsgi_urlpatterns
+
+# ssa_project.urls with chipin's async views; ssa_project.asgi serves this URLconf
+urlpatterns = [
+    path('chipin/', include(("chipin.urls_asgi", "chipin"), namespace="chipin")),
+    *(p for p in wsgi_urlpatterns if getattr(p, 'namespace', None) != 'chipin'),
+]
@@ -9,8 +9,19 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ssa_project.settings')
 
 application = get_wsgi_application()
+
+if settings.WARMUP_ON_IMPORT:
+    # with gunicorn --preload this runs once in the master, before workers fork
+    from .warmup import warm_up
+    warm_up()
+
+if not settings.DEBUG:
+    # serve the output of `manage.py build_static` without a separate web server
+    from .static_serving import StaticFilesApp
+    application = StaticFilesApp(application)
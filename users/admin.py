@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import Profile
+from .models import AuditEntry, Profile, Transaction
+from .paginators import EstimatedCountPaginator
 
 class ProfileInline(admin.StackedInline):
     model = Profile
@@ -20,8 +21,40 @@ admin.site.register(User, UserAdmin)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ("user_username", "user_first_name", "user_last_name", "user_email", "nickname")
     search_fields = ("user__username", "user__first_name", "user__last_name", "user__email", "nickname")
+    list_select_related = ("user",)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    autocomplete_fields = ("user",)
 
     def user_username(self, obj): return obj.user.username
     def user_first_name(self, obj): return obj.user.first_name
     def user_last_name(self, obj): return obj.user.last_name
-    def user_email(self, obj): return obj.user.email
\ No newline at end of file
+    def user_email(self, obj): return obj.user.email
+
+@admin.register(Transaction)
+class TransactionAdmin(admin.ModelAdmin):
+    list_display = ("user", "amount", "description", "created_at")
+    search_fields = ("user__username", "description")
+    list_select_related = ("user",)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+    autocomplete_fields = ("user",)
+
+@admin.register(AuditEntry)
+class AuditEntryAdmin(admin.ModelAdmin):
+    list_display = ("created_at", "action", "user", "ip", "target")
+    list_filter = ("action",)
+    search_fields = ("target",)
+    list_select_related = ("user",)
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    # the trail is append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
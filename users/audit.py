@@ -0,0 +1,190 @@
+"""
+Audit trail for security-relevant and money-moving actions.
+
+record() only puts the entry on a bounded in-memory queue, so a login or a
+top-up pays for a put_nowait(), not an INSERT. A daemon thread takes what is
+queued, up to BATCH_SIZE entries or FLUSH_INTERVAL seconds' worth at a time,
+and writes them with one bulk_create() into users_auditentry (SINK "db") or
+appends them as JSON lines to PATH (SINK "jsonl"). When the writer falls
+behind and the queue is full, entries are dropped and counted instead of
+making requests wait; chipin_audit_queue_depth and chipin_audit_dropped_total
+on /metrics show the backpressure. The writer is given until the process
+exits to finish what is queued, and flush() waits for it on demand.
+
+An in-memory SQLite database (the test database) refuses writes from a
+second connection while a transaction is open, so with the "db" sink there
+no thread is started: entries wait for flush(), which writes them on the
+calling thread, and whatever is left at exit goes with the database.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from ssa_project.metrics import AUDIT_DROPPED, AUDIT_ENTRIES, AUDIT_QUEUE_DEPTH, AUDIT_WRITE_SECONDS
+from .models import AuditEntry
+
+logger = logging.getLogger(__name__)
+
+Action = AuditEntry.Action
+
+DEFAULTS = {
+    "SINK": "db",
+    "PATH": "audit.jsonl",
+    "QUEUE_SIZE": 10_000,
+    "BATCH_SIZE": 500,
+    "FLUSH_INTERVAL": 1.0,
+}
+# at most one "queue full" warning per this many seconds
+DROP_WARNING_INTERVAL = 60.0
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "AUDIT_LOG", {})}
+
+
+class AuditLog:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # one batch is written at a time, by the thread or by flush()
+        self._write_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._queue = None
+        self._thread = None
+        self._dropped = 0
+        self._warned_at = 0.0
+
+    def _ensure_queue(self):
+        with self._lock:
+            if self._queue is not None:
+                return self._queue
+            config = _config()
+            self._queue = queue.Queue(maxsize=config["QUEUE_SIZE"])
+            if not (config["SINK"] == "db" and _in_memory(DEFAULT_DB_ALIAS)):
+                self._thread = threading.Thread(target=self._run, args=(config,), daemon=True, name="audit-writer")
+                self._thread.start()
+            return self._queue
+
+    def depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def record(self, action, user=None, request=None, target="", **data):
+        """Queue an audit entry; returns False if it had to be dropped."""
+        entry = {
+            "created_at": timezone.now(),
+            "action": str(action),
+            "user_id": user.pk if user is not None and user.is_authenticated else None,
+            "ip": request.META.get("REMOTE_ADDR") if request is not None else None,
+            "target": str(target)[:100],
+            "data": data,
+        }
+        try:
+            pending = self._queue if self._queue is not None else self._ensure_queue()
+            pending.put_nowait(entry)
+        except queue.Full:
+            self._drop(1, "queue_full")
+            return False
+        AUDIT_ENTRIES.inc(action=entry["action"])
+        return True
+
+    def _drop(self, count, reason):
+        AUDIT_DROPPED.inc(count, reason=reason)
+        self._dropped += count
+        now = time.monotonic()
+        if now - self._warned_at >= DROP_WARNING_INTERVAL:
+            self._warned_at = now
+            logger.warning("Audit log dropped %d entries so far (%s, queue depth %d)",
+                           self._dropped, reason, self.depth())
+
+    def _run(self, config):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + config["FLUSH_INTERVAL"]
+            while len(batch) < config["BATCH_SIZE"]:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                with self._write_lock:
+                    self._write(batch, config)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+                connections.close_all()
+
+    def _write(self, batch, config):
+        try:
+            with AUDIT_WRITE_SECONDS.time():
+                if config["SINK"] == "jsonl":
+                    with open(config["PATH"], "a", encoding="utf-8") as f:
+                        f.writelines(
+                            json.dumps({**entry, "created_at": entry["created_at"].isoformat()}, default=str) + "\n"
+                            for entry in batch
+                        )
+                else:
+                    AuditEntry.objects.bulk_create([AuditEntry(**entry) for entry in batch])
+        except Exception:
+            logger.exception("Writing %d audit entries failed", len(batch))
+            self._drop(len(batch), "write_failed")
+
+    def flush(self, timeout=5.0):
+        """Write everything queued so far; returns False if the writer did not finish in time."""
+        if self._queue is None:
+            return True
+        if self._thread is not None:
+            # the writer thread empties the queue; wait for it
+            deadline = time.monotonic() + timeout
+            while self._queue.unfinished_tasks:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.01)
+            return True
+        config = _config()
+        with self._write_lock:
+            while True:
+                batch = []
+                while len(batch) < config["BATCH_SIZE"]:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return True
+                self._write(batch, config)
+                for _ in batch:
+                    self._queue.task_done()
+
+
+def _flush_at_exit():
+    # without a writer thread the database is in memory and goes with the process
+    if audit_log._thread is not None:
+        audit_log.flush()
+
+
+def _in_memory(alias):
+    connection = connections[alias]
+    return connection.vendor == "sqlite" and connection.is_in_memory_db()
+
+
+audit_log = AuditLog()
+record = audit_log.record
+flush = audit_log.flush
+
+AUDIT_QUEUE_DEPTH.set_function(audit_log.depth)
+# the writer thread does not survive a fork, and the parent's queue is the parent's to write
+os.register_at_fork(after_in_child=audit_log._reset)
+atexit.register(_flush_at_exit)
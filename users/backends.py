@@ -0,0 +1,69 @@
+"""
+Authentication backend that loads the session user and its profile together.
+
+The first request after login fetches the User with select_related("profile")
+and keeps it in the cache for AUTH_USER_CACHE_TIMEOUT seconds, so later
+requests resolve request.user and request.user.profile without a query.
+Saves and deletes of a User or Profile drop the entry; code that changes
+profiles with queryset.update() must call invalidate_users() itself. With
+several worker processes the cache has to be shared for invalidations to
+reach all of them; a per-process cache is only as fresh as the timeout.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Profile
+
+USER_CACHE_PREFIX = "users:auth-user:"
+
+
+def _cache():
+    return caches[getattr(settings, "AUTH_USER_CACHE_ALIAS", "default")]
+
+
+def _key(user_id):
+    return f"{USER_CACHE_PREFIX}{user_id}"
+
+
+def invalidate_users(user_ids):
+    """Forget the cached users now and again once the current transaction commits."""
+    keys = [_key(uid) for uid in set(user_ids)]
+    if not keys:
+        return
+    _cache().delete_many(keys)
+    # a request that read the old rows before the commit may have cached them again
+    transaction.on_commit(lambda: _cache().delete_many(keys))
+
+
+class CachedUserBackend(ModelBackend):
+    def get_user(self, user_id):
+        cache = _cache()
+        user = cache.get(_key(user_id))
+        if user is None:
+            try:
+                user = User._default_manager.select_related("profile").get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            cache.set(_key(user_id), user, getattr(settings, "AUTH_USER_CACHE_TIMEOUT", 60))
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        # ModelBackend.aget_user() would skip the cache and the profile
+        return await sync_to_async(self.get_user)(user_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def _user_changed(sender, instance, **kwargs):
+    invalidate_users([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Profile)
+def _profile_changed(sender, instance, **kwargs):
+    invalidate_users([instance.user_id])
@@ -0,0 +1,150 @@
+"""
+Password hashers that hash on a bounded worker pool.
+
+PBKDF2 and Argon2 are deliberately slow, and under a login storm every
+request thread would be busy hashing while cheap pages wait for a CPU. The
+hashers here have the same algorithm names as Django's, so stored hashes keep
+verifying, but hand the work to at most PASSWORD_HASHING['WORKERS'] threads.
+hashlib's PBKDF2 and argon2-cffi both release the GIL while they hash, so
+threads hash in parallel without the pickling of a process pool. A request
+that cannot get a worker within QUEUE_TIMEOUT seconds, or that finds
+QUEUE_SIZE requests already waiting, gets HashingBusy. HashingBusyMiddleware
+answers that with a 503 and Retry-After wherever it comes from (login,
+registration, the admin login, password change and reset, or the rehash
+check_password does on a successful login), instead of piling up.
+
+PooledArgon2PasswordHasher needs argon2-cffi and is tuned for logins on a
+shared box (19 MiB, two passes, one lane, the OWASP baseline) rather than
+Django's 100 MiB and eight lanes: the pool already runs hashes side by side,
+and memory stays bounded at WORKERS x 19 MiB. Put it first in
+PASSWORD_HASHERS (PASSWORD_HASHER=argon2) to hash new passwords with it;
+PBKDF2 hashes are upgraded as their owners log in.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher, PBKDF2PasswordHasher
+from django.shortcuts import render
+
+from ssa_project.metrics import HASHING_IN_FLIGHT, HASHING_QUEUE_WAIT, HASHING_REJECTED
+
+DEFAULTS = {
+    "WORKERS": os.cpu_count() or 1,
+    "QUEUE_SIZE": 32,
+    "QUEUE_TIMEOUT": 2.0,
+}
+
+
+def _config():
+    return {**DEFAULTS, **getattr(settings, "PASSWORD_HASHING", {})}
+
+
+class HashingBusy(Exception):
+    """No hashing worker was free in time; try again shortly."""
+
+
+def busy_response(request):
+    response = render(request, "users/busy.html", status=503)
+    response["Retry-After"] = str(int(_config()["QUEUE_TIMEOUT"]) + 1)
+    return response
+
+
+class HashingBusyMiddleware:
+    """Turns HashingBusy raised by any view into the 503 page."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        if isinstance(exception, HashingBusy):
+            return busy_response(request)
+        return None
+
+
+class HashingPool:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._reset()
+
+    def _reset(self):
+        self._executor = None
+        self._workers = 0
+        self._pending = 0
+
+    def in_flight(self):
+        return self._pending
+
+    def _ensure(self, workers):
+        with self._lock:
+            if self._executor is None or self._workers != workers:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hasher")
+                self._workers = workers
+            return self._executor
+
+    def run(self, func, *args, **kwargs):
+        """func(*args, **kwargs) on a pool thread, or HashingBusy if none comes free in time."""
+        config = _config()
+        if not config["WORKERS"] or getattr(self._local, "worker", False):
+            # pool turned off, or a hasher calling itself (PBKDF2 verify() encodes)
+            return func(*args, **kwargs)
+        executor = self._ensure(config["WORKERS"])
+        with self._lock:
+            if self._pending >= config["WORKERS"] + config["QUEUE_SIZE"]:
+                HASHING_REJECTED.inc(reason="queue_full")
+                raise HashingBusy
+            self._pending += 1
+        started = threading.Event()
+
+        def job():
+            started.set()
+            self._local.worker = True
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.worker = False
+
+        queued_at = time.perf_counter()
+        try:
+            future = executor.submit(job)
+            if not started.wait(config["QUEUE_TIMEOUT"]) and future.cancel():
+                HASHING_REJECTED.inc(reason="timeout")
+                raise HashingBusy
+            HASHING_QUEUE_WAIT.observe(time.perf_counter() - queued_at)
+            return future.result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+pool = HashingPool()
+HASHING_IN_FLIGHT.set_function(pool.in_flight)
+# pool threads do not survive a fork
+os.register_at_fork(after_in_child=pool._reset)
+
+
+class PooledHasherMixin:
+    def encode(self, password, salt, *args, **kwargs):
+        return pool.run(super().encode, password, salt, *args, **kwargs)
+
+    def verify(self, password, encoded):
+        return pool.run(super().verify, password, encoded)
+
+
+class PooledPBKDF2PasswordHasher(PooledHasherMixin, PBKDF2PasswordHasher):
+    pass
+
+
+class PooledArgon2PasswordHasher(PooledHasherMixin, Argon2PasswordHasher):
+    time_cost = 2
+    memory_cost = 19 * 1024
+    parallelism = 1
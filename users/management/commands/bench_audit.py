@@ -0,0 +1,82 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.utils import timezone
+
+from ssa_project.metrics import registry
+from users import audit
+from users.models import AuditEntry
+
+
+def _median_us(times):
+    times = sorted(times)
+    return times[len(times) // 2] * 1e6
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare writing an audit row inside the request with queueing it for the writer thread, "
+        "and show drops when a burst overruns a small queue (bench rows are deleted afterwards)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, default=2000)
+        parser.add_argument("--burst-threads", type=int, default=8)
+        parser.add_argument("--burst-queue", type=int, default=500, help="QUEUE_SIZE during the burst")
+
+    def handle(self, *args, **options):
+        if audit._in_memory("default"):
+            raise CommandError("The db sink has no writer thread on an in-memory database.")
+        marker = f"bench-audit-{time.monotonic_ns()}"
+        n = options["entries"]
+        try:
+            inline = []
+            for i in range(n):
+                began = time.perf_counter()
+                AuditEntry.objects.create(created_at=timezone.now(), action=audit.Action.LOGIN,
+                                          target=marker, data={"i": i})
+                inline.append(time.perf_counter() - began)
+
+            log = audit.AuditLog()
+            queued = []
+            began_all = time.perf_counter()
+            for i in range(n):
+                began = time.perf_counter()
+                log.record(audit.Action.LOGIN, target=marker, i=i)
+                queued.append(time.perf_counter() - began)
+            log.flush(timeout=60)
+            drained = time.perf_counter() - began_all
+
+            registry.reset()
+            burst = audit.AuditLog()
+            depth = [0]
+
+            def hammer():
+                for i in range(n):
+                    burst.record(audit.Action.LOGIN, target=marker, i=i)
+                    depth[0] = max(depth[0], burst.depth())
+
+            with override_settings(AUDIT_LOG={**settings.AUDIT_LOG, "QUEUE_SIZE": options["burst_queue"]}):
+                threads = [threading.Thread(target=hammer) for _ in range(options["burst_threads"])]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                burst.flush(timeout=60)
+            dropped = registry.snapshot().get("chipin_audit_dropped_total", {}).get(("queue_full",), 0)
+        finally:
+            AuditEntry.objects.filter(target=marker).delete()
+
+        self.stdout.write(f"inline INSERT per entry: {_median_us(inline):.0f} us median, {max(inline) * 1e6:.0f} us slowest")
+        self.stdout.write(
+            f"queued record() per entry: {_median_us(queued):.1f} us median, {max(queued) * 1e6:.0f} us slowest; "
+            f"{n} entries written {drained * 1000:.0f} ms after the first was queued"
+        )
+        offered = n * options["burst_threads"]
+        self.stdout.write(
+            f"burst of {offered} from {options['burst_threads']} threads into a queue of {options['burst_queue']}: "
+            f"peak depth {depth[0]}, {dropped} dropped"
+        )
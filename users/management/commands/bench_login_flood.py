@@ -0,0 +1,130 @@
+import io
+import logging
+import sys
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+from django.urls import reverse
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(pct / 100 * len(sorted_values)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Serve the home page to browsing clients while others flood the login form with wrong "
+        "passwords, through the WSGI application with --threads worker threads, once hashing on the "
+        "request thread and once on the password hashing pool. Bench accounts are created and "
+        "deleted again afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=10.0, help="Per mode")
+        parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads")
+        parser.add_argument("--flooders", type=int, default=16, help="Clients posting logins")
+        parser.add_argument("--browsers", type=int, default=4, help="Clients loading the home page")
+        parser.add_argument("--workers", type=int, default=settings.PASSWORD_HASHING.get("WORKERS", 1),
+                            help="Hashing pool size in the pooled mode")
+
+    def _serve(self, application, workers, environ):
+        status = []
+        # a connection waits for a free worker thread before it is served
+        with workers:
+            b"".join(application(environ, lambda s, h, *a: status.append(s)))
+        return int(status[0][:3])
+
+    def _environ(self, method, path, cookie="", body=b""):
+        return {
+            "REQUEST_METHOD": method, "PATH_INFO": path, "QUERY_STRING": "",
+            "SERVER_NAME": "127.0.0.1", "SERVER_PORT": "8000", "REMOTE_ADDR": "127.0.0.1",
+            "SERVER_PROTOCOL": "HTTP/1.1", "HTTP_COOKIE": cookie,
+            "CONTENT_TYPE": "application/x-www-form-urlencoded", "CONTENT_LENGTH": str(len(body)),
+            "wsgi.input": io.BytesIO(body), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "http",
+            "wsgi.version": (1, 0), "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False,
+        }
+
+    def _run(self, application, options, cookie, csrf, victim):
+        workers = threading.Semaphore(options["threads"])
+        deadline = time.perf_counter() + options["seconds"]
+        pages, logins, lock = [], [], threading.Lock()
+        home = reverse("chipin:home")
+        login = reverse("users:login")
+        body = f"username={victim}&password=wrong&elapsed=3&csrfmiddlewaretoken={csrf}".encode()
+        csrf_cookie = f"{settings.CSRF_COOKIE_NAME}={csrf}"
+
+        def browse():
+            local = []
+            while time.perf_counter() < deadline:
+                began = time.perf_counter()
+                code = self._serve(application, workers, self._environ("GET", home, cookie))
+                local.append((time.perf_counter() - began, code))
+            with lock:
+                pages.extend(local)
+
+        def flood():
+            local = []
+            while time.perf_counter() < deadline:
+                began = time.perf_counter()
+                code = self._serve(application, workers, self._environ("POST", login, csrf_cookie, body))
+                local.append((time.perf_counter() - began, code))
+            with lock:
+                logins.extend(local)
+
+        clients = ([threading.Thread(target=browse) for _ in range(options["browsers"])]
+                   + [threading.Thread(target=flood) for _ in range(options["flooders"])])
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return pages, logins
+
+    def handle(self, *args, **options):
+        # get_wsgi_application() configures logging again, and every 503 would be logged as an error
+        from ssa_project.wsgi import application
+
+        logging.getLogger("django.request").setLevel(logging.CRITICAL)
+        stamp = time.monotonic_ns()
+        reader = User.objects.create_user(username=f"bench-flood-reader-{stamp}")
+        victim = User.objects.create_user(username=f"bench-flood-victim-{stamp}@example.com", password="right")
+        client = Client(SERVER_NAME="127.0.0.1")
+        client.force_login(reader)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        # the flood posts the form as a browser would, with the token the login page hands out
+        anonymous = Client(enforce_csrf_checks=True, SERVER_NAME="127.0.0.1")
+        anonymous.get(reverse("users:login"))
+        csrf = anonymous.cookies[settings.CSRF_COOKIE_NAME].value
+        # reCAPTCHA passes and throttling is off, so every POST reaches the hasher
+        stub = mock.Mock()
+        stub.json.return_value = {"success": True}
+        self.stdout.write(
+            f"{options['browsers']} browsing + {options['flooders']} flooding clients, "
+            f"{options['threads']} WSGI threads, {options['seconds']:g}s per mode"
+        )
+        self.stdout.write(
+            f"{'mode':>16} {'home p50':>9} {'home p99':>9} {'pages/s':>8} {'logins/s':>9} {'503s':>6}"
+        )
+        try:
+            with mock.patch("users.views.requests.post", return_value=stub), \
+                    override_settings(THROTTLE_RATES={}):
+                for label, pool in (("request thread", 0), (f"pool of {options['workers']}", options["workers"])):
+                    with override_settings(PASSWORD_HASHING={**settings.PASSWORD_HASHING, "WORKERS": pool}):
+                        pages, logins = self._run(application, options, cookie, csrf, victim.username)
+                    latencies = sorted(t for t, _ in pages)
+                    busy = sum(1 for _, code in logins if code == 503)
+                    self.stdout.write(
+                        f"{label:>16} {_percentile(latencies, 50) * 1000:>8.0f}ms "
+                        f"{_percentile(latencies, 99) * 1000:>8.0f}ms {len(pages) / options['seconds']:>8.1f} "
+                        f"{(len(logins) - busy) / options['seconds']:>9.1f} {busy:>6}"
+                    )
+        finally:
+            client.logout()
+            # profiles go with the users
+            User.objects.filter(id__in=[reader.id, victim.id]).delete()
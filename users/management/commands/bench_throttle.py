@@ -0,0 +1,56 @@
+import logging
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = "Simulate a credential-stuffing burst against login and report CPU saved by throttling."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=100)
+        parser.add_argument("--usernames", type=int, default=50, help="Distinct usernames tried by the attacker")
+
+    def _attack(self, total, usernames):
+        client = Client(REMOTE_ADDR="203.0.113.7")
+        url = reverse("users:login")
+        form = client.get(url).context
+        statuses = {}
+        began = time.process_time()
+        for i in range(total):
+            response = client.post(url, {
+                "hp_nonce": form["hp_nonce"],
+                form["hp_name"]: "",
+                "elapsed": "3.0",
+                "recaptcha-token": "stub",
+                "username": f"victim{i % usernames}@example.com",
+                "password": "hunter2",
+            })
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return time.process_time() - began, statuses
+
+    def handle(self, *args, **options):
+        # every rejected request would otherwise log a 429 warning
+        logging.getLogger("django.request").setLevel(logging.ERROR)
+        # reCAPTCHA is stubbed to always pass so every unthrottled request reaches PBKDF2
+        stub = mock.Mock()
+        stub.json.return_value = {"success": True}
+        results = {}
+        with mock.patch("users.views.requests.post", return_value=stub), \
+                override_settings(ALLOWED_HOSTS=["testserver"]), transaction.atomic():
+            for label, rates in (("unthrottled", {}), ("throttled", settings.THROTTLE_RATES)):
+                caches[getattr(settings, "THROTTLE_CACHE_ALIAS", "default")].clear()
+                with override_settings(THROTTLE_RATES=rates):
+                    results[label] = self._attack(options["requests"], options["usernames"])
+            transaction.set_rollback(True)
+
+        for label, (cpu, statuses) in results.items():
+            self.stdout.write(f"{label:12} cpu {cpu:.2f}s  responses {dict(sorted(statuses.items()))}")
+        base, limited = results["unthrottled"][0], results["throttled"][0]
+        self.stdout.write(f"CPU saved by throttling: {(1 - limited / base) * 100:.1f}%")
@@ -0,0 +1,53 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.reconciliation import RANGE_SIZE, check, repair
+
+REPORT_FIELDS = ("user_id", "balance", "expected", "difference", "ledger_rows")
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every Profile.balance against its opening amount plus the user's Transaction rows, "
+        "a range of user ids per worker process, and report (or --repair) the mismatches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU)")
+        parser.add_argument("--range-size", type=int, default=RANGE_SIZE, help="User ids per aggregate query")
+        parser.add_argument("--report", help="Write the discrepancies to this CSV file instead of stdout")
+        parser.add_argument("--repair", action="store_true",
+                            help="Reset mismatched balances to what the ledger says")
+
+    def handle(self, *args, **options):
+        report = open(options["report"], "w", newline="") if options["report"] else None
+        writer = csv.writer(report) if report else None
+        if writer:
+            writer.writerow(REPORT_FIELDS)
+        checked = rows = found = fixed = 0
+        began = time.perf_counter()
+        try:
+            for range_checked, range_rows, discrepancies in check(options["workers"], options["range_size"]):
+                checked += range_checked
+                rows += range_rows
+                found += len(discrepancies)
+                for user_id, balance, expected, ledger_rows in discrepancies:
+                    if writer:
+                        writer.writerow((user_id, balance, expected, expected - balance, ledger_rows))
+                    else:
+                        self.stdout.write(
+                            f"user {user_id}: balance {balance}, ledger says {expected} ({ledger_rows} row(s))"
+                        )
+                if options["repair"] and discrepancies:
+                    fixed += repair(discrepancies)
+        finally:
+            if report:
+                report.close()
+        elapsed = time.perf_counter() - began
+        self.stdout.write(
+            f"Checked {checked} balance(s) against {rows} ledger row(s) in {elapsed:.1f}s "
+            f"({rows / elapsed if elapsed else 0:,.0f} rows/s); {found} discrepancy(ies)"
+            + (f", {fixed} repaired." if options["repair"] else ".")
+        )
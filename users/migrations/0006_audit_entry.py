@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-19 09:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('action', models.CharField(choices=[('login', 'Login'), ('login_failed', 'Failed login'), ('recaptcha_failed', 'Failed reCAPTCHA'), ('top_up', 'Balance top-up'), ('invite', 'Group invite'), ('join_vote', 'Join request vote'), ('transfer', 'Funds transfer'), ('settlement', 'Netted settlement')], max_length=32)),
+                ('ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('target', models.CharField(blank=True, default='', max_length=100)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('user', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at'], name='audit_user_created_idx'), models.Index(fields=['action', '-created_at'], name='audit_action_created_idx')],
+            },
+        ),
+    ]
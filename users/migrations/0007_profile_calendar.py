@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:38
+
+import users.models
+from django.db import migrations, models
+
+
+def give_each_profile_a_key(apps, schema_editor):
+    # AddField gave every existing row the same default key
+    using = schema_editor.connection.alias
+    Profile = apps.get_model('users', 'Profile')
+    profiles = list(Profile.objects.using(using).only('id'))
+    for profile in profiles:
+        profile.calendar_key = users.models.new_calendar_key()
+    Profile.objects.using(using).bulk_update(profiles, ['calendar_key'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0006_audit_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='calendar_key',
+            field=models.CharField(default=users.models.new_calendar_key, editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='calendar_version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(give_each_profile_a_key, migrations.RunPython.noop),
+    ]
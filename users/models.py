@@ -1,3 +1,5 @@
+import secrets
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
@@ -11,11 +13,18 @@ def ensure_profile(sender, instance: User, created, **kwargs):
         profile.nickname = _unique_nickname(default_base)
         profile.save(update_fields=["nickname"])
 
+def new_calendar_key():
+    return secrets.token_urlsafe(12)
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
     nickname = models.CharField(max_length=30, unique=True)
     max_spend = models.DecimalField(max_digits=10, decimal_places=2, default=100.00)  # Max spend for each event
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=100.00)  # User's current balance
+    # in the user's calendar feed URLs; a new key revokes the old URLs (see chipin.ical)
+    calendar_key = models.CharField(max_length=32, default=new_calendar_key, editable=False)
+    calendar_version = models.BigIntegerField(default=0, editable=False)  # moved when any of their feeds changes
 
     def save(self, *args, **kwargs):
         self.clean()
@@ -41,5 +50,43 @@ class Transaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     description = models.CharField(max_length=255, blank=True, default="")
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='transaction_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - ${self.amount}"
+
+
+class AuditEntry(models.Model):
+    """One security-relevant or money-moving action, written by users.audit."""
+
+    class Action(models.TextChoices):
+        LOGIN = "login", "Login"
+        LOGIN_FAILED = "login_failed", "Failed login"
+        RECAPTCHA_FAILED = "recaptcha_failed", "Failed reCAPTCHA"
+        TOP_UP = "top_up", "Balance top-up"
+        INVITE = "invite", "Group invite"
+        JOIN_VOTE = "join_vote", "Join request vote"
+        TRANSFER = "transfer", "Funds transfer"
+        SETTLEMENT = "settlement", "Netted settlement"
+
+    # when the action happened, not when the row was written
+    created_at = models.DateTimeField()
+    action = models.CharField(max_length=32, choices=Action.choices)
+    # no constraint, so the trail outlives the accounts it mentions
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.DO_NOTHING,
+                             db_constraint=False, related_name="+")
+    ip = models.GenericIPAddressField(null=True, blank=True)
+    target = models.CharField(max_length=100, blank=True, default="")
+    data = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='audit_user_created_idx'),
+            models.Index(fields=['action', '-created_at'], name='audit_action_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.created_at:%Y-%m-%d %H:%M:%S} {self.action} {self.target}"
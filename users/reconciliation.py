@@ -0,0 +1,117 @@
+"""
+Ledger reconciliation.
+
+Every profile starts at the Profile.balance default and every later change
+(top-ups, event contributions and payouts, netted settlements) writes a
+Transaction row in the same database transaction, so a balance should
+always equal the opening amount plus the sum of that user's ledger. check()
+verifies this a range of user ids at a time: each range is one aggregate
+query in integer cents, ranges are spread over a pool of worker processes,
+and only the mismatches come back, so memory is bounded by the range size
+however long the ledger gets.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from django.db import connection, connections, transaction
+from django.db.models import F, Max, Min, Sum
+from django.db.models.functions import Round
+
+from .backends import invalidate_users
+from .models import Profile, Transaction
+
+# the balance every profile is created with
+OPENING_BALANCE = Decimal(str(Profile._meta.get_field("balance").default))
+# user ids per range, i.e. per aggregate query
+RANGE_SIZE = 20_000
+CENT = Decimal("0.01")
+
+
+def id_ranges(range_size=RANGE_SIZE):
+    """Half-open [start, end) user id ranges covering every profile."""
+    bounds = Profile.objects.aggregate(low=Min("user_id"), high=Max("user_id"))
+    if bounds["low"] is None:
+        return []
+    return [(start, start + range_size) for start in range(bounds["low"], bounds["high"] + 1, range_size)]
+
+
+def check_range(start, end):
+    """Compare balances with the ledger for users start <= id < end.
+
+    Returns (profiles checked, ledger rows summed, discrepancies) where each
+    discrepancy is (user id, balance, expected balance, ledger rows).
+    """
+    qn = connection.ops.quote_name
+    profiles, ledger = Profile._meta.db_table, Transaction._meta.db_table
+    # amounts are summed as integer cents so no float rounding creeps in
+    sql = (
+        f"SELECT p.{qn('user_id')}, CAST(ROUND(p.{qn('balance')} * 100) AS BIGINT), "
+        f"COALESCE(t.cents, 0), COALESCE(t.n, 0) "
+        f"FROM {qn(profiles)} p LEFT JOIN ("
+        f"SELECT {qn('user_id')}, SUM(CAST(ROUND({qn('amount')} * 100) AS BIGINT)) AS cents, COUNT(*) AS n "
+        f"FROM {qn(ledger)} WHERE {qn('user_id')} >= %s AND {qn('user_id')} < %s GROUP BY {qn('user_id')}"
+        f") t ON t.{qn('user_id')} = p.{qn('user_id')} "
+        f"WHERE p.{qn('user_id')} >= %s AND p.{qn('user_id')} < %s"
+    )
+    opening = int(OPENING_BALANCE * 100)
+    checked = rows = 0
+    discrepancies = []
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [start, end, start, end])
+        while batch := cursor.fetchmany(2000):
+            for user_id, balance, cents, count in batch:
+                checked += 1
+                rows += count
+                if balance != opening + cents:
+                    discrepancies.append((user_id, Decimal(balance) * CENT, Decimal(opening + cents) * CENT, count))
+    return checked, rows, discrepancies
+
+
+def check(workers=None, range_size=RANGE_SIZE):
+    """Yield check_range() results for every range, in order, across a process pool.
+
+    workers=1 checks in this process. Results are yielded as soon as the
+    range (and every range before it) is done.
+    """
+    ranges = id_ranges(range_size)
+    workers = min(workers or os.cpu_count() or 1, len(ranges) or 1)
+    if workers == 1:
+        for start, end in ranges:
+            yield check_range(start, end)
+        return
+    # workers are forked; close ours first so each opens its own connection
+    connections.close_all()
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("fork")) as pool:
+        yield from pool.map(check_range, *zip(*ranges))
+
+
+def repair(discrepancies):
+    """Set each mismatched balance to the opening amount plus its ledger; returns the number fixed.
+
+    The ledger is treated as the source of truth and, as in check_range(),
+    summed in whole cents. A balance that moved since it was checked is left
+    alone for the next run to look at: the UPDATE only matches while the
+    balance still rounds to the cents that were reported (balances written
+    before shares were rounded to cents carry fractions of a cent), and the
+    ledger is re-summed in the same transaction.
+    """
+    fixed = []
+    for user_id, balance, _, _ in discrepancies:
+        with transaction.atomic():
+            cents = Transaction.objects.filter(user_id=user_id).aggregate(
+                cents=Sum(Round(F("amount") * 100))
+            )["cents"] or 0
+            expected = OPENING_BALANCE + Decimal(int(cents)) * CENT
+            updated = (
+                Profile.objects.filter(user_id=user_id)
+                .alias(cents=Round(F("balance") * 100))
+                .filter(cents=int(balance / CENT))
+                .update(balance=expected)
+            )
+            if updated:
+                fixed.append(user_id)
+    invalidate_users(fixed)
+    return len(fixed)
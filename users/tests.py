@@ -1,3 +1,369 @@
-from django.test import TestCase
+import csv
+import gzip
+import json
+import tempfile
+import threading
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from unittest import mock, skipUnless
+
+import requests
+
+try:
+    import argon2
+except ImportError:  # the Argon2 hasher test is skipped without it
+    argon2 = None
+
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.test import TestCase, override_settings
+from django.contrib.auth.hashers import check_password, get_hasher, make_password
+from django.contrib.auth.models import User
+from django.urls import reverse
+
+from ssa_project.metrics import registry
+from . import audit, hashers, reconciliation
+from .exports import keyset_rows
+from .models import AuditEntry, Profile, Transaction
+from .paginators import EstimatedCountPaginator
+from .throttle import take_token
+from .views import _hp_name
+
+
+class TransactionExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.other = User.objects.create_user(username='bob', password='pass')
+        for i in range(5):
+            Transaction.objects.create(user=self.user, amount=Decimal('1.50'), description=f'tx {i}')
+        Transaction.objects.create(user=self.other, amount=Decimal('9.00'), description='not mine')
+
+    def test_keyset_rows_walks_every_chunk(self):
+        rows = list(keyset_rows(Transaction.objects.filter(user=self.user), ('id', 'description'), chunk_size=2))
+        self.assertEqual([r[1] for r in rows], [f'tx {i}' for i in range(5)])
+
+    def test_export_csv_only_contains_own_rows(self):
+        self.client.login(username='alice', password='pass')
+        response = self.client.get(reverse('users:export_transactions'))
+        body = b''.join(response.streaming_content).decode()
+        lines = body.strip().splitlines()
+        self.assertEqual(lines[0], 'id,created_at,amount,description')
+        self.assertEqual(len(lines), 6)
+        self.assertNotIn('not mine', body)
+
+    def test_export_jsonl_gzip(self):
+        self.client.login(username='alice', password='pass')
+        response = self.client.get(reverse('users:export_transactions'), {'format': 'jsonl', 'gzip': '1'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(json.loads(lines[0])['amount'], '1.50')
+        self.assertEqual(len(lines), 5)
+
+
+@override_settings(THROTTLE_RATES={'login': {'ip': '3/min', 'username': '2/min'}})
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def _post(self, username='mallory@example.com', ip='198.51.100.1'):
+        return self.client.post(
+            reverse('users:login'),
+            {'username': username, 'password': 'x', 'elapsed': '3'},
+            REMOTE_ADDR=ip,
+        )
+
+    def test_token_bucket_refills_over_time(self):
+        self.assertTrue(take_token('t', 'ip', 'a', '1/min', now=0)[0])
+        allowed, wait = take_token('t', 'ip', 'a', '1/min', now=1)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 59)
+        self.assertTrue(take_token('t', 'ip', 'a', '1/min', now=61)[0])
+
+    def test_username_bucket_rejects_before_recaptcha(self):
+        with mock.patch('users.views.requests.post') as recaptcha:
+            recaptcha.return_value.json.return_value = {'success': False}
+            self.assertEqual(self._post(ip='198.51.100.1').status_code, 302)
+            self.assertEqual(self._post(ip='198.51.100.2').status_code, 302)
+            response = self._post(ip='198.51.100.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(recaptcha.call_count, 2)
+
+    @mock.patch('users.views.requests.post', side_effect=requests.RequestException)
+    def test_ip_bucket_covers_many_usernames(self, _recaptcha):
+        for i in range(3):
+            self.assertEqual(self._post(username=f'u{i}@example.com').status_code, 302)
+        self.assertEqual(self._post(username='u9@example.com').status_code, 429)
+        # GETs are never throttled
+        self.assertEqual(self.client.get(reverse('users:login'), REMOTE_ADDR='198.51.100.1').status_code, 200)
+
+
+class StatelessLoginPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_get_writes_nothing(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('users:login'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(response.context['hp_name'], _hp_name(response.context['hp_nonce']))
+
+    def test_filled_honeypot_is_rejected(self):
+        form = self.client.get(reverse('users:login')).context
+        with mock.patch('users.views.requests.post') as recaptcha:
+            self.client.post(reverse('users:login'), {
+                'hp_nonce': form['hp_nonce'], form['hp_name']: 'gotcha', 'elapsed': '3',
+            })
+        recaptcha.assert_not_called()
+
+    def test_prune_sessions_deletes_expired_in_batches(self):
+        past = timezone.now() - timedelta(days=1)
+        for i in range(5):
+            Session.objects.create(session_key=f'old{i}', session_data='', expire_date=past)
+        Session.objects.create(session_key='fresh', session_data='', expire_date=timezone.now() + timedelta(days=1))
+        call_command('prune_sessions', batch_size=2, stdout=mock.MagicMock())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['fresh'])
+
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', password='pass')
+        self.client.login(username='alice', password='pass')
+
+    def _user_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        tables = ('"auth_user"', '"users_profile"', '"django_session"')
+        return response, [q['sql'] for q in ctx.captured_queries if any(t in q['sql'] for t in tables)]
+
+    def test_session_user_and_profile_come_from_the_cache(self):
+        url = reverse('users:top_up')
+        _, first = self._user_queries(url)
+        self.assertEqual(len(first), 1)
+        self.assertIn('JOIN "users_profile"', first[0])
+        response, second = self._user_queries(url)
+        self.assertEqual(second, [])
+        self.assertContains(response, 'Your current balance is: $100.00')
+
+    def test_profile_changes_invalidate_the_cached_user(self):
+        url = reverse('users:top_up')
+        self.client.get(url)
+        profile = self.user.profile
+        profile.balance = Decimal('7.00')
+        profile.save()
+        self.assertContains(self.client.get(url), 'Your current balance is: $7.00')
+        self.client.post(url, {'amount': '5.00'})
+        self.assertContains(self.client.get(url), 'Your current balance is: $12.00')
+
+
+class LedgerReconciliationTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'u{i}', password='pass') for i in range(5)]
+        self.client.login(username='u0', password='pass')
+        self.client.post(reverse('users:top_up'), {'amount': '25.50'})
+        Transaction.objects.create(user=self.users[1], amount=Decimal('-0.10'))
+        Profile.objects.filter(user=self.users[1]).update(balance=Decimal('99.90'))
+
+    def _check(self, range_size=2):
+        results = list(reconciliation.check(workers=1, range_size=range_size))
+        return sum(r[0] for r in results), sum(r[1] for r in results), [d for r in results for d in r[2]]
+
+    def test_consistent_ledger_has_no_discrepancies(self):
+        self.assertEqual(self._check(), (5, 2, []))
+
+    def test_reports_and_repairs_a_drifted_balance(self):
+        Profile.objects.filter(user=self.users[3]).update(balance=Decimal('80.00'))
+        checked, _, found = self._check()
+        self.assertEqual(found, [(self.users[3].id, Decimal('80.00'), Decimal('100.00'), 0)])
+        self.assertEqual(reconciliation.repair(found), 1)
+        self.assertEqual(Profile.objects.get(user=self.users[3]).balance, Decimal('100.00'))
+        self.assertEqual(self._check()[2], [])
+
+    def test_repair_skips_a_balance_that_moved_since_the_check(self):
+        Profile.objects.filter(user=self.users[3]).update(balance=Decimal('80.00'))
+        found = self._check()[2]
+        Profile.objects.filter(user=self.users[3]).update(balance=Decimal('81.00'))
+        self.assertEqual(reconciliation.repair(found), 0)
+        self.assertEqual(Profile.objects.get(user=self.users[3]).balance, Decimal('81.00'))
+
+    def test_command_writes_a_csv_report(self):
+        Profile.objects.filter(user=self.users[2]).update(balance=Decimal('100.01'))
+        with tempfile.NamedTemporaryFile('r', suffix='.csv') as report:
+            call_command('reconcile_ledger', workers=1, report=report.name, stdout=StringIO())
+            rows = list(csv.reader(report))
+        self.assertEqual(rows, [
+            ['user_id', 'balance', 'expected', 'difference', 'ledger_rows'],
+            [str(self.users[2].id), '100.01', '100.00', '-0.01', '0'],
+        ])
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def _count(self):
+        return EstimatedCountPaginator(Transaction.objects.all(), 20).count
+
+    def test_counts_exactly_until_analyzed(self):
+        user = User.objects.create_user(username='u', password='pass')
+        Transaction.objects.create(user=user, amount=Decimal('1.00'))
+        # ids from a shard's range say nothing about how many rows there are
+        Transaction.objects.create(id=10 ** 12, user=user, amount=Decimal('1.00'))
+        self.assertEqual(self._count(), 2)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+            cursor.execute('UPDATE sqlite_stat1 SET stat = %s WHERE tbl = %s', ['50000 1', Transaction._meta.db_table])
+        self.assertEqual(self._count(), 50000)
+
+
+class AuditLogTests(TestCase):
+    def setUp(self):
+        # entries queued by earlier tests
+        audit.flush()
+        AuditEntry.objects.all().delete()
+        registry.reset()
+        cache.clear()
+        self.user = User.objects.create_user(username='alice@example.com', password='pass')
+
+    def _login(self, password):
+        with mock.patch('users.views.requests.post') as recaptcha:
+            recaptcha.return_value.json.return_value = {'success': True}
+            return self.client.post(
+                reverse('users:login'),
+                {'username': 'alice@example.com', 'password': password, 'elapsed': '3'},
+                REMOTE_ADDR='198.51.100.7',
+            )
+
+    def test_logins_and_top_ups_are_written_on_flush(self):
+        self._login('wrong')
+        self._login('pass')
+        self.client.post(reverse('users:top_up'), {'amount': '25.00'})
+        # queued, not written, while the request ran
+        self.assertFalse(AuditEntry.objects.exists())
+        self.assertTrue(audit.flush())
+        entries = list(AuditEntry.objects.order_by('id'))
+        self.assertEqual([e.action for e in entries], [
+            AuditEntry.Action.LOGIN_FAILED, AuditEntry.Action.LOGIN, AuditEntry.Action.TOP_UP,
+        ])
+        self.assertEqual(entries[0].target, 'alice@example.com')
+        self.assertIsNone(entries[0].user_id)
+        self.assertEqual((entries[1].user_id, entries[1].ip), (self.user.id, '198.51.100.7'))
+        self.assertEqual(entries[2].data, {'amount': '25.00'})
+
+    def test_full_queue_drops_and_reports_its_depth(self):
+        log = audit.AuditLog()
+        with override_settings(AUDIT_LOG={'QUEUE_SIZE': 2}), self.assertLogs('users.audit', 'WARNING'):
+            results = [log.record(audit.Action.LOGIN, user=self.user) for _ in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(log.depth(), 2)
+        self.assertEqual(registry.snapshot()['chipin_audit_dropped_total'], {('queue_full',): 1})
+        audit.record(audit.Action.TOP_UP, user=self.user)
+        self.assertEqual(registry.snapshot()['chipin_audit_queue_depth'], {(): 1})
+        self.assertTrue(log.flush())
+        self.assertEqual(AuditEntry.objects.count(), 2)
+
+    def test_jsonl_sink_is_written_by_the_background_thread(self):
+        log = audit.AuditLog()
+        with tempfile.NamedTemporaryFile('r', suffix='.jsonl') as f:
+            with override_settings(AUDIT_LOG={'SINK': 'jsonl', 'PATH': f.name, 'FLUSH_INTERVAL': 0.01}):
+                for i in range(3):
+                    log.record(audit.Action.INVITE, user=self.user, target=f'group:{i}', invited=i)
+                self.assertTrue(log.flush())
+            lines = [json.loads(line) for line in f]
+        self.assertIsNotNone(log._thread)
+        self.assertEqual([line['target'] for line in lines], ['group:0', 'group:1', 'group:2'])
+        self.assertEqual(lines[0]['data'], {'invited': 0})
+
+
+class PasswordHashingPoolTests(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def _hold_worker(self):
+        # occupies the only worker until the returned event is set
+        release, running = threading.Event(), threading.Event()
+
+        def block():
+            running.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=hashers.pool.run, args=(block,))
+        thread.start()
+        running.wait(5)
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        return release
+
+    def test_hashes_run_on_the_pool_and_stay_compatible(self):
+        hasher = get_hasher('pbkdf2_sha256')
+        self.assertIsInstance(hasher, hashers.PooledPBKDF2PasswordHasher)
+        names = []
+        hashers.pool.run(lambda: names.append(threading.current_thread().name))
+        self.assertTrue(names[0].startswith('password-hasher'))
+        encoded = make_password('correct horse')
+        self.assertTrue(encoded.startswith('pbkdf2_sha256$'))
+        self.assertTrue(check_password('correct horse', encoded))
+        self.assertFalse(check_password('wrong', encoded))
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 1, 'QUEUE_SIZE': 0, 'QUEUE_TIMEOUT': 1.0})
+    def test_full_queue_is_refused_at_once(self):
+        self._hold_worker()
+        with self.assertRaises(hashers.HashingBusy):
+            hashers.pool.run(make_password, 'x')
+        self.assertEqual(registry.snapshot()['chipin_password_hashing_rejected_total'], {('queue_full',): 1})
+        self.assertEqual(registry.snapshot()['chipin_password_hashing_in_flight'], {(): 1})
+
+    @override_settings(PASSWORD_HASHING={'WORKERS': 1, 'QUEUE_SIZE': 4, 'QUEUE_TIMEOUT': 0.05})
+    def test_waiting_past_the_timeout_is_refused(self):
+        release = self._hold_worker()
+        with self.assertRaises(hashers.HashingBusy):
+            hashers.pool.run(make_password, 'x')
+        self.assertEqual(registry.snapshot()['chipin_password_hashing_rejected_total'], {('timeout',): 1})
+        release.set()
+        self.assertTrue(hashers.pool.run(make_password, 'x').startswith('pbkdf2_sha256$'))
+
+    def test_login_and_registration_answer_503_when_busy(self):
+        cache.clear()
+        with mock.patch.object(hashers.pool, 'run', side_effect=hashers.HashingBusy), \
+                mock.patch('users.views.requests.post') as recaptcha:
+            recaptcha.return_value.json.return_value = {'success': True}
+            response = self.client.post(reverse('users:login'),
+                                        {'username': 'a@example.com', 'password': 'x', 'elapsed': '3'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '3')
+            response = self.client.post(reverse('users:register'), {
+                'email': 'new@example.com', 'password1': 'Very-long-pass-42', 'password2': 'Very-long-pass-42',
+                'first_name': 'N', 'surname': 'U', 'nickname': 'newbie',
+            })
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(User.objects.filter(username='new@example.com').exists())
+
+    def test_other_hashing_views_answer_503_when_busy(self):
+        staff = User.objects.create_superuser('root@example.com', 'root@example.com', 'Very-long-pass-42')
+        with mock.patch.object(hashers.pool, 'run', side_effect=hashers.HashingBusy):
+            response = self.client.post(reverse('admin:login'),
+                                        {'username': 'root@example.com', 'password': 'Very-long-pass-42'})
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '3')
+            self.client.force_login(staff)
+            response = self.client.post(reverse('admin:password_change'), {
+                'old_password': 'Very-long-pass-42',
+                'new_password1': 'Another-long-pass-7', 'new_password2': 'Another-long-pass-7',
+            })
+        self.assertEqual(response.status_code, 503)
+        staff.refresh_from_db()
+        self.assertTrue(staff.check_password('Very-long-pass-42'))
+
+    @skipUnless(argon2, "needs argon2-cffi")
+    def test_argon2_hasher_is_tuned_and_pooled(self):
+        with override_settings(PASSWORD_HASHERS=['users.hashers.PooledArgon2PasswordHasher']):
+            encoded = make_password('correct horse')
+            self.assertTrue(encoded.startswith('argon2$argon2id$v=19$m=19456,t=2,p=1$'))
+            self.assertTrue(check_password('correct horse', encoded))
@@ -0,0 +1,73 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import render
+
+# guards the read-modify-write of a bucket within this process; buckets in a
+# shared cache (memcached/redis) are best effort across processes
+_lock = threading.Lock()
+
+_PERIODS = {"s": 1, "sec": 1, "m": 60, "min": 60, "h": 3600, "hour": 3600}
+
+
+def parse_rate(rate):
+    """Turn "5/min" into (capacity, seconds per refill of the whole bucket)."""
+    count, _, period = rate.partition("/")
+    return int(count), _PERIODS[period]
+
+
+def _cache():
+    return caches[getattr(settings, "THROTTLE_CACHE_ALIAS", "default")]
+
+
+def take_token(scope, kind, ident, rate, now=None):
+    """Token bucket: returns (allowed, seconds until the next token)."""
+    capacity, period = parse_rate(rate)
+    refill = capacity / period
+    now = time.time() if now is None else now
+    digest = hashlib.sha256(str(ident).encode()).hexdigest()[:32]
+    key = f"throttle:{scope}:{kind}:{digest}"
+    cache = _cache()
+    with _lock:
+        tokens, stamp = cache.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - stamp) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        cache.set(key, (tokens, now), timeout=period * 2)
+    return allowed, 0 if allowed else (1 - tokens) / refill
+
+
+def _identities(request, username_field):
+    yield "ip", request.META.get("REMOTE_ADDR", "")
+    username = (request.POST.get(username_field) or "").strip().lower()
+    if username:
+        yield "username", username
+
+
+def throttle(scope, username_field="username"):
+    """Reject POSTs over THROTTLE_RATES[scope] before the view does any work.
+
+    Each configured key (per IP, per submitted username) has its own bucket;
+    the request is refused if any of them is empty.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rates = getattr(settings, "THROTTLE_RATES", {}).get(scope)
+            if request.method == "POST" and rates:
+                for kind, ident in _identities(request, username_field):
+                    if kind not in rates:
+                        continue
+                    allowed, wait = take_token(scope, kind, ident, rates[kind])
+                    if not allowed:
+                        response = render(request, "users/throttled.html", status=429)
+                        response["Retry-After"] = str(int(wait) + 1)
+                        return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -6,4 +6,5 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('register/', views.register, name='register'),
     path('top-up/', views.top_up_balance, name='top_up'),
+    path('transactions/export/', views.export_transactions, name='export_transactions'),
 ]
\ No newline at end of file
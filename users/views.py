@@ -5,24 +5,30 @@ from django.contrib.auth import authenticate, login, logout
 from django.shortcuts import render, redirect
 from django.http import HttpResponseRedirect
 from django.urls import reverse
+from django.utils.crypto import salted_hmac
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import F
+from . import audit
+from .backends import invalidate_users
 from .forms import UserRegistrationForm, EmailAuthenticationForm, TopUpForm
-from .models import Transaction
+from .models import Profile, Transaction
+from .exports import streaming_export_response, TRANSACTION_EXPORT_FIELDS
+from .throttle import throttle
+from ssa_project.metrics import RECAPTCHA_LATENCY, RECAPTCHA_FAILURES
 
 RECAPTCHA_VERIFY_URL = "https://www.google.com/recaptcha/api/siteverify"
 
-def _hp_name(request):
-    # stable per-session honeypot name to defeat autofill/scripts
-    if "hp_name" not in request.session:
-        request.session["hp_name"] = f"hp_{secrets.token_hex(8)}"
-    return request.session["hp_name"]
+def _hp_name(nonce):
+    # honeypot name derived from a per-render nonce, so nothing is kept in the session
+    return f"hp_{salted_hmac('users.honeypot', nonce).hexdigest()[:16]}"
 
+@throttle("login")
 def login_view(request):
-    hp_name = _hp_name(request)
-
     if request.method == "POST":
         # 1) Honeypot (cheap check first)
+        hp_name = _hp_name(request.POST.get("hp_nonce", ""))
         if request.POST.get(hp_name):
             messages.error(request, "Bot detected.")
             return redirect("users:login")
@@ -44,12 +50,21 @@ def login_view(request):
             "remoteip": request.META.get("REMOTE_ADDR"),
         }
         try:
-            resp = requests.post(RECAPTCHA_VERIFY_URL, data=data, timeout=3.0)
+            verify_url = getattr(settings, "RECAPTCHA_VERIFY_URL", RECAPTCHA_VERIFY_URL)
+            with RECAPTCHA_LATENCY.time():
+                resp = requests.post(verify_url, data=data, timeout=3.0)
             result = resp.json()
         except requests.RequestException:
+            RECAPTCHA_FAILURES.inc(reason="error")
             result = {"success": False}
+        else:
+            if not result.get("success"):
+                RECAPTCHA_FAILURES.inc(reason="rejected")
 
         if not result.get("success"):
+            audit.record(audit.Action.RECAPTCHA_FAILED, request=request,
+                         target=(request.POST.get("username") or "").strip().lower(),
+                         errors=result.get("error-codes", []))
             messages.error(request, "reCAPTCHA validation failed. Please try again.")
             return redirect("users:login")
 
@@ -59,18 +74,22 @@ def login_view(request):
         user = authenticate(request, username=username, password=password)
         if user is not None:
             login(request, user)
-            # rotate honeypot name after each successful POST
-            request.session["hp_name"] = f"hp_{secrets.token_hex(8)}"
+            audit.record(audit.Action.LOGIN, user=user, request=request, target=f"user:{user.pk}")
             next_url = request.GET.get("next", reverse("chipin:home"))
             return redirect(next_url)
         else:
+            audit.record(audit.Action.LOGIN_FAILED, request=request, target=username)
             messages.error(request, "Invalid username or password.")
             return redirect("users:login")
 
-    # GET: render with the current hp_name
+    # GET: render with a fresh nonce and its honeypot name
+    hp_nonce = secrets.token_hex(8)
     next_url = request.GET.get("next", "")
-    return render(request, "users/login.html", {"hp_name": hp_name, "next": next_url})
+    return render(request, "users/login.html", {
+        "hp_name": _hp_name(hp_nonce), "hp_nonce": hp_nonce, "next": next_url,
+    })
 
+@throttle("register", username_field="email")
 def register(request):
     if request.method == "POST":
         form = UserRegistrationForm(request.POST)
@@ -97,12 +116,14 @@ def top_up_balance(request):
         form = TopUpForm(request.POST)
         if form.is_valid():
             amount = form.cleaned_data['amount']
-            # update the user's profile balance
-            profile = request.user.profile
-            profile.balance += amount
-            profile.save()
-            # create a transaction record
-            Transaction.objects.create(user=request.user, amount=amount)
+            with transaction.atomic():
+                # update the balance in SQL; request.user.profile may come from the cache
+                Profile.objects.filter(user=request.user).update(balance=F('balance') + amount)
+                # create a transaction record
+                Transaction.objects.create(user=request.user, amount=amount)
+            invalidate_users([request.user.id])
+            audit.record(audit.Action.TOP_UP, user=request.user, request=request,
+                         target=f"user:{request.user.id}", amount=str(amount))
             # show success message
             messages.success(request, f"Your balance has been topped up by ${amount}.")
             # redirect to home page
@@ -110,4 +131,17 @@ def top_up_balance(request):
     else:
         form = TopUpForm()
     balance = request.user.profile.balance
-    return render(request, 'users/top_up.html', {'form': form, 'balance': balance}) 
\ No newline at end of file
+    return render(request, 'users/top_up.html', {'form': form, 'balance': balance})
+
+@login_required(login_url='users:login')
+def export_transactions(request):
+    # staff (auditors) may export another user's ledger with ?user=<id>
+    user_id = request.GET.get("user")
+    if user_id and user_id.isdigit() and request.user.is_staff:
+        transactions = Transaction.objects.filter(user_id=user_id)
+    else:
+        user_id = request.user.id
+        transactions = Transaction.objects.filter(user=request.user)
+    return streaming_export_response(
+        request, transactions, TRANSACTION_EXPORT_FIELDS, f"transactions-{user_id}"
+    )